@@ -6,7 +6,7 @@ from .diagnostics.contour import Contour, ContourF, ContourT
 from .diagnostics.eof import compute_eofs, compute_hilbert_eofs
 from .diagnostics.gridded_stratification import GriddedStratification
 from .diagnostics.climatology import Climatology
-from ._utils import logging_util, general_utils, plot_util, crps_util, seasons
+from ._utils import logging_util, general_utils, plot_util, crps_util, seasons, spatial_index, obs_cache, domain_cache
 
 # from .diagnostics.annual_hydrographic_climatology import Annual_Climatology
 from .data.index import Indexed
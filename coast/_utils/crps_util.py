@@ -1,15 +1,34 @@
 """
 Python definitions used to aid in the calculation of Continuous Ranked
 Probability Score.
+
+Neighbourhood CRPS is computed for batches of observations: neighbourhoods
+come from a radius query on a cached spatial index, model values for a
+block of observations are gathered in one indexing operation (with time
+weights found up front) and CRPS is evaluated for all neighbourhoods at
+once from their sorted samples.
+
 *Methods Overview*
+    -> crps_empirical_batch(): CRPS of many observations against rows of a sample matrix
+    -> crps_empirical_ragged(): CRPS of many observations against samples of any size
+    -> neighbourhood_indices(): Flat grid indices of points within a radius
+    -> crps_sonf_batch(): Single obs neighbourhood forecast CRPS for many obs
+    -> crps_sonf_stations(): Same as above for time series at many fixed locations
     -> crps_sonf_fixed(): Single obs neighbourhood forecast CRPS for fixed obs
     -> crps_song_moving(): Same as above for moving obs
 """
 
+from concurrent.futures import ProcessPoolExecutor
 from typing import Union, Tuple
 import numpy as np
 import xarray as xr
-from . import general_utils
+import dask.array as da
+from . import general_utils, spatial_index
+
+# Observations whose model values are gathered together
+_block_size = 5000
+# Earth radius (km), as in general_utils.calculate_haversine_distance()
+_earth_radius = 6371.007176
 
 
 def crps_empirical(sample: np.ndarray, obs: float) -> Union[np.ndarray, float]:
@@ -137,6 +156,349 @@ def crps_empirical_loop(sample: np.ndarray, obs: float) -> float:
     return crps_integral
 
 
+def crps_empirical_batch(sample, obs, chunk_size: int = None):
+    """Calculates CRPS for many observations, each against one row of a sample matrix.
+
+    Rows may be ensemble forecasts or model neighbourhoods, padded with NaNs
+    where they have fewer members. Each row is sorted and the CRPS integral of
+    its empirical distribution (as calculated by crps_empirical_loop) is
+    evaluated in closed form (see crps_empirical_ragged()).
+
+    Args:
+        sample (array): (n_obs, n_members) array of sample values. NaNs are ignored.
+            May be a numpy, dask or xarray array.
+        obs (array): Observations, one per row of sample (or a single value for all rows).
+        chunk_size (int): If given, rows are processed in dask chunks of this size
+            and a (lazy) dask array is returned. Dask (or dask backed xarray)
+            inputs are always processed lazily, in their existing row chunks.
+    Returns:
+        np.ndarray: CRPS for each observation (a dask array if chunked). NaN where
+            the observation is NaN or its row has no values.
+    """
+    if isinstance(sample, xr.DataArray):
+        sample = sample.data
+    if isinstance(obs, xr.DataArray):
+        obs = obs.data
+
+    if chunk_size is not None or isinstance(sample, da.Array) or isinstance(obs, da.Array):
+        sample = da.asarray(sample)
+        row_chunks = sample.chunks[0] if chunk_size is None else chunk_size
+        sample = sample.rechunk((row_chunks, -1)).astype(float)
+        obs = da.broadcast_to(da.asarray(obs, dtype=float), (sample.shape[0],)).rechunk((sample.chunks[0],))
+        return da.map_blocks(_crps_padded_rows, sample, obs[:, None], drop_axis=1, dtype=float)
+
+    sample = np.atleast_2d(np.asarray(sample, dtype=float))
+    obs = np.broadcast_to(np.asarray(obs, dtype=float), (sample.shape[0],))
+    crps = np.empty(sample.shape[0])
+    for start in range(0, sample.shape[0], _block_size):
+        crps[start : start + _block_size] = _crps_padded(
+            sample[start : start + _block_size], obs[start : start + _block_size]
+        )
+    return crps
+
+
+def crps_empirical_ragged(values: np.ndarray, offsets: np.ndarray, obs: np.ndarray) -> np.ndarray:
+    """Calculates CRPS for many observations, each against its own sample of values.
+
+    The samples are stored one after another in values, with the sample of
+    observation ii in values[offsets[ii]:offsets[ii + 1]]. NaNs in samples are
+    ignored. The CRPS integral of each empirical distribution (as calculated
+    by crps_empirical_loop) is evaluated in closed form from the sorted
+    sample x_1 <= ... <= x_n:
+
+        CRPS = sum(|x_i - obs|) / n - sum((2i - n - 1) x_i) / n**2
+
+    Samples are sorted as rows of a NaN padded array, a block of observations
+    at a time, so there is no loop over individual observations.
+
+    Args:
+        values (np.ndarray): 1D array of all samples, concatenated.
+        offsets (np.ndarray): Start index of each sample in values, followed by len(values).
+        obs (np.ndarray): One observation per sample.
+    Returns:
+        np.ndarray: CRPS for each observation. NaN where the observation is NaN
+            or its sample has no values.
+    """
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets)
+    obs = np.asarray(obs, dtype=float)
+    n_obs = len(offsets) - 1
+    lengths = np.diff(offsets)
+    crps = np.full(n_obs, np.nan)
+
+    # Samples are copied into NaN padded rows, which are quicker to sort than
+    # a ragged array. Blocks of rows keep the padded array small.
+    for start in range(0, n_obs, _block_size):
+        end = min(start + _block_size, n_obs)
+        block_lengths = lengths[start:end]
+        if len(block_lengths) == 0 or block_lengths.max() == 0:
+            continue
+        rows = np.repeat(np.arange(end - start), block_lengths)
+        block_values = values[offsets[start] : offsets[end]]
+        columns = np.arange(len(block_values)) - np.repeat(offsets[start:end] - offsets[start], block_lengths)
+        sample = np.full((end - start, block_lengths.max()), np.nan)
+        sample[rows, columns] = block_values
+        crps[start:end] = _crps_padded(sample, obs[start:end])
+    return crps
+
+
+def _crps_padded_rows(sample: np.ndarray, obs: np.ndarray) -> np.ndarray:
+    """_crps_padded() for a block of a dask array, with obs as an (n_obs, 1) column."""
+    return _crps_padded(sample, obs[:, 0])
+
+
+def _crps_padded(sample: np.ndarray, obs: np.ndarray) -> np.ndarray:
+    """CRPS (as crps_empirical_ragged()) for each row of a NaN padded (n_obs, n_sample) array."""
+    # Differences from the observation keep precision for samples far from zero.
+    # NaNs sort to the end of each row.
+    diff = np.sort(sample - obs[:, None], axis=1)
+    valid = ~np.isnan(diff)
+    n_sample = np.sum(valid, axis=1)
+    rank = np.arange(1, diff.shape[1] + 1)
+    diff = np.where(valid, diff, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_abs = np.sum(np.abs(diff), axis=1) / n_sample
+        spread = np.sum((2 * rank - n_sample[:, None] - 1) * diff, axis=1) / n_sample**2
+        crps = mean_abs - spread
+    return np.where((n_sample > 0) & ~np.isnan(obs), crps, np.nan)
+
+
+def neighbourhood_indices(
+    longitude, latitude, centre_lon, centre_lat, nh_radius: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Finds the grid points within a radius of each centre, using a cached spatial index.
+
+    Args:
+        longitude (array): Grid longitudes (degrees).
+        latitude (array): Grid latitudes (degrees), same shape as longitude.
+        centre_lon (np.ndarray): Longitudes of neighbourhood centres.
+        centre_lat (np.ndarray): Latitudes of neighbourhood centres.
+        nh_radius (float): Neighbourhood radius in km.
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Flat grid indices of all neighbourhoods, concatenated,
+            and the start index of each neighbourhood followed by the total length.
+            Centres with NaN locations have empty neighbourhoods.
+    """
+    centre_lon = np.atleast_1d(np.asarray(centre_lon, dtype=float))
+    centre_lat = np.atleast_1d(np.asarray(centre_lat, dtype=float))
+    index = spatial_index.get_spatial_index(np.asarray(longitude), np.asarray(latitude))
+    finite = np.isfinite(centre_lon) & np.isfinite(centre_lat)
+    lengths = np.zeros(len(centre_lon), dtype=int)
+    flat_ind = []
+    if np.any(finite):
+        flat_ind = index.query_radius(centre_lon[finite], centre_lat[finite], nh_radius / _earth_radius)
+        lengths[finite] = [len(ind) for ind in flat_ind]
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    flat_ind = np.concatenate(flat_ind) if len(flat_ind) > 0 else np.array([], dtype=int)
+    return flat_ind.astype(int), offsets
+
+
+def _select_points(mod_array, points):
+    """Pointwise selection of flat grid indices from mod_array, along a new nh_point dimension."""
+    ind_y, ind_x = np.unravel_index(points, (mod_array.sizes["y_dim"], mod_array.sizes["x_dim"]))
+    return mod_array.isel(y_dim=xr.DataArray(ind_y, dims="nh_point"), x_dim=xr.DataArray(ind_x, dims="nh_point"))
+
+
+def _weighted_values(mod_times, pos0, pos1, weight, point_pos):
+    """
+    Combines two model times (rows pos0 and pos1 of mod_times) at columns
+    point_pos using weights from general_utils.time_matching_indices().
+    """
+    value0 = mod_times[pos0, point_pos]
+    value1 = mod_times[pos1, point_pos]
+    return np.where(pos0 == pos1, value0, value0 + weight * (value1 - value0))
+
+
+def _interpolate_points(mod_points, obs_time, time_interp):
+    """
+    Interpolates model points (t_dim, nh_point) to observation times with
+    xarray.interp(). Returns an (n_time, n_point) array.
+    """
+    # A NaN in any point spoils interpolation (e.g. cubic) of all points
+    # interpolated with it, so points with gaps are done separately
+    # and land points (NaN at all times) are left as NaN
+    mod_points = mod_points.swap_dims({"t_dim": "time"}).transpose("time", "nh_point").load()
+    is_nan = np.isnan(mod_points.values)
+    mod_interp = np.full((len(obs_time), mod_points.sizes["nh_point"]), np.nan)
+    complete = ~np.any(is_nan, axis=0)
+    gappy = np.flatnonzero(np.any(is_nan, axis=0) & ~np.all(is_nan, axis=0))
+    for point_ind in [np.flatnonzero(complete)] + [[ii] for ii in gappy]:
+        if len(point_ind) > 0:
+            mod_interp[:, point_ind] = mod_points.isel(nh_point=point_ind).interp(
+                time=obs_time, method=time_interp, kwargs={"fill_value": "extrapolate"}
+            )
+    return mod_interp
+
+
+def _gather_neighbourhoods(mod_array, flat_ind, offsets, obs_time, time_interp, block_size=_block_size):
+    """
+    Model values at the neighbourhood points of each observation, interpolated
+    to the observation times. Returns a 1D array aligned with flat_ind. Values
+    for each block of observations are read from mod_array in one operation.
+    """
+    n_obs = len(offsets) - 1
+    lengths = np.diff(offsets)
+    values = np.full(len(flat_ind), np.nan)
+
+    if time_interp in ["nearest", "linear"]:
+        ind0, ind1, weight = general_utils.time_matching_indices(mod_array.time.values, obs_time, method=time_interp)
+
+    for start in range(0, n_obs, block_size):
+        end = min(start + block_size, n_obs)
+        block = slice(offsets[start], offsets[end])
+        if block.start == block.stop:
+            continue
+        points, point_pos = np.unique(flat_ind[block], return_inverse=True)
+        obs_pos = np.repeat(np.arange(end - start), lengths[start:end])
+        mod_points = _select_points(mod_array, points)
+
+        if time_interp in ["nearest", "linear"]:
+            # Only the model times either side of observations in this block are read
+            times, time_pos = np.unique(np.concatenate((ind0[start:end], ind1[start:end])), return_inverse=True)
+            mod_times = mod_points.isel(t_dim=times).transpose("t_dim", "nh_point").values
+            pos0 = time_pos[: end - start][obs_pos]
+            pos1 = time_pos[end - start :][obs_pos]
+            values[block] = _weighted_values(mod_times, pos0, pos1, weight[start:end][obs_pos], point_pos)
+        else:
+            values[block] = _interpolate_points(mod_points, obs_time[start:end], time_interp)[obs_pos, point_pos]
+    return values
+
+
+def crps_sonf_batch(
+    mod_array: xr.DataArray,
+    obs_lon: np.ndarray,
+    obs_lat: np.ndarray,
+    obs_var: np.ndarray,
+    obs_time: np.ndarray,
+    nh_radius: float,
+    time_interp: str,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Single-observation neighbourhood forecast CRPS for many observations at once.
+
+    Neighbourhoods are found with one radius query, model values are gathered
+    in blocks of observations and CRPS is evaluated with crps_empirical_ragged().
+    Mod_array must contain dimensions x_dim, y_dim and t_dim and coordinates
+    longitude, latitude, time.
+
+    Args:
+        mod_array (xr.DataArray): DataArray from a Model Dataset.
+        obs_lon (np.ndarray): Longitudes of observations. Can be a single value for a fixed location.
+        obs_lat (np.ndarray): Latitudes of observations. Can be a single value for a fixed location.
+        obs_var (np.ndarray): of floatArray of variable values, e.g time series.
+        obs_time: (np.ndarray): of datetimeArray of times, corresponding to obs_var.
+        nh_radius (float): Neighbourhood radius in km.
+        time_interp (str): Type of time interpolation to use.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Array of CRPS values,
+            Array containing the number of model points used for each CRPS value,
+            Array of bools indicating where a model neighbourhood contained land.
+    """
+    obs_var = np.asarray(obs_var)
+    n_obs = obs_var.shape[0]
+    if np.ndim(obs_lon) == 0:
+        # A fixed location only needs one neighbourhood
+        flat_ind, offsets = neighbourhood_indices(mod_array.longitude, mod_array.latitude, obs_lon, obs_lat, nh_radius)
+        flat_ind = np.tile(flat_ind, n_obs)
+        offsets = np.arange(n_obs + 1) * offsets[-1]
+    else:
+        flat_ind, offsets = neighbourhood_indices(mod_array.longitude, mod_array.latitude, obs_lon, obs_lat, nh_radius)
+
+    values = _gather_neighbourhoods(mod_array, flat_ind, offsets, obs_time, time_interp)
+
+    # Neighbourhoods containing NaNs contain land. Those with no values are skipped.
+    group = np.repeat(np.arange(n_obs), np.diff(offsets))
+    n_nan = np.bincount(group, weights=np.isnan(values), minlength=n_obs)
+    has_values = n_nan < np.diff(offsets)
+    contains_land = n_nan > 0
+    n_model_pts = np.where(has_values, np.diff(offsets), np.nan)
+    crps_list = np.where(has_values, crps_empirical_ragged(values, offsets, obs_var), np.nan)
+
+    return crps_list, n_model_pts, contains_land
+
+
+def crps_sonf_stations(
+    mod_array: xr.DataArray,
+    obs_lon: np.ndarray,
+    obs_lat: np.ndarray,
+    obs_var: np.ndarray,
+    obs_time: np.ndarray,
+    nh_radius: float,
+    time_interp: str,
+    n_workers: int = 1,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Single-observation neighbourhood forecast CRPS for time series at many fixed locations.
+
+    All neighbourhoods are found with one radius query and the model time
+    series at every neighbourhood point are read from mod_array in one
+    operation. CRPS is then calculated for each location (optionally in
+    parallel processes) with crps_empirical_batch(). Mod_array must contain
+    dimensions x_dim, y_dim and t_dim and coordinates longitude, latitude, time.
+
+    Args:
+        mod_array (xr.DataArray): DataArray from a Model Dataset.
+        obs_lon (np.ndarray): Longitudes of the observation locations.
+        obs_lat (np.ndarray): Latitudes of the observation locations.
+        obs_var (np.ndarray): (n_location, n_time) array of variable values, e.g. time series.
+        obs_time (np.ndarray): of datetimeArray of times, corresponding to obs_var.
+        nh_radius (float): Neighbourhood radius in km.
+        time_interp (str): Type of time interpolation to use.
+        n_workers (int): Number of processes to share locations between.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: (n_location, n_time) arrays of CRPS values,
+            the number of model points used for each CRPS value and bools indicating
+            where a model neighbourhood contained land.
+    """
+    obs_var = np.atleast_2d(obs_var)
+    obs_lon = np.atleast_1d(obs_lon)
+    obs_lat = np.atleast_1d(obs_lat)
+    n_time = obs_var.shape[1]
+    flat_ind, offsets = neighbourhood_indices(mod_array.longitude, mod_array.latitude, obs_lon, obs_lat, nh_radius)
+    points, point_pos = np.unique(flat_ind, return_inverse=True)
+    mod_points = _select_points(mod_array, points)
+
+    if time_interp in ["nearest", "linear"]:
+        # Only model times either side of the observation times are read
+        ind0, ind1, weight = general_utils.time_matching_indices(mod_array.time.values, obs_time, method=time_interp)
+        times, time_pos = np.unique(np.concatenate((ind0, ind1)), return_inverse=True)
+        mod_times = mod_points.isel(t_dim=times).transpose("t_dim", "nh_point").values
+        pos0, pos1 = time_pos[:n_time], time_pos[n_time:]
+    else:
+        mod_times = _interpolate_points(mod_points, obs_time, time_interp)
+        pos0 = pos1 = np.arange(n_time)
+        weight = np.zeros(n_time)
+
+    task_args = (
+        [mod_times[:, point_pos[offsets[ii] : offsets[ii + 1]]] for ii in range(len(obs_var))],
+        [pos0] * len(obs_var),
+        [pos1] * len(obs_var),
+        [weight] * len(obs_var),
+        obs_var,
+    )
+    if n_workers > 1 and len(obs_var) > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_station_crps, *task_args))
+    else:
+        results = list(map(_station_crps, *task_args))
+
+    crps_list, n_model_pts, contains_land = (np.array(result) for result in zip(*results))
+    return crps_list, n_model_pts, contains_land
+
+
+def _station_crps(mod_times, pos0, pos1, weight, obs):
+    """
+    CRPS of a time series at one location against its neighbourhood time
+    series mod_times (n_model_time, n_point). Used by crps_sonf_stations().
+    """
+    n_point = mod_times.shape[1]
+    sample = _weighted_values(mod_times, pos0[:, None], pos1[:, None], weight[:, None], np.arange(n_point)[None, :])
+    n_nan = np.sum(np.isnan(sample), axis=1)
+    has_values = n_nan < n_point
+    crps = np.where(has_values, crps_empirical_batch(sample, obs), np.nan)
+    return crps, np.where(has_values, n_point, np.nan), n_nan > 0
+
+
 def crps_sonf_fixed(
     mod_array: xr.DataArray,
     obs_lon: float,
@@ -165,45 +527,9 @@ def crps_sonf_fixed(
             each CRPS value and an array of bools indicating where a model neighbourhood
             contained land.
     """
-
-    # Define output arrays
-    n_neighbourhoods = obs_var.shape[0]
-    crps_list = np.zeros(n_neighbourhoods) * np.nan
-    n_model_pts = np.zeros(n_neighbourhoods) * np.nan
-    contains_land = np.zeros(n_neighbourhoods, dtype=bool)
-
-    # Loop over neighbourhoods
-    neighbourhood_indices = np.arange(0, n_neighbourhoods)
-
-    # Get model neighbourhood subset using specified method
-    subset_ind = general_utils.subset_indices_by_distance(
-        mod_array.longitude.values, mod_array.latitude.values, obs_lon, obs_lat, nh_radius
+    return crps_sonf_batch(
+        mod_array, float(np.squeeze(obs_lon)), float(np.squeeze(obs_lat)), obs_var, obs_time, nh_radius, time_interp
     )
-    mod_subset = mod_array.isel(y_dim=subset_ind[0], x_dim=subset_ind[1])
-    mod_subset = mod_subset.swap_dims({"t_dim": "time"})
-
-    # Check that the model neighbourhood contains points
-    if subset_ind[0].shape[0] == 0 or subset_ind[1].shape[0] == 0:
-        crps_list = crps_list * np.nan
-    else:
-        # Subset model data in time and space: model -> obs
-        for ii in neighbourhood_indices:
-            mod_subset_time = mod_subset.interp(
-                time=obs_time[ii], method=time_interp, kwargs={"fill_value": "extrapolate"}
-            )
-
-            # Check if neighbourhood contains a land value (TODO:mask)
-            if any(np.isnan(mod_subset_time)):
-                contains_land[ii] = True
-            # Check that neighbourhood contains a value
-            if all(np.isnan(mod_subset_time)):
-                pass
-            else:
-                # Calculate CRPS and put into output array
-                crps_list[ii] = crps_empirical(mod_subset_time.values, obs_var[ii])
-                n_model_pts[ii] = int(mod_subset.shape[0])
-
-    return crps_list, n_model_pts, contains_land
 
 
 def crps_sonf_moving(
@@ -234,41 +560,6 @@ def crps_sonf_moving(
             Array containing the number of model points used for each CRPS value,
             Array of bools indicating where a model neighbourhood contained land.
     """
-
-    # Define output arrays
-    n_neighbourhoods = obs_var.shape[0]
-    crps_list = np.zeros(n_neighbourhoods) * np.nan
-    n_model_pts = np.zeros(n_neighbourhoods) * np.nan
-    contains_land = np.zeros(n_neighbourhoods, dtype=bool)
-    # Loop over neighbourhoods
-    neighbourhood_indices = np.arange(0, n_neighbourhoods)
-    for ii in neighbourhood_indices:
-        # Neighbourhood centre
-        cntr_lon = obs_lon[ii]
-        cntr_lat = obs_lat[ii]
-
-        # Get model neighbourhood subset using specified method
-        subset_ind = general_utils.subset_indices_by_distance(
-            mod_array.longitude, mod_array.latitude, cntr_lon, cntr_lat, nh_radius
-        )
-        # Check that the model neighbourhood contains points
-        if subset_ind[0].shape[0] == 0 or subset_ind[1].shape[0] == 0:
-            crps_list[ii] = np.nan
-        else:
-            # Subset model data in time and space: model -> obs
-            mod_subset = mod_array.isel(y_dim=subset_ind[0], x_dim=subset_ind[1])
-            mod_subset = mod_subset.swap_dims({"t_dim": "time"})
-            mod_subset = mod_subset.interp(time=obs_time[ii], method=time_interp, kwargs={"fill_value": "extrapolate"})
-
-            # Check if neighbourhood contains a land value (TODO:mask)
-            if any(np.isnan(mod_subset)):
-                contains_land[ii] = True
-            # Check that neighbourhood contains a value
-            if all(np.isnan(mod_subset)):
-                pass
-            else:
-                # Calculate CRPS and put into output array
-                crps_list[ii] = crps_empirical(mod_subset, obs_var[ii])
-                n_model_pts[ii] = int(mod_subset.shape[0])
-
-    return crps_list, n_model_pts, contains_land
+    return crps_sonf_batch(
+        mod_array, np.atleast_1d(obs_lon), np.atleast_1d(obs_lat), obs_var, obs_time, nh_radius, time_interp
+    )
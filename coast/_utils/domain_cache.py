@@ -0,0 +1,109 @@
+"""
+Process-wide cache of model domain datasets.
+
+A workflow typically builds Gridded objects for several grids (t, u, v, w,
+f), often more than once, from the same domain_cfg file. Rather than each
+object re-opening and re-renaming the whole domain, the prepared (renamed and
+trimmed) domain dataset is kept in memory, keyed by the file path and
+modification time and by the options used to prepare it (e.g. config name
+mappings and subset limits).
+
+Cached datasets are returned as shallow copies: the arrays are shared without
+copying, while variables added or replaced by one Gridded object are not seen
+by others. Arrays should therefore not be modified in place.
+
+*Methods Overview*
+    -> domain_key(): Key for a domain file and the options used to prepare it
+    -> get_domain(): Returns a cached domain dataset, creating it if needed
+    -> add_variable(): Adds a variable derived from a domain to its cached dataset
+    -> set_cache_size(): Maximum number of domain datasets kept in memory
+    -> clear_cache(): Empties the cache
+    -> cache_info(): Cache hits, misses and current size
+"""
+
+import os.path as path_lib
+from collections import OrderedDict
+
+import xarray as xr
+
+from .logging_util import debug
+
+_cache = OrderedDict()
+_cache_size = 8
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def domain_key(fn_domain: str, *options) -> tuple:
+    """
+    Returns a key identifying a domain file (absolute path and modification
+    time) and the options used to prepare it. Options must be hashable.
+    """
+    fn_domain = path_lib.abspath(fn_domain)
+    return (fn_domain, path_lib.getmtime(fn_domain)) + options
+
+
+def get_domain(key: tuple, loader) -> xr.Dataset:
+    """
+    Returns a shallow copy of the domain dataset cached under key. If there is
+    none, loader() is called to create it. The least recently used dataset is
+    evicted once the cache is full (see set_cache_size()).
+
+    Args:
+        key (tuple): Key from domain_key().
+        loader (callable): Function with no arguments returning the dataset.
+
+    Returns:
+        xarray.Dataset
+    """
+    if key in _cache:
+        _cache_stats["hits"] += 1
+        _cache.move_to_end(key)
+        debug(f"Domain cache hit for {key[0]}")
+        return _cache[key].copy()
+    _cache_stats["misses"] += 1
+
+    dataset = loader()
+    _cache[key] = dataset
+    while len(_cache) > _cache_size:
+        _cache.popitem(last=False)
+    return dataset.copy()
+
+
+def add_variable(key: tuple, name: str, variable):
+    """
+    Adds a variable derived from the domain (e.g. time zero depths) to the dataset
+    cached under key, so that later get_domain() calls share it rather than deriving
+    it again. Datasets already returned by get_domain() are not changed. Nothing is
+    stored if there is no dataset cached under key.
+
+    Returns:
+        The variable.
+    """
+    if key in _cache:
+        _cache[key][name] = variable
+    return variable
+
+
+def set_cache_size(size: int):
+    """Sets the maximum number of domain datasets kept in memory."""
+    global _cache_size
+    _cache_size = max(int(size), 0)
+    while len(_cache) > _cache_size:
+        _cache.popitem(last=False)
+
+
+def clear_cache():
+    """Removes all domain datasets from memory and resets the hit/miss counters."""
+    _cache.clear()
+    _cache_stats["hits"] = 0
+    _cache_stats["misses"] = 0
+
+
+def cache_info() -> dict:
+    """Returns a dictionary of cache hits, misses, current size and maximum size."""
+    return {
+        "hits": _cache_stats["hits"],
+        "misses": _cache_stats["misses"],
+        "size": len(_cache),
+        "max_size": _cache_size,
+    }
@@ -1,8 +1,8 @@
 """A general utility file."""
 import xarray as xr
 import numpy as np
-import sklearn.neighbors as nb
 import pandas as pd
+from . import spatial_index
 
 
 def determine_season(t):
@@ -29,10 +29,13 @@ def determine_season(t):
     return np.array(pd_season)
 
 
-def subset_indices_by_distance_balltree(longitude, latitude, centre_lon, centre_lat, radius: float, mask=None):
+def subset_indices_by_distance_balltree(
+    longitude, latitude, centre_lon, centre_lat, radius: float, mask=None, backend: str = None
+):
     """
     Returns the indices of points that lie within a specified radius (km) of
-    central latitude and longitudes. This makes use of BallTree.query_radius.
+    central latitude and longitudes. This makes use of a (cached) spatial
+    index radius query, see coast._utils.spatial_index.
 
     Parameters
     ----------
@@ -43,6 +46,8 @@ def subset_indices_by_distance_balltree(longitude, latitude, centre_lon, centre_
     radius      : (float) Radius in km within which to find indices
     mask        : (numpy.ndarray) of same dimension as longitude and latitude.
                   If specified, will mask out points from the routine.
+    backend     : (str) Neighbour backend ("kdtree" or "balltree"). Defaults
+                  to spatial_index.set_default_backend().
     Returns
     -------
         Returns an array of indices corresponding to points within radius.
@@ -64,38 +69,16 @@ def subset_indices_by_distance_balltree(longitude, latitude, centre_lon, centre_
     r_rad = radius / earth_radius
     # For reshaping indices at the end
     original_shape = longitude.shape
-    # Check if radius centres are numpy arrays. If not, make them into ndarrays
-    if not isinstance(centre_lon, np.ndarray):
-        centre_lat = np.array(centre_lat)
-        centre_lon = np.array(centre_lon)
     # Determine number of centres provided
     n_pts = 1 if centre_lat.shape == () else len(centre_lat)
-    # If a mask is supplied, remove indices from arrays. Flatten input ready
-    # for BallTree
-    if mask is None:
-        longitude = longitude.flatten()
-        latitude = latitude.flatten()
-    else:
-        longitude[mask] = np.nan
-        latitude[mask] = np.nan
-        longitude = longitude.flatten()
-        latitude = latitude.flatten()
-    # Put lons and lats into 2D location arrays for BallTree: [lat, lon]
-    locs = np.vstack((latitude, longitude)).transpose()
-    locs = np.radians(locs)
-    # Construct central input to BallTree.query_radius
-    if n_pts == 1:
-        centre = np.array([[centre_lat, centre_lon]])
-    else:
-        centre = np.vstack((centre_lat, centre_lon)).transpose()
-    centre = np.radians(centre)
-    # Do nearest neighbour interpolation using BallTree (gets indices)
-    tree = nb.BallTree(locs, leaf_size=2, metric="haversine")
-    ind_1d = tree.query_radius(centre, r=r_rad)
+    # Radius query on the (cached) index. Masked points are left out of the index.
+    index = spatial_index.get_spatial_index(longitude, latitude, mask=mask, backend=backend)
+    ind_1d = np.empty(n_pts, dtype=object)
+    ind_1d[:] = index.query_radius(centre_lon, centre_lat, r_rad)
     if len(original_shape) == 1:
         return ind_1d
     else:
-        # Get 2D indices from 1D index output from BallTree
+        # Get 2D indices from 1D index output
         ind_y = []
         ind_x = []
         for ii in np.arange(0, n_pts):
@@ -235,12 +218,16 @@ def reinstate_indices_by_mask(array_removed, mask, fill_value=np.nan):
     return array
 
 
-def nearest_indices_2d(mod_lon, mod_lat, new_lon, new_lat, mask=None):
+def nearest_indices_2d(mod_lon, mod_lat, new_lon, new_lat, mask=None, backend=None):
     """
     Obtains the 2 dimensional indices of the nearest model points to specified
-    lists of longitudes and latitudes. Makes use of sklearn.neighbours
-    and its BallTree haversine method. Ensure there are no NaNs in
-    input longitude/latitude arrays (or mask them using "mask"")
+    lists of longitudes and latitudes. By default, uses a KD-tree of points
+    on the unit sphere (same neighbours as a haversine BallTree). Ensure
+    there are no NaNs in input longitude/latitude arrays (or mask them
+    using "mask"")
+
+    The tree is cached (see coast._utils.spatial_index), so repeated
+    calls on the same model grid and mask only build it once.
 
     Example Usage
     ----------
@@ -259,49 +246,16 @@ def nearest_indices_2d(mod_lon, mod_lat, new_lon, new_lat, mask=None):
     mask (2D array): Mask array. Where True (or 1), elements of array will
                      not be included. For example, use to mask out land in
                      case it ends up as the nearest point.
+    backend (str): Neighbour backend ("kdtree" or "balltree"). Defaults to
+                   spatial_index.set_default_backend().
 
     Returns
     -------
     Array of x indices, Array of y indices
     """
-    # Cast lat/lon to numpy arrays in case xarray things
-    new_lon = np.array(new_lon)
-    new_lat = np.array(new_lat)
-    mod_lon = np.array(mod_lon)
-    mod_lat = np.array(mod_lat)
-    original_shape = mod_lon.shape
-
-    # If a mask is supplied, remove indices from arrays.
-    if mask is None:
-        mod_lon = mod_lon.flatten()
-        mod_lat = mod_lat.flatten()
-    else:
-        mod_lon = remove_indices_by_mask(mod_lon, mask)
-        mod_lat = remove_indices_by_mask(mod_lat, mask)
-        # If we are masking, we want to preserve the original indices so that
-        # we can get them back at the end (since masked points are removed).
-        cc, rr = np.meshgrid(np.arange(0, original_shape[1]), np.arange(0, original_shape[0]))
-        cc = remove_indices_by_mask(cc, mask)
-        rr = remove_indices_by_mask(rr, mask)
-
-    # Put lons and lats into 2D location arrays for BallTree: [lat, lon]
-    mod_loc = np.vstack((mod_lat, mod_lon)).transpose()
-    new_loc = np.vstack((new_lat, new_lon)).transpose()
-
-    # Convert lat/lon to radians for BallTree
-    mod_loc = np.radians(mod_loc)
-    new_loc = np.radians(new_loc)
-
-    # Do nearest neighbour interpolation using BallTree (gets indices)
-    tree = nb.BallTree(mod_loc, leaf_size=5, metric="haversine")
-    _, ind_1d = tree.query(new_loc, k=1)
-
-    if mask is None:
-        # Get 2D indices from 1D index output from BallTree
-        ind_y, ind_x = np.unravel_index(ind_1d, original_shape)
-    else:
-        ind_y = rr[ind_1d]
-        ind_x = cc[ind_1d]
+    # Reuse (or build and cache) a tree over the unmasked model points.
+    index = spatial_index.get_spatial_index(mod_lon, mod_lat, mask=mask, backend=backend)
+    _, (ind_y, ind_x) = index.query(new_lon, new_lat, k=1)
 
     ind_x = xr.DataArray(ind_x.squeeze())
     ind_y = xr.DataArray(ind_y.squeeze())
@@ -309,6 +263,197 @@ def nearest_indices_2d(mod_lon, mod_lat, new_lon, new_lat, mask=None):
     return ind_x, ind_y
 
 
+def searchsorted_rows(sorted_array, values, side="left"):
+    """
+    Row-wise equivalent of np.searchsorted. For every row of values, finds the
+    insertion indices into the corresponding (sorted) row of sorted_array. All
+    rows are searched at once by ranking every element together and offsetting
+    each row, so there is no Python loop over rows. Rows of sorted_array may be
+    padded at the end with NaNs (which sort last, as in np.sort).
+
+    Parameters
+    ----------
+    sorted_array (2D array): Array of shape (n_rows, n_sorted), sorted along
+                             axis 1.
+    values (2D array): Array of shape (n_rows, n_values) to search for.
+    side (str): 'left' or 'right', as for np.searchsorted.
+
+    Returns
+    -------
+    Integer array of shape (n_rows, n_values)
+    """
+    sorted_array = np.asarray(sorted_array)
+    values = np.asarray(values)
+    n_rows, n_sorted = sorted_array.shape
+
+    # Rank all elements together. Ranks are exact integers, so adding a row
+    # offset keeps the rows separated without any loss of precision
+    _, rank = np.unique(np.concatenate((sorted_array.ravel(), values.ravel())), return_inverse=True)
+    rank = rank.ravel()
+    row_offset = np.arange(n_rows, dtype=np.int64)[:, None] * (rank.max() + 1)
+    key_sorted = (rank[: sorted_array.size].reshape(sorted_array.shape) + row_offset).ravel()
+    key_values = rank[sorted_array.size :].reshape(values.shape) + row_offset
+
+    ind = np.searchsorted(key_sorted, key_values, side=side)
+    return ind - np.arange(n_rows)[:, None] * n_sorted
+
+
+def interpolate_1d_rows(x, y, x_new, method="linear"):
+    """
+    Interpolates many 1D functions at once, one per row of x and y. Gives the
+    same result as looping over rows and calling scipy.interpolate.interp1d
+    (with bounds_error=False, fill_value=np.nan) on the non-NaN points of
+    each row. Rows do not need to be sorted and may contain NaNs in either x
+    or y. Rows with fewer than two valid points return NaNs.
+
+    Parameters
+    ----------
+    x (2D array): Coordinates of the data, shape (n_rows, n_x)
+    y (2D array): Data values, shape (n_rows, n_x)
+    x_new (1D or 2D array): Coordinates to interpolate onto. If 1D, the same
+                            coordinates are used for every row. Otherwise
+                            shape should be (n_rows, n_new).
+    method (str): 'linear' or 'nearest'
+
+    Returns
+    -------
+    Array of shape (n_rows, n_new) of interpolated values.
+    """
+    if method not in ["linear", "nearest"]:
+        raise ValueError(f"Unsupported interpolation method: {method}. Use 'linear' or 'nearest'.")
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y)
+    x_new = np.asarray(x_new, dtype=np.float64)
+    n_rows = x.shape[0]
+    if x_new.ndim == 1:
+        x_new = np.broadcast_to(x_new, (n_rows, x_new.shape[0]))
+    if not np.issubdtype(y.dtype, np.inexact):
+        y = y.astype(np.float64)
+
+    # Push invalid points to the end of each row, then sort valid points by x
+    invalid = np.logical_or(np.isnan(x), np.isnan(y))
+    x = np.where(invalid, np.nan, x)
+    sort_ind = np.argsort(x, axis=1, kind="mergesort")
+    x = np.take_along_axis(x, sort_ind, axis=1)
+    y = np.take_along_axis(y, sort_ind, axis=1)
+    n_valid = np.sum(~invalid, axis=1)[:, None]
+    last = np.maximum(n_valid - 1, 0)
+    rows = np.arange(n_rows)[:, None]
+
+    if method == "linear":
+        ind = searchsorted_rows(x, x_new, side="left")
+        ind = np.clip(ind, 1, np.maximum(last, 1))
+        x_lo = x[rows, ind - 1]
+        x_hi = x[rows, ind]
+        y_lo = y[rows, ind - 1]
+        y_hi = y[rows, ind]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slope = (y_hi - y_lo) / (x_hi - x_lo)
+            y_new = slope * (x_new - x_lo) + y_lo
+    else:
+        # Nearest uses the midpoints between data points as bounds
+        x_bds = x / 2.0
+        x_bds = x_bds[:, 1:] + x_bds[:, :-1]
+        ind = searchsorted_rows(x_bds, x_new, side="left")
+        ind = np.minimum(ind, last)
+        y_new = y[rows, ind].astype(np.result_type(y.dtype, np.float64))
+
+    # Out of bounds and rows without enough data
+    x_first = x[:, :1]
+    x_last = np.take_along_axis(x, last, axis=1)
+    out_of_bounds = np.logical_or(x_new < x_first, x_new > x_last)
+    out_of_bounds = np.logical_or(out_of_bounds, n_valid < 2)
+    y_new = np.where(out_of_bounds, np.nan, y_new)
+
+    return y_new
+
+
+def time_matching_indices(mod_time, new_time, method="nearest", extrapolate=True):
+    """
+    Matches each new time to the model times using a sorted search, rather
+    than computing the distance to every model time. Returns a pair of model
+    time indices and a weight for each new time, so that a model value at the
+    new time can be obtained by:
+
+        value = (1 - weight) * model[ind0] + weight * model[ind1]
+
+    For 'nearest', 'previous' and 'next', ind0 and ind1 are the same and
+    weight is zero. For 'linear', ind0 and ind1 bracket the new time and
+    weight is the fractional distance between them. Ties in 'nearest' go to
+    the earlier model time.
+
+    Example Usage
+    ----------
+    ind0, ind1, weight = time_matching_indices(model.dataset.time,
+                                               profile.dataset.time)
+    extracted = model.dataset.isel(t_dim=ind0)
+
+    Parameters
+    ----------
+    mod_time (1D array): Model times. Do not need to be sorted.
+    new_time (1D array): Times to match against mod_time.
+    method (str): 'nearest', 'previous', 'next' or 'linear'.
+    extrapolate (bool): If True, new times outside of the model time range are
+                        matched to the first or last model time (or linearly
+                        extrapolated for 'linear'). If False, their weights
+                        are NaN.
+
+    Returns
+    -------
+    ind0 (int array), ind1 (int array), weight (float array)
+    """
+    if method not in ["nearest", "previous", "next", "linear"]:
+        raise ValueError(f"Unknown time matching method: {method}")
+
+    mod_time = np.asarray(mod_time).flatten()
+    new_time = np.asarray(new_time).flatten()
+    n_mod = len(mod_time)
+
+    # Sort model times, remembering original indices
+    sort_ind = np.argsort(mod_time, kind="stable")
+    mod_sorted = mod_time[sort_ind]
+
+    # First model time >= new time, last model time <= new time
+    ind_next = np.searchsorted(mod_sorted, new_time, side="left")
+    ind_prev = np.searchsorted(mod_sorted, new_time, side="right") - 1
+    out_of_range = np.logical_or(ind_next >= n_mod, ind_prev < 0)
+    ind_next = np.clip(ind_next, 0, n_mod - 1)
+    ind_prev = np.clip(ind_prev, 0, n_mod - 1)
+
+    if method == "nearest":
+        # Compare distances to the model times either side of each new time
+        ind_left = np.clip(ind_next - 1, 0, n_mod - 1)
+        left_closer = (new_time - mod_sorted[ind_left]) <= (mod_sorted[ind_next] - new_time)
+        ind0 = np.where(left_closer, ind_left, ind_next)
+        ind1 = ind0
+        weight = np.zeros(len(new_time))
+    elif method == "previous":
+        ind0 = ind1 = ind_prev
+        weight = np.zeros(len(new_time))
+    elif method == "next":
+        ind0 = ind1 = ind_next
+        weight = np.zeros(len(new_time))
+    else:
+        ind0 = np.clip(ind_prev, 0, max(n_mod - 2, 0))
+        ind1 = np.minimum(ind0 + 1, n_mod - 1)
+        weight = np.zeros(len(new_time))
+        spacing = mod_sorted[ind1] - mod_sorted[ind0]
+        has_spacing = ind1 != ind0
+        weight[has_spacing] = (new_time[has_spacing] - mod_sorted[ind0][has_spacing]) / spacing[has_spacing]
+
+    # Missing times and (optionally) times outside of the model range
+    if np.issubdtype(new_time.dtype, np.datetime64):
+        invalid = np.isnat(new_time)
+    else:
+        invalid = np.isnan(new_time)
+    if not extrapolate:
+        invalid = np.logical_or(invalid, out_of_range)
+    weight = np.where(invalid, np.nan, weight)
+
+    return sort_ind[ind0], sort_ind[ind1], weight
+
+
 def data_array_time_slice(data_array, date0, date1):
     """Takes an xr.DataArray object and returns a new object with times
     sliced between dates date0 and date1. date0 and date1 may be a string or
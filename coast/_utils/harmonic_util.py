@@ -0,0 +1,220 @@
+"""
+Harmonic analysis of several tide gauge records with utide.
+
+utide.solve() analyses one time series at a time and most of its run time is
+spent building the harmonic model matrix (nodal and astronomical arguments
+of every constituent at every time). Records that share a time axis and have
+missing values in the same places (e.g. model output at gauge locations, or
+gauges resampled onto a common time axis) use the same constituents and the
+same model matrix. solve_stations() builds it once for such a group, solves
+for all records at once as a least squares problem with several right hand
+sides and, for linearised confidence intervals, inverts the covariance
+matrices of the model once. The coefficients are then post-processed with
+utide's own functions, giving the same output structures as calling
+utide.solve() on each record.
+
+*Methods Overview*
+    -> group_stations(): Indices of records that can be solved together
+    -> solve_stations(): utide.solve() for several records on one time axis
+    -> reconstruct_stations(): utide.reconstruct() for several solutions
+"""
+
+import numpy as np
+import utide as ut
+
+from .logging_util import warning
+
+# Batched solves use utide internals (tests compare them with utide.solve() for the
+# installed version). If they are missing or have changed, records are passed to
+# utide.solve() one at a time instead.
+try:
+    from utide._solve import _process_opts, _slvinit, _reorder
+    from utide.confidence import _confidence, band_averaged_psd_by_constit, ut_linci
+    from utide.constituent_selection import ut_cnstitsel
+    from utide.diagnostics import _PE, _SNR, ut_diagn
+    from utide.ellipse_params import ut_cs2cep
+    from utide.harmonics import ut_E
+
+    _batch_available = True
+except ImportError as err:
+    warning(f"utide internals not available ({err}). Harmonic analyses will not be batched.")
+    _batch_available = False
+
+
+def group_stations(values, latitudes=None):
+    """
+    Groups records by their pattern of missing values (and latitude, if given).
+
+    Args:
+        values (array): (n_station, n_time) array of records, NaN where missing.
+        latitudes (array): Latitude of each record. Only needed if nodal
+                           corrections are applied, as they depend on latitude.
+
+    Returns:
+        List of integer index arrays, one per group, in order of first record.
+    """
+    groups = {}
+    missing = np.isnan(values)
+    for ii in range(len(values)):
+        key = np.packbits(missing[ii]).tobytes()
+        if latitudes is not None:
+            key = (key, float(latitudes[ii]))
+        groups.setdefault(key, []).append(ii)
+    return [np.array(group) for group in groups.values()]
+
+
+def solve_stations(time, values, latitudes, opts: dict, batch: bool = True) -> list:
+    """
+    Harmonic analysis of several records with utide.
+
+    Args:
+        time (array): Times shared by all records (np.datetime64 or datenums).
+        values (array): (n_station, n_time) array of records, NaN where missing.
+        latitudes (array): Latitude of each record.
+        opts (dict): Keyword arguments to utide.solve().
+        batch (bool): If True, records with the same missing values (and
+                      latitude, for nodal corrections) are solved together.
+                      Records that cannot be, or all records if the utide
+                      internals used are unavailable or incompatible, are
+                      passed to utide.solve().
+
+    Returns:
+        List of utide solution structures, one per record.
+    """
+    values = np.atleast_2d(values)
+    latitudes = np.broadcast_to(latitudes, len(values))
+    batchable = batch and _batch_available and opts.get("method", "ols") == "ols" and opts.get("infer") is None
+    if not batchable:
+        return [ut.solve(time, values[ii], lat=latitudes[ii], **opts) for ii in range(len(values))]
+
+    solutions = [None] * len(values)
+    for group in group_stations(values, latitudes if opts.get("nodal", True) else None):
+        if len(group) > 1:
+            try:
+                for ii, coef in zip(group, _solve_group(time, values[group], latitudes[group[0]], opts)):
+                    solutions[ii] = coef
+                continue
+            except (TypeError, AttributeError, ImportError) as err:
+                warning(f"Batched harmonic analysis failed ({err!r}), using utide.solve() for each record.")
+        for ii in group:
+            solutions[ii] = ut.solve(time, values[ii], lat=latitudes[ii], **opts)
+    return solutions
+
+
+def _solve_group(time, values, lat, opts):
+    """
+    Ordinary least squares analysis of records with the same missing values,
+    following utide._solve._solv1() with one model matrix for all records.
+    """
+    compat_opts = _process_opts(dict(opts, verbose=False), False)
+
+    # utide sets up and selects constituents for each record, giving each
+    # solution its own (identical) options and constituent structures
+    setups = []
+    for u_raw in values:
+        tin, t, u, _, tref, lor, elor, opt = _slvinit(time, u_raw, None, lat, **compat_opts)
+        cnstit, coef = ut_cnstitsel(tref, opt["rmin"] / (24 * lor), opt["cnstit"], opt["infer"])
+        coef.aux.opt = opt
+        coef.aux.lat = lat
+        setups.append((u, cnstit, coef, opt))
+    u_all = np.stack([setup[0] for setup in setups], axis=1)
+    cnstit = setups[0][1]
+    opt = setups[0][3]
+
+    # Model matrix: harmonics at positive and negative frequencies, mean and trend
+    nt = len(t)
+    ngflgs = [opt["nodsatlint"], opt["nodsatnone"], opt["gwchlint"], opt["gwchnone"]]
+    E = ut_E(t, tref, cnstit.NR.frq, cnstit.NR.lind, lat, ngflgs, opt.prefilt)
+    B = np.hstack((E, E.conj(), np.ones((nt, 1))))
+    if not opt["notrend"]:
+        B = np.hstack((B, ((t - tref) / lor)[:, np.newaxis]))
+
+    m_all = np.linalg.lstsq(B, u_all, rcond=None)[0]
+    xmod_all = np.real(B @ m_all)
+    if opt["conf_int"] and opt["linci"]:
+        # Unweighted covariance and pseudo-covariance of the model (Eq. 54 of utide)
+        inv_cov = (np.linalg.inv(np.dot(B.conj().T, B)), np.linalg.inv(np.dot(B.T, B)))
+
+    solutions = []
+    for ii, (u, cnstit, coef, opt) in enumerate(setups):
+        m = m_all[:, ii]
+        xmod = xmod_all[:, ii]
+        W = np.ones(nt)
+        coef.weights = W
+        e = W * (u - xmod)
+
+        nR, nNR = coef.nR, coef.nNR
+        ap = np.hstack((m[:nNR], m[2 * nNR : 2 * nNR + nR]))
+        i0 = 2 * nNR + nR
+        am = np.hstack((m[nNR : 2 * nNR], m[i0 : i0 + nR]))
+        Xu = np.real(ap + am)
+        Yu = -np.imag(ap - am)
+        coef["A"], _, _, coef["g"] = ut_cs2cep(Xu, Yu)
+
+        if opt["notrend"]:
+            coef["mean"] = np.real(m[-1])
+        else:
+            coef["mean"] = np.real(m[-2])
+            coef["slope"] = np.real(m[-1]) / lor
+
+        if opt["conf_int"] and opt["linci"]:
+            coef = _linear_confidence(coef, opt, t, e, tin, elor, u, xmod, inv_cov, Xu, Yu)
+        elif opt["conf_int"]:
+            coef = _confidence(coef, cnstit, opt, t, e, tin, elor, u, xmod, W, m, B, Xu, Yu, [], [])
+        if not opt["nodiagn"]:
+            coef = ut_diagn(coef)
+            coef["PE"] = _PE(coef)
+            coef["SNR"] = _SNR(coef)
+        solutions.append(_reorder(coef, opt))
+    return solutions
+
+
+def _linear_confidence(coef, opt, t, e, tin, elor, xraw, xmod, inv_cov, Xu, Yu):
+    """
+    Linearised confidence intervals of amplitude and phase, as
+    utide.confidence._confidence() for unweighted 1D fits without inference,
+    given the inverses of the (B^H B) and (B^T B) model matrix products.
+    """
+    if not opt["white"]:
+        Puu, _, _ = band_averaged_psd_by_constit(tin, t, e, elor, coef, opt)
+
+    nt = len(xraw)
+    nm = inv_cov[0].shape[0]
+    gamC = inv_cov[0] * np.real(np.dot(xraw, xraw) - np.dot(xmod, xraw)) / (nt - nm)
+    gamP = inv_cov[1] * (np.dot(xraw, xraw) - np.dot(xmod, xraw)) / (nt - nm)
+    Gall = gamC + gamP
+    Hall = gamC - gamP
+
+    nc = len(Xu)
+    coef.g_ci = np.nan * np.ones_like(coef.g)
+    coef.A_ci = coef.g_ci.copy()
+    for c in range(nc):
+        varXu = np.real(Gall[c, c] + Gall[c + nc, c + nc] + 2 * Gall[c, c + nc]) / 2
+        varYu = np.real(Hall[c, c] + Hall[c + nc, c + nc] - 2 * Hall[c, c + nc]) / 2
+        if not opt["white"]:
+            den = varXu + varYu
+            varXu = Puu[c] * varXu / den
+            varYu = Puu[c] * varYu / den
+        sig1, sig2 = ut_linci(Xu[c], Yu[c], np.sqrt(varXu), np.sqrt(varYu))
+        coef["A_ci"][c] = 1.96 * sig1
+        coef["g_ci"][c] = 1.96 * sig2
+    return coef
+
+
+def reconstruct_stations(time, solutions: list, constit=None) -> np.ndarray:
+    """
+    Reconstructs tides from utide solutions, as utide.reconstruct().h.
+
+    Args:
+        time (array): Times to reconstruct at.
+        solutions (list): utide solution structures. Empty entries give NaNs.
+        constit (list): Constituents to use, e.g. ["M2", "S2"]. Default all.
+
+    Returns:
+        (n_solution, n_time) array of reconstructed tide.
+    """
+    reconstructed = np.full((len(solutions), len(time)), np.nan)
+    for ii, solution in enumerate(solutions):
+        if len(solution) > 0:
+            reconstructed[ii] = ut.reconstruct(time, solution, constit=constit).h
+    return reconstructed
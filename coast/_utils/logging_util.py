@@ -63,16 +63,21 @@ def add_info(msg, level=3):
     return msg
 
 
+# add_info() inspects the call stack, which is slow, so messages below the
+# root logger's level are dropped before it is called.
 def debug(msg, *args, **kwargs):
-    return logging.debug(add_info(msg), *args, **kwargs)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        return logging.debug(add_info(msg), *args, **kwargs)
 
 
 def info(msg, *args, **kwargs):
-    return logging.info(add_info(msg), *args, **kwargs)
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        return logging.info(add_info(msg), *args, **kwargs)
 
 
 def warning(msg, *args, **kwargs):
-    return logging.warning(add_info(msg), *args, **kwargs)
+    if logging.getLogger().isEnabledFor(logging.WARNING):
+        return logging.warning(add_info(msg), *args, **kwargs)
 
 
 def warn(msg, *args, **kwargs):
@@ -80,4 +85,5 @@ def warn(msg, *args, **kwargs):
 
 
 def error(msg, *args, **kwargs):
-    return logging.error(add_info(msg), *args, **kwargs)
+    if logging.getLogger().isEnabledFor(logging.ERROR):
+        return logging.error(add_info(msg), *args, **kwargs)
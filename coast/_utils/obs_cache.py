@@ -0,0 +1,201 @@
+"""
+Opt-in on-disk cache of parsed observation datasets.
+
+Reading ASCII tide gauge files or decoding EN4 quality control can take much
+longer than reading the result back from a binary file. When a cache
+directory is set (see set_cache_dir()), readers store their output as
+compressed NetCDF4 files named by a hash of the source files (path, size and
+modification time) and the reader options. Later reads with the same key
+open the stored file lazily instead of re-parsing the source.
+
+The cache is disabled by default. Once the total size of the cache exceeds
+the limit (see set_max_size()), the least recently used files are removed.
+
+*Methods Overview*
+    -> set_cache_dir(): Sets (or with None, unsets) the cache directory
+    -> get_cache_dir(): Current cache directory, or None if disabled
+    -> set_max_size(): Maximum total size of cached files in bytes
+    -> cache_key(): Hash of source files and reader options
+    -> dataset_sources(): Source files a dataset was opened from
+    -> cached_dataset(): Returns a cached dataset, creating it if needed
+    -> clear_cache(): Removes all cached files
+    -> cache_info(): Number and total size of cached files
+"""
+
+import hashlib
+import os
+import os.path as path_lib
+import tempfile
+
+import numpy as np
+import xarray as xr
+
+from .logging_util import debug, info, warning
+
+# Increment when reader output changes, so older cache files are not used
+_cache_version = 1
+_cache_dir = None
+_max_size = 10 * 1024**3
+_suffix = ".obs_cache.nc"
+
+
+def set_cache_dir(cache_dir):
+    """Sets the directory used for cached datasets, creating it if needed. None disables the cache."""
+    global _cache_dir
+    if cache_dir is not None:
+        cache_dir = path_lib.abspath(path_lib.expanduser(str(cache_dir)))
+        os.makedirs(cache_dir, exist_ok=True)
+    _cache_dir = cache_dir
+
+
+def get_cache_dir():
+    """Returns the directory used for cached datasets, or None if the cache is disabled."""
+    return _cache_dir
+
+
+def set_max_size(max_size: int):
+    """Sets the maximum total size (bytes) of cached files. Least recently used files are removed first."""
+    global _max_size
+    if max_size < 0:
+        raise ValueError(f"Maximum cache size must not be negative, not {max_size}")
+    _max_size = int(max_size)
+    _evict()
+
+
+def cache_key(reader: str, sources, options: dict = None, fingerprint=None) -> str:
+    """
+    Returns a hash string identifying the output of a reader.
+
+    Args:
+        reader (str): Name of the reader, e.g. "gesla".
+        sources (list): Paths of the source files. Their absolute path, size and
+                        modification time are part of the key.
+        options (dict): Reader options that change the output.
+        fingerprint (list): Optional arrays that also identify the input, e.g.
+                            coordinates of a dataset that may have been subset.
+
+    Returns:
+        str
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{_cache_version}:{reader}".encode())
+    for source in sources:
+        stat = os.stat(source)
+        hasher.update(f"{path_lib.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    for name in sorted(options or {}):
+        hasher.update(f"{name}={options[name]!r}".encode())
+    for array in fingerprint or []:
+        array = np.ascontiguousarray(array)
+        hasher.update(f"{array.shape}{array.dtype}".encode())
+        hasher.update(array.tobytes())
+    return hasher.hexdigest()
+
+
+def dataset_sources(dataset) -> list:
+    """Returns the sorted paths of files that a dataset (or its variables) were opened from, if any still exist."""
+    sources = {dataset.encoding.get("source")}
+    sources.update(variable.encoding.get("source") for variable in dataset.variables.values())
+    return sorted(source for source in sources if source is not None and path_lib.isfile(source))
+
+
+def cached_dataset(reader: str, sources, options: dict, create, fingerprint=None) -> xr.Dataset:
+    """
+    Returns the dataset made by create(), using the cache if it is enabled.
+
+    Args:
+        reader (str): Name of the reader, e.g. "gesla".
+        sources (list): Paths of the source files read by create().
+        options (dict): Reader options that change the output.
+        create (callable): Function with no arguments that returns the dataset.
+        fingerprint (list): Optional arrays that also identify the input (see cache_key()).
+
+    Returns:
+        xarray.Dataset. Cached datasets are opened lazily from disk.
+    """
+    if _cache_dir is None or not sources:
+        return create()
+    try:
+        fn_cache = path_lib.join(_cache_dir, cache_key(reader, sources, options, fingerprint) + _suffix)
+    except OSError as err:
+        warning(f"Not caching {reader} output: {err}")
+        return create()
+
+    if path_lib.isfile(fn_cache):
+        debug(f"Reading cached {reader} output from {fn_cache}")
+        try:
+            dataset = xr.open_dataset(fn_cache)
+            # Mark as recently used
+            os.utime(fn_cache)
+            return dataset
+        except (OSError, ValueError) as err:
+            warning(f"Could not read cached {reader} output from {fn_cache}: {err}. Recreating.")
+
+    dataset = create()
+    _write(dataset, fn_cache)
+    return dataset
+
+
+def _write(dataset, fn_cache):
+    """Writes a compressed copy of dataset to fn_cache, via a temporary file so readers never see partial files."""
+    encoding = {}
+    for name, variable in dataset.variables.items():
+        if variable.dtype.kind in "iuf" and variable.ndim > 0 and variable.size > 0:
+            encoding[name] = {"zlib": True, "complevel": 4}
+    fid, fn_tmp = tempfile.mkstemp(dir=_cache_dir, suffix=".tmp")
+    os.close(fid)
+    try:
+        info(f"Caching dataset to {fn_cache}")
+        dataset.to_netcdf(fn_tmp, format="NETCDF4", encoding=encoding)
+        os.replace(fn_tmp, fn_cache)
+    except (OSError, ValueError, TypeError) as err:
+        warning(f"Could not cache dataset to {fn_cache}: {err}")
+        if path_lib.isfile(fn_tmp):
+            os.remove(fn_tmp)
+        return
+    _evict(keep=fn_cache)
+
+
+def _cached_files():
+    """Returns a list of (last used time, size, path) for cached files, oldest first."""
+    if _cache_dir is None or not path_lib.isdir(_cache_dir):
+        return []
+    files = []
+    for entry in os.scandir(_cache_dir):
+        if entry.name.endswith(_suffix) and entry.is_file():
+            stat = entry.stat()
+            files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    return sorted(files)
+
+
+def _evict(keep=None):
+    """Removes least recently used files until the cache is within its size limit."""
+    files = _cached_files()
+    total = sum(size for _, size, _ in files)
+    for _, size, fn_cache in files:
+        if total <= _max_size:
+            break
+        if fn_cache == keep:
+            continue
+        debug(f"Removing {fn_cache} from observation cache")
+        try:
+            os.remove(fn_cache)
+            total -= size
+        except OSError as err:
+            warning(f"Could not remove {fn_cache} from observation cache: {err}")
+
+
+def clear_cache():
+    """Removes all cached files from the cache directory."""
+    for _, _, fn_cache in _cached_files():
+        os.remove(fn_cache)
+
+
+def cache_info() -> dict:
+    """Returns a dictionary of the cache directory, number of files, total size and maximum size (bytes)."""
+    files = _cached_files()
+    return {
+        "cache_dir": _cache_dir,
+        "n_files": len(files),
+        "size": sum(size for _, size, _ in files),
+        "max_size": _max_size,
+    }
@@ -0,0 +1,277 @@
+"""
+Reusable spatial indices for nearest neighbour lookups on model grids.
+
+Building a tree over a large model grid is often much slower than querying
+it, so indices are cached in memory (keyed by a hash of the grid longitude,
+latitude and mask).
+
+The tree itself is provided by a neighbour backend. The default, "kdtree",
+converts longitudes and latitudes to 3D points on the unit sphere and uses
+scipy's cKDTree with parallel queries. Because chord length increases
+monotonically with great circle distance, this gives the same neighbours as
+the "balltree" backend (sklearn BallTree with the haversine metric). Other
+backends can be added with register_backend().
+
+*Methods Overview*
+    -> SpatialIndex: A tree over a (masked) grid, with query methods
+    -> get_spatial_index(): Returns a cached index, building it if needed
+    -> grid_key(): Hash identifying a grid and mask
+    -> register_backend(): Adds a neighbour backend
+    -> set_default_backend(): Chooses the backend used by default
+    -> get_default_backend(): Name of the backend used by default
+    -> set_cache_size(): Maximum number of indices kept in memory
+    -> clear_cache(): Empties the in-memory cache
+    -> cache_info(): Cache hits, misses and current size
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import scipy.spatial as sp
+import sklearn.neighbors as nb
+
+from .logging_util import debug
+
+
+def lonlat_to_xyz(longitude, latitude):
+    """Converts longitudes and latitudes (degrees) to an (n, 3) array of points on the unit sphere."""
+    lon_rad = np.radians(np.array(longitude, dtype=float).flatten())
+    lat_rad = np.radians(np.array(latitude, dtype=float).flatten())
+    cos_lat = np.cos(lat_rad)
+    return np.column_stack((cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)))
+
+
+class KDTreeBackend:
+    """
+    Nearest neighbours using scipy's cKDTree on 3D unit sphere coordinates.
+    Queries run in parallel over `workers` threads (-1 uses all cores).
+    Distances are returned as great circle distances in radians. Asking for
+    more neighbours than there are points raises a ValueError (as BallTree).
+    """
+
+    def __init__(self, longitude, latitude, leaf_size: int = 16, workers: int = -1):
+        self.workers = workers
+        self.tree = sp.cKDTree(lonlat_to_xyz(longitude, latitude), leafsize=leaf_size)
+
+    def query(self, longitude, latitude, k: int = 1):
+        if k > self.tree.n:
+            raise ValueError(f"Cannot find {k} neighbours among {self.tree.n} grid points")
+        xyz = lonlat_to_xyz(longitude, latitude)
+        # cKDTree does not accept NaN locations. These get index 0 and NaN distance.
+        finite = np.all(np.isfinite(xyz), axis=1)
+        chord = np.full((len(xyz), k), np.nan)
+        ind = np.zeros((len(xyz), k), dtype=int)
+        if np.any(finite):
+            chord_finite, ind_finite = self.tree.query(xyz[finite], k=k, workers=self.workers)
+            chord[finite] = chord_finite.reshape(-1, k)
+            ind[finite] = ind_finite.reshape(-1, k)
+        return 2 * np.arcsin(np.minimum(chord / 2, 1)), ind
+
+    def query_radius(self, longitude, latitude, radius: float):
+        chord = 2 * np.sin(min(radius, np.pi) / 2)
+        ind = self.tree.query_ball_point(lonlat_to_xyz(longitude, latitude), r=chord, workers=self.workers)
+        return [np.array(ii, dtype=int) for ii in ind]
+
+
+class BallTreeBackend:
+    """
+    Nearest neighbours using sklearn's BallTree with the haversine metric.
+    Distances are returned as great circle distances in radians.
+    """
+
+    def __init__(self, longitude, latitude, leaf_size: int = 5):
+        locs = np.vstack((np.array(latitude).flatten(), np.array(longitude).flatten())).transpose()
+        self.tree = nb.BallTree(np.radians(locs), leaf_size=leaf_size, metric="haversine")
+
+    def query(self, longitude, latitude, k: int = 1):
+        locs = np.vstack((np.array(latitude).flatten(), np.array(longitude).flatten())).transpose()
+        return self.tree.query(np.radians(locs), k=k)
+
+    def query_radius(self, longitude, latitude, radius: float):
+        locs = np.vstack((np.array(latitude).flatten(), np.array(longitude).flatten())).transpose()
+        return list(self.tree.query_radius(np.radians(locs), r=radius))
+
+
+_backends = {"kdtree": KDTreeBackend, "balltree": BallTreeBackend}
+_default_backend = "kdtree"
+
+
+def register_backend(name: str, backend):
+    """
+    Adds a neighbour backend. backend(longitude, latitude, **kwargs) should
+    build a tree over flat arrays of points and provide query(longitude,
+    latitude, k) -> (distance in radians, indices), each of shape (n, k), and
+    query_radius(longitude, latitude, radius in radians) -> list of arrays.
+    """
+    _backends[name] = backend
+
+
+def set_default_backend(name: str):
+    """Sets the neighbour backend used when none is specified ("kdtree" or "balltree")."""
+    global _default_backend
+    if name not in _backends:
+        raise ValueError(f"Unknown neighbour backend '{name}'. Options are: {list(_backends)}")
+    _default_backend = name
+
+
+def get_default_backend() -> str:
+    """Returns the name of the neighbour backend used when none is specified."""
+    return _default_backend
+
+
+def grid_key(longitude, latitude, mask=None) -> str:
+    """
+    Returns a hash string identifying a grid (longitude, latitude) and an
+    optional mask. Grids with identical coordinates and mask share a key.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    for array in (longitude, latitude, mask):
+        if array is None:
+            hasher.update(b"none")
+            continue
+        array = np.ascontiguousarray(array)
+        hasher.update(str(array.shape).encode())
+        hasher.update(str(array.dtype).encode())
+        hasher.update(array.tobytes())
+    return hasher.hexdigest()
+
+
+class SpatialIndex:
+    """
+    A nearest neighbour tree over the (unmasked) points of a 1D or 2D grid of
+    longitudes and latitudes. Query results are given as indices into the
+    original (unmasked) grid.
+
+    Example Usage
+    ----------
+    index = SpatialIndex(nemo.dataset.longitude, nemo.dataset.latitude)
+    dist, (ind_y, ind_x) = index.query(profile.dataset.longitude,
+                                       profile.dataset.latitude)
+    """
+
+    def __init__(self, longitude, latitude, mask=None, backend: str = None, **kwargs):
+        """
+        Args:
+            longitude (array): Grid longitudes (degrees), 1D or 2D.
+            latitude (array): Grid latitudes (degrees), same shape as longitude.
+            mask (array): Where True (or 1), grid points are excluded.
+            backend (str): Neighbour backend. Defaults to set_default_backend().
+            **kwargs: Passed to the backend (e.g. leaf_size, workers).
+        """
+        longitude = np.array(longitude)
+        latitude = np.array(latitude)
+        self.key = grid_key(longitude, latitude, None if mask is None else np.array(mask, dtype=bool))
+        self.shape = longitude.shape
+        self.backend = _default_backend if backend is None else backend
+        if self.backend not in _backends:
+            raise ValueError(f"Unknown neighbour backend '{self.backend}'. Options are: {list(_backends)}")
+
+        # Flat indices of points included in the tree
+        if mask is None:
+            self.valid_ind = np.arange(longitude.size)
+        else:
+            self.valid_ind = np.flatnonzero(~np.array(mask, dtype=bool).flatten())
+
+        debug(f"Building {self.backend} spatial index over {len(self.valid_ind)} grid points")
+        self.tree = _backends[self.backend](
+            longitude.flatten()[self.valid_ind], latitude.flatten()[self.valid_ind], **kwargs
+        )
+
+    def query(self, new_lon, new_lat, k: int = 1):
+        """
+        Finds the k nearest grid points to each new location.
+
+        Args:
+            new_lon (array): Longitudes (degrees) to look up.
+            new_lat (array): Latitudes (degrees) to look up.
+            k (int): Number of neighbours.
+
+        Returns:
+            Tuple of arrays (distance in radians, indices). Indices are a tuple
+            of arrays as returned by np.unravel_index on the grid shape, i.e.
+            (ind_y, ind_x) for a 2D grid. Each array has shape (n_points, k).
+        """
+        dist, ind_1d = self.tree.query(new_lon, new_lat, k=k)
+        return dist, np.unravel_index(self.valid_ind[ind_1d], self.shape)
+
+    def query_radius(self, new_lon, new_lat, radius: float):
+        """
+        Finds all grid points within a great circle distance of each new location.
+
+        Args:
+            new_lon (array): Longitudes (degrees) of the centres.
+            new_lat (array): Latitudes (degrees) of the centres.
+            radius (float): Search radius in radians (distance / earth radius).
+
+        Returns:
+            List with one array per centre of flat indices into the grid,
+            i.e. np.unravel_index(ind, grid shape) gives the grid indices.
+        """
+        ind_1d = self.tree.query_radius(new_lon, new_lat, radius)
+        return [self.valid_ind[ii] for ii in ind_1d]
+
+
+_cache = OrderedDict()
+_cache_size = 4
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def get_spatial_index(longitude, latitude, mask=None, backend: str = None) -> SpatialIndex:
+    """
+    Returns a SpatialIndex for a grid, reusing a cached one if the same grid
+    (and mask) has been seen before. The least recently used index is evicted
+    once the cache is full (see set_cache_size()).
+
+    Args:
+        longitude (array): Grid longitudes (degrees), 1D or 2D.
+        latitude (array): Grid latitudes (degrees), same shape as longitude.
+        mask (array): Where True (or 1), grid points are excluded.
+        backend (str): Neighbour backend. Defaults to set_default_backend().
+
+    Returns:
+        SpatialIndex
+    """
+    longitude = np.array(longitude)
+    latitude = np.array(latitude)
+    if mask is not None:
+        mask = np.array(mask, dtype=bool)
+    backend = _default_backend if backend is None else backend
+    key = (grid_key(longitude, latitude, mask), backend)
+
+    if key in _cache:
+        _cache_stats["hits"] += 1
+        _cache.move_to_end(key)
+        return _cache[key]
+    _cache_stats["misses"] += 1
+
+    index = SpatialIndex(longitude, latitude, mask=mask, backend=backend)
+    _cache[key] = index
+    while len(_cache) > _cache_size:
+        _cache.popitem(last=False)
+    return index
+
+
+def set_cache_size(size: int):
+    """Sets the maximum number of spatial indices kept in memory."""
+    global _cache_size
+    _cache_size = max(int(size), 0)
+    while len(_cache) > _cache_size:
+        _cache.popitem(last=False)
+
+
+def clear_cache():
+    """Removes all spatial indices from memory and resets the hit/miss counters."""
+    _cache.clear()
+    _cache_stats["hits"] = 0
+    _cache_stats["misses"] = 0
+
+
+def cache_info() -> dict:
+    """Returns a dictionary of cache hits, misses, current size and maximum size."""
+    return {
+        "hits": _cache_stats["hits"],
+        "misses": _cache_stats["misses"],
+        "size": len(_cache),
+        "max_size": _cache_size,
+    }
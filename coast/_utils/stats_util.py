@@ -5,11 +5,15 @@ Python definitions used to aid with statistical calculations.
     -> normal_distribution(): Create values for a normal distribution
     -> cumulative_distribution(): Integration udner a PDF
     -> empirical_distribution(): Estimates CDF empirically
+    -> count_over_thresholds(): Number of values at or above each threshold
+    -> group_max(): Maximum of values sharing each group key
+    -> threshold_counts(): Peak, exceedance and max counts over thresholds
 """
 
 import numpy as np
 import xarray as xr
 import scipy
+import scipy.signal
 
 from .logging_util import error
 
@@ -227,3 +231,72 @@ def doodson_x0_filter(elevation, ax=0):
     filtered[-19:] = np.nan
     filtered = filtered.swapaxes(0, ax)
     return filtered
+
+
+def count_over_thresholds(values, thresholds):
+    """
+    Counts the values at or above each threshold, ignoring NaNs. The values
+    are sorted once, so any number of thresholds costs one binary search each.
+
+    Parameters
+    ----------
+        values (ndarray) : 1D array of values.
+        thresholds (ndarray) : 1D array of thresholds, in any order.
+
+    Returns
+    -------
+        Integer array of counts, one per threshold.
+    """
+    values = np.sort(values)
+    if values.dtype.kind == "f":
+        values = values[: np.count_nonzero(~np.isnan(values))]
+    return len(values) - np.searchsorted(values, thresholds, side="left")
+
+
+def group_max(values, keys):
+    """
+    Maximum of values (ignoring NaNs) for each unique key, like
+    xr.DataArray.groupby(keys).max(skipna=True).
+
+    Parameters
+    ----------
+        values (ndarray) : 1D array of values.
+        keys (ndarray) : 1D array of group keys, one per value.
+
+    Returns
+    -------
+        Array of maxima in order of sorted unique keys. Groups of only NaNs
+        give NaN.
+    """
+    order = np.argsort(keys, kind="stable")
+    starts = np.flatnonzero(np.concatenate(([True], keys[order][1:] != keys[order][:-1])))
+    return np.fmax.reduceat(values[order], starts)
+
+
+def threshold_counts(values, thresholds, peak_separation=12, group_keys=()):
+    """
+    Threshold statistics of a time series, for all thresholds at once. Used
+    by TidegaugeAnalysis.threshold_statistics().
+
+    Parameters
+    ----------
+        values (ndarray) : 1D time series.
+        thresholds (ndarray) : 1D array of thresholds.
+        peak_separation (int) : Minimum number of points between independent
+                                peaks (passed to scipy.signal.find_peaks).
+        group_keys (list) : 1D arrays of group keys (e.g. day or month of each
+                            time). Group maxima are counted over thresholds.
+
+    Returns
+    -------
+        (2 + len(group_keys), n_thresholds) array with the number of peaks,
+        the number of values and the number of group maxima (for each set of
+        keys) at or above each threshold.
+    """
+    counts = np.empty((2 + len(group_keys), len(thresholds)))
+    pk_ind, _ = scipy.signal.find_peaks(values.copy(), distance=peak_separation)
+    counts[0] = count_over_thresholds(values[pk_ind], thresholds)
+    counts[1] = count_over_thresholds(values, thresholds)
+    for ii, keys in enumerate(group_keys):
+        counts[2 + ii] = count_over_thresholds(group_max(values, keys), thresholds)
+    return counts
@@ -0,0 +1,359 @@
+"""
+Columnar parsing of whitespace delimited ASCII tide gauge files (GESLA, BODC
+and tide table HLW files) into NumPy arrays.
+
+Data lines are read in one go as bytes (for sorted files, optionally only up to
+an end key, so a short window at the start of a long file is read quickly). When every data line has the same
+length (as for GESLA and most BODC and HLW files), the file is viewed as a 2D
+character array and columns are cut out by position, without splitting lines
+in Python. Otherwise the pandas C parser is used. Columns are returned as
+fixed width byte string arrays, which are converted to numbers, flags and
+datetimes with vectorised operations.
+
+*Methods Overview*
+    -> read_header_lines(): First lines of a file, cached until the file changes
+    -> header_stream(): Header lines as a file-like object
+    -> count_header_lines(): Number of lines before the first data line
+    -> read_columns(): Data columns as byte string arrays
+    -> parse_datetimes(): Date and time columns to datetime64[ns]
+    -> split_flags(): Numbers with trailing alphabetic flags to (values, flags)
+    -> date_mask(): Boolean mask of times between two dates
+"""
+
+import io
+import os
+import re
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .logging_util import debug
+
+_header_cache = OrderedDict()
+_header_cache_size = 64
+
+# Number of bytes read at a time when reading up to an end key (see read_columns())
+_read_block_size = 1 << 24
+
+# Field widths of supported strftime codes for zero padded dates and times
+_field_widths = {"Y": 4, "m": 2, "d": 2, "H": 2, "M": 2, "S": 2}
+
+
+def read_header_lines(fn, n_lines: int) -> list:
+    """
+    Returns the first n_lines lines of a file as strings (including newlines).
+    Results are cached against the file's size and modification time, so
+    repeated reads of an unchanged file do not reopen it.
+    """
+    stat = os.stat(fn)
+    key = (os.path.abspath(fn), stat.st_size, stat.st_mtime_ns, n_lines)
+    if key in _header_cache:
+        _header_cache.move_to_end(key)
+        return _header_cache[key]
+    lines = []
+    with open(fn) as fid:
+        for _ in range(n_lines):
+            line = fid.readline()
+            if not line:
+                break
+            lines.append(line)
+    _header_cache[key] = lines
+    while len(_header_cache) > _header_cache_size:
+        _header_cache.popitem(last=False)
+    return lines
+
+
+def header_stream(fn, n_lines: int) -> io.StringIO:
+    """Returns the first n_lines lines of a file as a file-like object (see read_header_lines())."""
+    return io.StringIO("".join(read_header_lines(fn, n_lines)))
+
+
+def count_header_lines(fn, data_pattern: str, max_lines: int = 200) -> int:
+    """
+    Returns the number of lines before the first line matching the regular
+    expression data_pattern, searching at most max_lines lines.
+    """
+    pattern = re.compile(data_pattern)
+    for n_header, line in enumerate(read_header_lines(fn, max_lines)):
+        if pattern.match(line):
+            return n_header
+    raise ValueError(f"No data lines found in the first {max_lines} lines of {fn}")
+
+
+def read_columns(fn, skiprows: int = 0, comment: str = "#", end_key: bytes = None) -> list:
+    """
+    Reads whitespace delimited data from a file into a list of columns.
+
+    Args:
+        fn (str): Path to file.
+        skiprows (int): Number of header lines to skip.
+        comment (str): Lines (or the remainder of lines) after this character are ignored.
+        end_key (bytes): For files with lines in sorted order (e.g. starting with a
+                         zero padded timestamp), reading stops at the first line that
+                         compares greater than end_key (see _read_until()).
+
+    Returns:
+        List of 1D byte string arrays, one per column. Values may be padded
+        with spaces.
+    """
+    with open(fn, "rb") as fid:
+        buffer = fid.read() if end_key is None else _read_until(fid, end_key)
+    offset = 0
+    for _ in range(skiprows):
+        offset = buffer.find(b"\n", offset) + 1
+        if offset == 0:
+            return []
+    data = np.frombuffer(buffer, dtype=np.uint8, offset=offset)
+    if comment.encode() not in buffer[offset:]:
+        columns = _read_fixed_width_columns(data)
+        if columns is not None:
+            return columns
+
+    debug(f"{fn} does not have fixed width lines. Reading with pandas.")
+    table = pd.read_csv(
+        io.BytesIO(buffer[offset:]), sep=r"\s+", header=None, comment=comment, dtype=str, skip_blank_lines=True
+    )
+    return [table[col].values.astype("S") for col in table.columns]
+
+
+def _read_until(fid, end_key: bytes, block_size: int = None) -> bytes:
+    """
+    Reads a file in blocks up to (not including) the first line whose leading
+    bytes are greater than end_key, assuming lines are in sorted order. Reading
+    stops at the first block whose last complete line is past end_key.
+    """
+    block_size = _read_block_size if block_size is None else block_size
+    blocks = []
+    n_read = 0
+    search_from = 0  # Start of a line known not to be past end_key
+    while True:
+        block = fid.read(block_size)
+        if not block:
+            break
+        blocks.append(block)
+        end = block.rfind(b"\n")
+        start = block.rfind(b"\n", 0, max(end, 0)) + 1
+        n_read += len(block)
+        if end <= 0 or (start == 0 and len(blocks) > 1):
+            continue  # No complete line within this block
+        if block[start:end][: len(end_key)] > end_key:
+            break
+        search_from = n_read - len(block) + start
+    buffer = b"".join(blocks)
+
+    # Bisect for the first line past end_key, after the last line checked
+    data = np.frombuffer(buffer, dtype=np.uint8, offset=search_from)
+    starts = search_from + np.concatenate(([0], np.flatnonzero(data == ord("\n")) + 1))
+    lo, hi = 0, len(starts)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if buffer[starts[mid] : starts[mid] + len(end_key)] > end_key:
+            hi = mid
+        else:
+            lo = mid + 1
+    return buffer if lo == len(starts) else buffer[: starts[lo]]
+
+
+def _read_fixed_width_columns(data):
+    """
+    Cuts columns out of data lines of equal length by position. Returns None
+    if the lines are not all the same length or the columns do not line up.
+    """
+    if len(data) == 0:
+        return None
+    if data[-1] != ord("\n"):
+        data = np.append(data, np.uint8(ord("\n")))
+    line_length = np.argmax(data[:65536] == ord("\n")) + 1
+    n_lines = len(data) // line_length
+    if len(data) % line_length != 0 or np.count_nonzero(data == ord("\n")) != n_lines:
+        return None
+    if np.any(data[line_length - 1 :: line_length] != ord("\n")):
+        return None
+    chars = data.reshape(n_lines, line_length)[:, :-1]
+    is_text = chars > ord(" ")
+
+    # Columns are runs of positions that are non-space in any line
+    used = np.any(is_text, axis=0)
+    edges = np.diff(np.concatenate(([0], used.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    n_columns = len(starts)
+
+    # Each line must have exactly one token within each column. Tokens never
+    # span two columns, so check that the k-th token of every line starts
+    # within the k-th column.
+    token_start = np.empty_like(is_text)
+    token_start[:, 0] = is_text[:, 0]
+    np.greater(is_text[:, 1:], is_text[:, :-1], out=token_start[:, 1:])
+    token_ind = np.flatnonzero(token_start)
+    if n_columns == 0 or len(token_ind) != n_lines * n_columns:
+        return None
+    line_ind, token_pos = np.divmod(token_ind.reshape(n_lines, n_columns), chars.shape[1])
+    if np.any(line_ind != np.arange(n_lines)[:, None]) or np.any((token_pos < starts) | (token_pos >= ends)):
+        return None
+    return [
+        np.ascontiguousarray(chars[:, start:end]).view(f"S{end - start}").ravel() for start, end in zip(starts, ends)
+    ]
+
+
+def _characters(values):
+    """Returns an (n, width) uint8 array of the characters in a byte string array, without shared padding."""
+    values = np.ascontiguousarray(np.asarray(values).astype("S"))
+    chars = values.view(np.uint8).reshape(len(values), values.dtype.itemsize)
+    if len(chars) > 0 and chars.shape[1] > 0 and np.all(chars[:, 0] > ord(" ")) and np.all(chars[:, -1] > ord(" ")):
+        return chars
+    used = np.flatnonzero(np.any(chars > ord(" "), axis=0))
+    if len(used) == 0:
+        return chars[:, :0]
+    return chars[:, used[0] : used[-1] + 1]
+
+
+def _fixed_format_fields(values, fmt):
+    """
+    Extracts integer fields from zero padded strings matching a strftime
+    format made of the codes in _field_widths and literal characters.
+    Returns None if any value does not match.
+    """
+    chars = _characters(values)
+    digits = chars - np.uint8(ord("0"))
+    fields = {}
+    pos = 0
+    ii = 0
+    while ii < len(fmt):
+        if fmt[ii] == "%":
+            code = fmt[ii + 1]
+            width = _field_widths.get(code)
+            if width is None or chars.shape[1] < pos + width or np.any(digits[:, pos : pos + width] > 9):
+                return None
+            value = digits[:, pos].astype(np.int64)
+            for jj in range(pos + 1, pos + width):
+                value = value * 10 + digits[:, jj]
+            fields[code] = value
+            pos += width
+            ii += 2
+        else:
+            if chars.shape[1] <= pos or np.any(chars[:, pos] != ord(fmt[ii])):
+                return None
+            pos += 1
+            ii += 1
+    if chars.shape[1] != pos:
+        return None
+    return fields
+
+
+def _days_since_epoch(year, month, day):
+    """Days since 1970-01-01 of proleptic Gregorian dates, with a mask of valid dates."""
+    is_leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_lengths = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+    valid = (month >= 1) & (month <= 12) & (day >= 1)
+    valid &= day <= month_lengths[np.clip(month, 1, 12) - 1] + (is_leap & (month == 2))
+    # Days from civil, counting years from March so leap days fall at year end
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468, valid
+
+
+def _fixed_format_seconds(values, fmt):
+    """
+    Seconds since 1970-01-01 (or since midnight for formats without a date)
+    of zero padded dates and/or times. Returns None if any value does not
+    match the format or is not a valid date or time.
+    """
+    fields = _fixed_format_fields(values, fmt)
+    if fields is None:
+        return None
+    hours, minutes, seconds = fields.get("H", 0), fields.get("M", 0), fields.get("S", 0)
+    valid = (hours < 24) & (minutes < 60) & (seconds < 60)
+    seconds = hours * 3600 + minutes * 60 + seconds
+    if {"Y", "m", "d"} <= fields.keys():
+        days, valid_date = _days_since_epoch(fields["Y"], fields["m"], fields["d"])
+        valid &= valid_date
+        seconds = seconds + days * 86400
+    elif fields.keys() & {"Y", "m", "d"}:
+        return None
+    return seconds if np.all(valid) else None
+
+
+def parse_datetimes(date, time=None, date_format: str = "%Y/%m/%d", time_format: str = "%H:%M:%S"):
+    """
+    Converts date (and optionally time) columns to a datetime64[ns] array.
+
+    Zero padded values are converted arithmetically, once per run of
+    repeated dates. Anything else is passed to pd.to_datetime() with the
+    combined format.
+
+    Args:
+        date (array): Dates as strings or byte strings.
+        time (array): Times as strings or byte strings.
+        date_format (str): strftime format of dates, e.g. "%d/%m/%Y".
+        time_format (str): strftime format of times, e.g. "%H:%M".
+
+    Returns:
+        np.ndarray of datetime64[ns]
+    """
+    date = np.asarray(date)
+    if len(date) == 0:
+        return np.array([], dtype="datetime64[ns]")
+
+    # Records are usually in time order, with many on each day
+    new_date = np.flatnonzero(np.concatenate(([True], date[1:] != date[:-1])))
+    seconds = _fixed_format_seconds(date[new_date], date_format)
+    if seconds is not None:
+        seconds = np.repeat(seconds, np.diff(np.append(new_date, len(date))))
+        if time is not None:
+            time_seconds = _fixed_format_seconds(time, time_format)
+            seconds = None if time_seconds is None else seconds + time_seconds
+    if seconds is not None:
+        return (seconds * 1000000000).astype("datetime64[ns]")
+
+    debug("Dates are not zero padded. Parsing with pandas.")
+    text = np.char.strip(date.astype(str))
+    datetime_format = date_format
+    if time is not None:
+        text = np.char.add(np.char.add(text, " "), np.char.strip(np.asarray(time).astype(str)))
+        datetime_format = date_format + " " + time_format
+    return pd.to_datetime(text, format=datetime_format).values.astype("datetime64[ns]")
+
+
+def split_flags(values):
+    """
+    Splits numbers with an optional trailing alphabetic flag, e.g. "5.354M".
+
+    Args:
+        values (array): Byte string (or string) numbers.
+
+    Returns:
+        Tuple of (float array of values, str array of flags). Values without
+        a flag have an empty string flag.
+    """
+    chars = _characters(values)
+    if len(chars) == 0:
+        return np.array([], dtype=float), np.array([], dtype="<U1")
+    rows = np.arange(len(chars))
+    last_ind = np.full(len(chars), chars.shape[1] - 1)
+    if not np.all(chars[:, -1] > ord(" ")):
+        last_ind -= np.argmax(chars[:, ::-1] > ord(" "), axis=1)
+    last = chars[rows, last_ind]
+    lower = last | 0x20
+    is_flag = (lower >= ord("a")) & (lower <= ord("z"))
+    numbers = np.ascontiguousarray(chars)
+    if np.any(is_flag):
+        numbers = numbers.copy()
+        numbers[rows[is_flag], last_ind[is_flag]] = ord(" ")
+    numbers = numbers.view(f"S{chars.shape[1]}").ravel().astype(float)
+    flags = np.where(is_flag, last, 0).astype(np.uint8).view("S1").astype("<U1")
+    return numbers, flags
+
+
+def date_mask(time, date_start=None, date_end=None):
+    """Returns a boolean mask of times between date_start and date_end (inclusive). None means unbounded."""
+    keep = np.ones(len(time), dtype=bool)
+    if date_start is not None:
+        keep &= time >= np.datetime64(date_start)
+    if date_end is not None:
+        keep &= time <= np.datetime64(date_end)
+    return keep
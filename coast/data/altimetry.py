@@ -210,16 +210,24 @@ class Altimetry(Track):
         obs_lon = np.array(self.dataset.longitude).flatten()
         obs_lat = np.array(self.dataset.latitude).flatten()
 
-        interpolated = model.interpolate_in_space(mod_var, obs_lon, obs_lat)
-
-        # Interpolate in time if t_dim exists in model array
-        if "t_dim" in mod_var.dims:
-            interpolated = model.interpolate_in_time(interpolated, self.dataset.time, interp_method=time_interp)
-            # Take diagonal from interpolated array (which contains too many points)
-            diag_len = interpolated.shape[0]
-            diag_ind = xr.DataArray(np.arange(0, diag_len))
-            interpolated = interpolated.isel(interp_dim=diag_ind, t_dim=diag_ind)
-            interpolated = interpolated.swap_dims({"dim_0": "t_dim"})
+        # Interpolate in space and time. For nearest and linear time
+        # interpolation, this is done point-wise at each observation
+        if "t_dim" in mod_var.dims and time_interp in ["nearest", "linear"]:
+            interpolated = model.interpolate_in_space_and_time(
+                mod_var, obs_lon, obs_lat, self.dataset.time.values, time_interp=time_interp
+            )
+            interpolated = interpolated.rename({"interp_dim": "t_dim"})
+        else:
+            interpolated = model.interpolate_in_space(mod_var, obs_lon, obs_lat)
+
+            # Interpolate in time if t_dim exists in model array
+            if "t_dim" in mod_var.dims:
+                interpolated = model.interpolate_in_time(interpolated, self.dataset.time, interp_method=time_interp)
+                # Take diagonal from interpolated array (which contains too many points)
+                diag_len = interpolated.shape[0]
+                diag_ind = xr.DataArray(np.arange(0, diag_len))
+                interpolated = interpolated.isel(interp_dim=diag_ind, t_dim=diag_ind)
+                interpolated = interpolated.swap_dims({"dim_0": "t_dim"})
 
         # Store interpolated array in dataset
         new_var_name = "interp_" + mod_var_name
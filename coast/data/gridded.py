@@ -1,4 +1,5 @@
 """Gridded class"""
+import copy
 import os.path as path_lib
 import re
 import warnings
@@ -6,16 +7,168 @@ import warnings
 # from dask import delayed, compute, visualize
 # import graphviz
 import gsw
+import dask
+import dask.array as da
 import numpy as np
 import xarray as xr
 
-from .._utils import general_utils, stats_util
+from .._utils import general_utils, stats_util, spatial_index, domain_cache
 from .coast import Coast
 from .config_parser import ConfigParser
 from .._utils.logging_util import get_slug, debug, info, warn, error, warning
 import pandas as pd
 
 
+def _wet_mask(top_level, bottom_level, n_z: int) -> xr.DataArray:
+    """
+    Returns a lazy (z_dim, y_dim, x_dim) boolean DataArray, True at (1-based)
+    levels k where top_level <= k <= bottom_level.
+    """
+    levels = xr.DataArray(np.arange(1, n_z + 1), dims="z_dim")
+    top = xr.DataArray(np.asarray(top_level), dims=["y_dim", "x_dim"]).chunk()
+    bottom = xr.DataArray(np.asarray(bottom_level), dims=["y_dim", "x_dim"]).chunk()
+    return (levels <= bottom) & (levels >= top)
+
+
+def _drop_coords(array: xr.DataArray) -> xr.DataArray:
+    """Returns a DataArray without its coordinates, so that it broadcasts by dimension name only."""
+    return array.drop_vars(list(array.coords))
+
+
+def _apply_gsw(func, *args) -> xr.DataArray:
+    """Applies a GSW function to DataArrays (or scalars) block by block, lazily if any are dask-backed."""
+    return xr.apply_ufunc(func, *args, dask="parallelized", output_dtypes=[np.float64])
+
+
+def _e3_on_face(e3_dt, e1e2, e1e2_face, e3_0_face, bottom_level, dim: str) -> xr.DataArray:
+    """
+    Vertical scale factors on a face between neighbouring points along dim (x_dim
+    for u from t, y_dim for v from t and f from u). e3_dt is the change in scale
+    factor at those points, e1e2 and e1e2_face are horizontal cell areas. Corrections
+    are area weighted means over the two neighbours, zero where the second neighbour
+    is unchanged or below the bottom level. The last face along dim is unchanged.
+    """
+    e3_dt_next = e3_dt.shift({dim: -1})
+    e3_face = (0.5 / e1e2_face) * ((e1e2 * e3_dt) + (e1e2.shift({dim: -1}) * e3_dt_next))
+    e3_face = e3_face.where(e3_dt_next != 0, 0)
+    e3_face = e3_face.where(xr.DataArray(np.arange(e3_dt.sizes["z_dim"]), dims="z_dim") < bottom_level, 0)
+    e3_face = e3_face + e3_0_face
+    last = xr.DataArray(np.arange(e3_dt.sizes[dim]), dims=dim) == e3_dt.sizes[dim] - 1
+    return e3_face.where(~last, e3_0_face).transpose("t_dim", "z_dim", "y_dim", "x_dim")
+
+
+def _grid_mask(wet: xr.DataArray, grid_ref: str) -> xr.DataArray:
+    """
+    Wet points on grid_ref from the t-grid wet mask (see _wet_mask()). u, v and f
+    points are wet where all of the t points around them are. w points share the
+    horizontal position and level number of the t points.
+    """
+    if grid_ref in ["u-grid", "f-grid"]:
+        wet = wet & wet.shift(x_dim=-1, fill_value=False)
+    if grid_ref in ["v-grid", "f-grid"]:
+        wet = wet & wet.shift(y_dim=-1, fill_value=False)
+    return wet
+
+
+# Time zero depths on each grid: grid_ref -> (variable name in the domain dataset, scale factors used)
+_timezero_depths = {
+    "t-grid": ("deptht_0", "e3w_0"),
+    "u-grid": ("depthu_0", "e3w_0"),
+    "v-grid": ("depthv_0", "e3w_0"),
+    "f-grid": ("depthf_0", "e3w_0"),
+    "w-grid": ("depthw_0", "e3t_0"),
+}
+
+
+def _timezero_depth(dataset_domain: xr.Dataset, grid_ref: str) -> xr.DataArray:
+    """
+    Lazy (dask) depths at time zero on grid_ref from the domain scale factors. t points are
+    half of e3w_0 below the surface at the first level and e3w_0 apart below that. u, v and f
+    points use the mean of e3w_0 over their neighbouring t points, and are zero in the last
+    column and/or row. w points start at the surface and are e3t_0 apart. Domain variables
+    that are not already dask arrays are chunked, with all levels in one chunk.
+    """
+    name, e3_name = _timezero_depths[grid_ref]
+    e3 = getattr(dataset_domain, e3_name).squeeze()
+    if e3.chunks is None:
+        e3 = e3.chunk({dim: -1 if dim == "z_dim" else "auto" for dim in e3.dims})
+    e3 = e3.data
+
+    if grid_ref == "w-grid":
+        depth = da.concatenate([da.zeros_like(e3[:1]), da.cumsum(e3, axis=0)[:-1]], axis=0)
+    else:
+        if grid_ref == "u-grid":
+            e3 = 0.5 * (e3[:, :, :-1] + e3[:, :, 1:])
+        elif grid_ref == "v-grid":
+            e3 = 0.5 * (e3[:, :-1, :] + e3[:, 1:, :])
+        elif grid_ref == "f-grid":
+            e3 = 0.25 * (e3[:, :-1, :-1] + e3[:, :-1, 1:] + e3[:, 1:, :-1] + e3[:, 1:, 1:])
+        top = 0.5 * e3[:1]
+        depth = da.concatenate([top, top + da.cumsum(e3[1:], axis=0)], axis=0)
+        if grid_ref in ["u-grid", "f-grid"]:
+            depth = da.concatenate([depth, da.zeros_like(depth[:, :, :1])], axis=2)
+        if grid_ref in ["v-grid", "f-grid"]:
+            depth = da.concatenate([depth, da.zeros_like(depth[:, :1, :])], axis=1)
+
+    return xr.DataArray(
+        depth,
+        dims=["z_dim", "y_dim", "x_dim"],
+        attrs={"units": "m", "standard_name": "Depth at time zero on the {}".format(grid_ref)},
+    )
+
+
+# First derivative stencils on the Arakawa C-grid: (grid, dim) -> (target grid, forward, sign).
+# Forward differences place the result between points i and i+1 (e.g. t to u), backward
+# differences between points i-1 and i. The level index k increases downwards, so the
+# sign of vertical derivatives (wrt z, positive upwards) is reversed.
+_stencils = {
+    ("t-grid", "x_dim"): ("u-grid", True, 1),
+    ("u-grid", "x_dim"): ("t-grid", False, 1),
+    ("v-grid", "x_dim"): ("f-grid", True, 1),
+    ("f-grid", "x_dim"): ("v-grid", False, 1),
+    ("t-grid", "y_dim"): ("v-grid", True, 1),
+    ("v-grid", "y_dim"): ("t-grid", False, 1),
+    ("u-grid", "y_dim"): ("f-grid", True, 1),
+    ("f-grid", "y_dim"): ("u-grid", False, 1),
+    ("t-grid", "z_dim"): ("w-grid", False, -1),
+    ("w-grid", "z_dim"): ("t-grid", True, -1),
+}
+_scale_factors = {"x_dim": "e1", "y_dim": "e2", "z_dim": "e3_0"}
+
+
+def _stencil_difference(values: np.ndarray, axis: int, forward: bool) -> np.ndarray:
+    """
+    Differences between neighbouring values along axis, values[i + 1] - values[i] stored at
+    i if forward, or at i + 1 if not. The same shape as values, with NaN where there is no
+    neighbour.
+    """
+    diff = np.full(values.shape, np.nan, dtype=np.result_type(values.dtype, np.float32))
+    upper = [slice(None)] * values.ndim
+    lower = [slice(None)] * values.ndim
+    upper[axis] = slice(1, None)
+    lower[axis] = slice(None, -1)
+    diff[tuple(lower if forward else upper)] = values[tuple(upper)] - values[tuple(lower)]
+    return diff
+
+
+def _difference(array: xr.DataArray, dim: str, forward: bool) -> xr.DataArray:
+    """_stencil_difference() along dim of a DataArray, with halos exchanged between dask chunks."""
+    axis = array.get_axis_num(dim)
+    if isinstance(array.data, da.Array):
+        diff = da.map_overlap(
+            _stencil_difference,
+            array.data,
+            depth={axis: 1},
+            boundary="none",
+            dtype=np.result_type(array.dtype, np.float32),
+            axis=axis,
+            forward=forward,
+        )
+    else:
+        diff = _stencil_difference(array.data, axis, forward)
+    return array.copy(data=diff)
+
+
 class Gridded(Coast):  # TODO Complete this docstring
     """
     Words to describe the NEMO class
@@ -42,6 +195,9 @@ class Gridded(Coast):  # TODO Complete this docstring
         self.fn_data = fn_data
         self.fn_domain = fn_domain
         self.grid_vars = None
+        self._target_grids = {}
+        self._lookup = None
+        self._shared_domain = None
 
         if path_lib.isfile(config):
             self.config = ConfigParser(config).config
@@ -85,16 +241,14 @@ class Gridded(Coast):  # TODO Complete this docstring
             warn("No NEMO domain specified, only limited functionality" + " will be available")
         else:
             self.filename_domain = self.fn_domain  # store domain fileanme
-            dataset_domain = self.load_domain(self.fn_domain, chunks)
+            # Renamed domain, trimmed by lims and to the size of self.dataset. Shared with other grid objects.
+            dataset_domain = self._prepared_domain(chunks, lims, kwargs.get("calculate_bathymetry", False))
 
             # Define extra domain attributes using kwargs dictionary
             # This is a bit of a placeholder. Some domain/nemo files will have missing variables
             for key, value in kwargs.items():
                 dataset_domain[key] = value
 
-            dataset_domain = self.spatial_subset(dataset_domain, lims)  # Trim domain size if indices specified
-            if self.fn_data is not None:
-                dataset_domain = self.trim_domain_size(dataset_domain)  # Trim domain size if self.data is smaller
             self.set_timezero_depths(
                 dataset_domain, **kwargs
             )  # THIS ADDS TO dataset_domain. Should it be 'return'ed (as in trim_domain_size) or is implicit OK?
@@ -125,6 +279,10 @@ class Gridded(Coast):  # TODO Complete this docstring
     # TODO Add parameter type hints and a docstring
     def load_domain(self, fn_domain, chunks):  # TODO Do something with this unused parameter or remove it
         """Loads domain file and renames dimensions with dim_mapping_domain"""
+        return self._rename_domain_vars(self._open_domain(fn_domain))
+
+    def _open_domain(self, fn_domain):
+        """Opens the domain file and renames its dimensions. Variables keep their names in the file."""
         # Load xarray dataset
         info(f'Loading domain: "{fn_domain}"')
         dataset_domain = xr.open_dataset(fn_domain)
@@ -139,8 +297,17 @@ class Gridded(Coast):  # TODO Complete this docstring
                     f"{get_slug(self)}: Problem renaming domain dimension from {get_slug(self.dataset)}: {key} -> {value}."
                     f"{chr(10)}Error message of '{err}'"
                 )
-        # Rename domain variables.
+        return dataset_domain
+
+    def _rename_domain_vars(self, dataset_domain):
+        """
+        Renames domain variables for this grid. Calculated time zero depths keep their names, as they
+        are looked up by them (see copy_domain_vars_to_dataset).
+        """
+        depths = [name for name, _ in _timezero_depths.values()]
         for key, value in self.config.domain.variable_map.items():
+            if key in depths:
+                continue
             mapping = {key: value}
             try:
                 dataset_domain = dataset_domain.rename_vars(mapping)
@@ -151,6 +318,52 @@ class Gridded(Coast):  # TODO Complete this docstring
                 )
         return dataset_domain
 
+    def _prepared_domain(self, chunks, lims, wet_mask=False):
+        """
+        Returns the domain from fn_domain, renamed, subset with lims and (if there is data) trimmed to
+        the size of self.dataset, with lazy time zero depths for this grid. The opened domain, with its
+        dimensions renamed and subset with lims, is kept in the domain cache (see
+        coast._utils.domain_cache) and shared by all grid objects built from the same file, whatever
+        their grid. Variables are renamed for this grid after the lookup, without copying the arrays.
+        Depths are added to the cached domain by the first object on each grid and shared after that.
+        If wet_mask, the wet mask used by calc_bathymetry() is computed once and shared in the same way.
+        """
+        depths = [name for name, _ in _timezero_depths.values()]
+        key = domain_cache.domain_key(self.fn_domain, tuple(self.config.domain.dimension_map.items()), tuple(lims))
+        # Depths in the file are replaced by ones calculated from the scale factors
+        shared = domain_cache.get_domain(
+            key,
+            lambda: self.spatial_subset(self._open_domain(self.fn_domain), lims).drop_vars(depths, errors="ignore"),
+        )
+        self.domain_loaded = True
+        dataset_domain = self._rename_domain_vars(shared)
+        if self.fn_data is not None:
+            trim = self._domain_trim_indices(dataset_domain)
+            if trim is not None:
+                j0, j1, i0, i1 = trim
+                # Depths are recalculated on the trimmed domain, as the last u, v and f points are zero
+                trimmed = shared.drop_vars(depths, errors="ignore").isel(
+                    y_dim=slice(j0, j1 + 1), x_dim=slice(i0, i1 + 1)
+                )
+                key = key + (trim,)
+                shared = domain_cache.get_domain(key, lambda: trimmed)
+                dataset_domain = self._rename_domain_vars(shared)
+        self._shared_domain = shared
+
+        if self.grid_ref in _timezero_depths:
+            name, e3_name = _timezero_depths[self.grid_ref]
+            if name not in shared and e3_name in shared:
+                dataset_domain[name] = domain_cache.add_variable(key, name, _timezero_depth(shared, self.grid_ref))
+        if wet_mask and "wet_mask" not in shared:
+            if all(var in dataset_domain for var in ["top_level", "bottom_level", "e3_0"]):
+                wet = _wet_mask(
+                    dataset_domain.top_level.squeeze(),
+                    dataset_domain.bottom_level.squeeze(),
+                    dataset_domain.e3_0.squeeze().shape[0],
+                )
+                dataset_domain["wet_mask"] = domain_cache.add_variable(key, "wet_mask", wet.compute())
+        return dataset_domain
+
     def merge_domain_into_dataset(self, dataset_domain):
         """Merge domain dataset variables into self.dataset, using grid_ref"""
         debug(f"Merging {get_slug(dataset_domain)} into {get_slug(self)}")
@@ -198,7 +411,8 @@ class Gridded(Coast):  # TODO Complete this docstring
         """
         Calculates the depths at time zero (from the domain_cfg input file)
         for the appropriate grid.
-        The depths are assigned to domain_dataset.depth_0
+        The depths are assigned to domain_dataset.depth_0 as a dask array, so
+        they are only computed when used.
 
         Args:
             dataset_domain: a complex data object.
@@ -214,7 +428,8 @@ class Gridded(Coast):  # TODO Complete this docstring
             if calculate_bathymetry:  # calculate bathymetry from scale factors
                 bathymetry, mask, time_mask = self.calc_bathymetry(dataset_domain)
             else:
-                bathymetry = dataset_domain.bathy_metry.squeeze()
+                # A copy, as it is modified in place below and the domain may be shared with other grids
+                bathymetry = dataset_domain.bathy_metry.squeeze().copy()
 
         except AttributeError as err:
             bathymetry = xr.zeros_like(dataset_domain.e1.squeeze())
@@ -234,55 +449,26 @@ class Gridded(Coast):  # TODO Complete this docstring
             )
 
         try:
-            if self.grid_ref == "t-grid":
-                e3w_0 = np.squeeze(dataset_domain.e3w_0.values)
-                depth_0 = np.zeros_like(e3w_0)
-                depth_0[0, :, :] = 0.5 * e3w_0[0, :, :]
-                depth_0[1:, :, :] = depth_0[0, :, :] + np.cumsum(e3w_0[1:, :, :], axis=0)
-
-            elif self.grid_ref == "w-grid":
-                e3t_0 = np.squeeze(dataset_domain.e3t_0.values)
-                depth_0 = np.zeros_like(e3t_0)
-                depth_0[0, :, :] = 0.0
-                depth_0[1:, :, :] = np.cumsum(e3t_0, axis=0)[:-1, :, :]
-
-            elif self.grid_ref == "u-grid":
-                e3w_0 = dataset_domain.e3w_0.values.squeeze()
-                e3w_0_on_u = 0.5 * (e3w_0[:, :, :-1] + e3w_0[:, :, 1:])
-                depth_0 = np.zeros_like(e3w_0)
-                depth_0[0, :, :-1] = 0.5 * e3w_0_on_u[0, :, :]
-                depth_0[1:, :, :-1] = depth_0[0, :, :-1] + np.cumsum(e3w_0_on_u[1:, :, :], axis=0)
-                if not calculate_bathymetry:  # jth only valid for pure sigma
-                    bathymetry[:, :-1] = 0.5 * (bathymetry[:, :-1] + bathymetry[:, 1:])
+            if self.grid_ref not in _timezero_depths:
+                raise ValueError(str(self) + ": " + self.grid_ref + " depth calculation not implemented")
 
-            elif self.grid_ref == "v-grid":
-                e3w_0 = dataset_domain.e3w_0.values.squeeze()
-                e3w_0_on_v = 0.5 * (e3w_0[:, :-1, :] + e3w_0[:, 1:, :])
-                depth_0 = np.zeros_like(e3w_0)
-                depth_0[0, :-1, :] = 0.5 * e3w_0_on_v[0, :, :]
-                depth_0[1:, :-1, :] = depth_0[0, :-1, :] + np.cumsum(e3w_0_on_v[1:, :, :], axis=0)
-                if not calculate_bathymetry:
-                    bathymetry[:-1, :] = 0.5 * (bathymetry[:-1, :] + bathymetry[1:, :])
+            # Write the (lazy) depth_0 variable to the domain_dataset DataSet, with grid type. Domains from
+            # the domain cache already have it, shared with other grids on the same domain.
+            name = _timezero_depths[self.grid_ref][0]
+            standard_name = "Depth at time zero on the {}".format(self.grid_ref)
+            if name not in dataset_domain or dataset_domain[name].attrs.get("standard_name") != standard_name:
+                dataset_domain[name] = _timezero_depth(dataset_domain, self.grid_ref)
 
-            elif self.grid_ref == "f-grid":
-                e3w_0 = dataset_domain.e3w_0.values.squeeze()
-                e3w_0_on_f = 0.25 * (e3w_0[:, :-1, :-1] + e3w_0[:, :-1, 1:] + e3w_0[:, 1:, :-1] + e3w_0[:, 1:, 1:])
-                depth_0 = np.zeros_like(e3w_0)
-                depth_0[0, :-1, :-1] = 0.5 * e3w_0_on_f[0, :, :]
-                depth_0[1:, :-1, :-1] = depth_0[0, :-1, :-1] + np.cumsum(e3w_0_on_f[1:, :, :], axis=0)
-                if not calculate_bathymetry:
+            if not calculate_bathymetry:  # jth only valid for pure sigma
+                if self.grid_ref == "u-grid":
+                    bathymetry[:, :-1] = 0.5 * (bathymetry[:, :-1] + bathymetry[:, 1:])
+                elif self.grid_ref == "v-grid":
+                    bathymetry[:-1, :] = 0.5 * (bathymetry[:-1, :] + bathymetry[1:, :])
+                elif self.grid_ref == "f-grid":
                     bathymetry[:-1, :-1] = 0.25 * (
                         bathymetry[:-1, :-1] + bathymetry[:-1, 1:] + bathymetry[1:, :-1] + bathymetry[1:, 1:]
                     )
-            else:
-                raise ValueError(str(self) + ": " + self.grid_ref + " depth calculation not implemented")
 
-            # Write the depth_0 variable to the domain_dataset DataSet, with grid type
-            dataset_domain[f"depth{self.grid_ref.replace('-grid', '')}_0"] = xr.DataArray(
-                depth_0,
-                dims=["z_dim", "y_dim", "x_dim"],
-                attrs={"units": "m", "standard_name": "Depth at time zero on the {}".format(self.grid_ref)},
-            )
             self.dataset["bathymetry"] = xr.DataArray(
                 bathymetry,
                 dims=["y_dim", "x_dim"],
@@ -303,51 +489,40 @@ class Gridded(Coast):  # TODO Complete this docstring
         Works with z-coordinates on u- and v- faces where bathymetry is defined
         at the top of the cliff, not at the bottom
 
+        The wet mask (time_mask) is built from top_level and bottom_level with one
+        broadcast comparison (see _wet_mask()). Domains prepared for grid objects
+        created with calculate_bathymetry=True carry it as wet_mask, computed once
+        and shared by all grids on the same domain.
+
         Args:
             dataset_domain: a complex data object.
 
         """
-        # jth not set for lazy loading
-
         e3_0 = dataset_domain.e3_0.squeeze()
-        time_mask = xr.zeros_like(e3_0)
-        bottom_level = dataset_domain.bottom_level.values.squeeze()
+        bottom_level = dataset_domain.bottom_level.squeeze()
         debug(f"Bottom_level type {type(bottom_level)}")
-        top_level = dataset_domain.top_level.values.squeeze()
-        bathymetry = np.zeros_like(bottom_level)  # np.array([[]])
+        if "wet_mask" in dataset_domain:
+            wet = dataset_domain.wet_mask
+        else:
+            wet = _wet_mask(dataset_domain.top_level.squeeze(), bottom_level, e3_0.shape[0])
+        time_mask = wet.astype(e3_0.dtype)
         mask = None
 
-        for k in range(1, e3_0.shape[0] + 1):
-            time_mask[k - 1, :, :] = np.logical_and(k <= bottom_level, k >= top_level)
-
-        if self.grid_ref == "t-grid":
-            e3t = dataset_domain.e3_0.squeeze()
-            bathymetry[:, :] = np.sum(e3t.values * time_mask.values, axis=0)
-
-        elif self.grid_ref == "w-grid":
-            e3t = dataset_domain.e3t_0.squeeze()
-            bathymetry[:, :] = np.sum(e3t.values * time_mask.values, axis=0)
-
-        elif self.grid_ref == "u-grid":
-            e3u = dataset_domain.e3u_0.squeeze()
-            mask = xr.zeros_like(e3u)
-            mask[:, :, :-1] = time_mask[:, :, :-1] * time_mask[:, :, 1:]
-            bathymetry[:, :] = np.sum(e3u.values * mask.values, axis=0)
-
-        elif self.grid_ref == "v-grid":
-            e3v = dataset_domain.e3v_0.squeeze()
-            mask = xr.zeros_like(e3v)
-            mask[:, :-1, :] = time_mask[:, :-1, :] * time_mask[:, 1:, :]
-            bathymetry[:, :] = np.sum(e3v.values * mask.values, axis=0)
-
-        elif self.grid_ref == "f-grid":
-            e3f = dataset_domain.e3_0.squeeze()
-            mask = xr.zeros_like(e3f)
-            mask[:, :-1, :-1] = (
-                time_mask[:, :-1, :-1] * time_mask[:, :-1, 1:] * time_mask[:, 1:, :-1] * time_mask[:, 1:, 1:]
-            )
-            bathymetry[:, :] = np.sum(e3f.values * mask.values, axis=0)
-
+        # f-grid bathymetry uses the t-grid scale factors
+        e3_names = {"t-grid": "e3_0", "w-grid": "e3t_0", "u-grid": "e3u_0", "v-grid": "e3v_0", "f-grid": "e3_0"}
+        if self.grid_ref not in e3_names:
+            return np.zeros_like(bottom_level.values), mask, time_mask
+        e3 = dataset_domain[e3_names[self.grid_ref]].squeeze()
+        bathy_mask = _grid_mask(wet, self.grid_ref)
+
+        if self.grid_ref in ["u-grid", "v-grid", "f-grid"]:
+            mask = bathy_mask.astype(e3.dtype)
+
+        # name=False skips hashing the scale factors, which takes longer than the sum
+        e3 = e3.data
+        if not isinstance(e3, da.Array):
+            e3 = da.from_array(e3, chunks=(-1, "auto", -1), name=False)
+        bathymetry = (e3 * bathy_mask.data).sum(axis=0).astype(bottom_level.dtype)
         return bathymetry, mask, time_mask
 
     # Add subset method to NEMO class
@@ -361,11 +536,64 @@ class Gridded(Coast):  # TODO Complete this docstring
         :return: list of y indices, list of x indices,
         """
         debug(f"Subsetting {get_slug(self)} indices from {start} to {end}")
-        [j1, i1] = self.find_j_i(lat=start[0], lon=start[1])  # lat , lon
-        [j2, i2] = self.find_j_i(lat=end[0], lon=end[1])  # lat , lon
+        [j, i, _] = self.nearest_j_i(lat=[start[0], end[0]], lon=[start[1], end[1]])
+        [j1, j2], [i1, i2] = j, i
 
         return list(np.arange(j1, j2 + 1)), list(np.arange(i1, i2 + 1))
 
+    def nearest_j_i(self, *, lat, lon, n_nn: int = 1, dataset: xr.Dataset = None):
+        """
+        Finds the nearest grid points (by great circle distance) to one or more
+        latitude and longitude values. This is the lookup used by find_j_i,
+        find_j_i_list, find_j_i_domain, transect_indices and subset_indices.
+        The spatial index for a grid is built once and reused for later queries.
+        Usage: [y,x,dist] = nemo.nearest_j_i(lat=[49,50,51], lon=[-12,-11,10])
+
+        :param lat: latitude (scalar or array)
+        :param lon: longitude (scalar or array)
+        :optional n_nn=1 number of nearest neighbours
+        :optional dataset: dataset with longitude and latitude to search, e.g. a
+            domain dataset. Defaults to this object's dataset.
+        :return: arrays of y indices, x indices and great circle distances (km),
+            of shape (n,) or (n, n_nn) if n_nn > 1. NaN locations are given
+            indices 0 and distance NaN.
+        """
+        index = self._lookup_index(dataset)
+        dist, (j, i) = index.query(lon, lat, k=n_nn)
+        dist = dist * 6371
+        if n_nn == 1:
+            j, i, dist = j[:, 0], i[:, 0], dist[:, 0]
+        missing = np.isnan(np.array(lon, dtype=float).flatten())
+        j[missing] = 0
+        i[missing] = 0
+        return [j, i, dist]
+
+    def _lookup_index(self, dataset: xr.Dataset = None) -> spatial_index.SpatialIndex:
+        """
+        The spatial index over the horizontal grid of a dataset (default: this
+        object's dataset). Leading dimensions other than y_dim and x_dim (e.g.
+        t_dim in a domain file) are dropped. The index for this object's grid
+        is kept until its longitude or latitude are replaced.
+        """
+        own_grid = dataset is None
+        if own_grid:
+            dataset = self.dataset
+        longitude, latitude = dataset["longitude"], dataset["latitude"]
+        if own_grid and self._lookup is not None:
+            lookup_lon, lookup_lat, index = self._lookup
+            if lookup_lon is longitude.variable and lookup_lat is latitude.variable:
+                return index
+
+        lon_2d, lat_2d = xr.broadcast(longitude, latitude)
+        if "y_dim" in lon_2d.dims and "x_dim" in lon_2d.dims:
+            lon_2d = lon_2d.transpose(..., "y_dim", "x_dim")
+            lat_2d = lat_2d.transpose(..., "y_dim", "x_dim")
+        extra_dims = {dim: 0 for dim in lon_2d.dims[:-2]}
+        index = spatial_index.get_spatial_index(lon_2d.isel(extra_dims), lat_2d.isel(extra_dims))
+        if own_grid:
+            self._lookup = (longitude.variable, latitude.variable, index)
+        return index
+
     def find_j_i(self, *, lat: float, lon: float):
         """
         A routine to find the nearest y x coordinates for a given latitude and longitude
@@ -376,10 +604,8 @@ class Gridded(Coast):  # TODO Complete this docstring
         :return: the y and x coordinates for the NEMO object's grid_ref, i.e. t,u,v,f,w.
         """
         debug(f"Finding j,i for {lat},{lon} from {get_slug(self)}")
-
-        dist2 = np.square(self.dataset.latitude - lat) + np.square(self.dataset.longitude - lon)
-        [y, x] = np.unravel_index(np.argmin(dist2.data), dist2.shape)
-        return [y, x]
+        [y, x, _] = self.nearest_j_i(lat=lat, lon=lon)
+        return [y[0], x[0]]
 
     def find_j_i_list(self, *, lat: float, lon: float, n_nn=1):
         """
@@ -389,21 +615,10 @@ class Gridded(Coast):  # TODO Complete this docstring
         :param lat: latitude
         :param lon: longitude
         :optional n_nn=1 number of nearest neighbours
-        :return: the j, i coordinates for the NEMO object's grid_ref, i.e. t,u,v,f,w. and a distance measure
+        :return: the j, i coordinates for the NEMO object's grid_ref, i.e. t,u,v,f,w. and the
+            great circle distance (km)
         """
-        grid_lon = self.dataset.longitude.values
-        grid_lat = self.dataset.latitude.values
-        # efficient nearest neighbour search
-        import scipy.spatial as sp
-
-        XY = np.dstack([grid_lat.ravel(), grid_lon.ravel()])[0]
-        XYp = np.dstack([lat, lon])[0]
-        mytree = sp.cKDTree(XY)
-        dist, indx = mytree.query(XYp, n_nn)
-        I = np.nonzero(np.isnan(lon))
-        indx[I] = 0
-        i, j = np.unravel_index(indx, grid_lon.shape)
-        return [i, j, dist]
+        return self.nearest_j_i(lat=lat, lon=lon, n_nn=n_nn)
 
     def find_j_i_domain(self, *, lat: float, lon: float, dataset_domain: xr.DataArray, KDTree=False):
         """
@@ -416,11 +631,8 @@ class Gridded(Coast):  # TODO Complete this docstring
         :return: the y and x coordinates for the grid_ref variable within the domain file
         """
         debug(f"Finding j,i domain for {lat},{lon} from {get_slug(self)} using {get_slug(dataset_domain)}")
-        internal_lat = dataset_domain["latitude"]  # [f"gphi{self.grid_ref.replace('-grid','')}"]
-        internal_lon = dataset_domain["longitude"]  # [f"glam{self.grid_ref.replace('-grid','')}"]
-        dist2 = np.square(internal_lat - lat) + np.square(internal_lon - lon)
-        [_, y, x] = np.unravel_index(np.argmin(dist2.data), dist2.shape)
-        return [y, x]
+        [y, x, _] = self.nearest_j_i(lat=lat, lon=lon, dataset=dataset_domain)
+        return [y[0], x[0]]
 
     def transect_indices(self, start: tuple, end: tuple) -> tuple:
         """
@@ -432,8 +644,8 @@ class Gridded(Coast):  # TODO Complete this docstring
         :return: array of y indices, array of x indices, number of indices in transect
         """
         debug(f"Fetching transect indices for {start} to {end} from {get_slug(self)}")
-        [j1, i1] = self.find_j_i(lat=start[0], lon=start[1])  # lat , lon
-        [j2, i2] = self.find_j_i(lat=end[0], lon=end[1])  # lat , lon
+        [j, i, _] = self.nearest_j_i(lat=[start[0], end[0]], lon=[start[1], end[1]])
+        [j1, j2], [i1, i2] = j, i
 
         line_length = max(np.abs(j2 - j1), np.abs(i2 - i1)) + 1
 
@@ -442,11 +654,40 @@ class Gridded(Coast):  # TODO Complete this docstring
 
         return jj1, ii1, line_length
 
+    def build_spatial_index(self, mask=None, backend: str = None):
+        """
+        Builds (or reuses) the nearest neighbour tree for this grid and
+        keeps it in the spatial index cache, so that later obs_operator and
+        interpolate_in_space calls with the same mask do not rebuild it.
+
+        Example Usage
+        ----------
+        nemo.build_spatial_index(mask=nemo.dataset.bottom_level == 0)
+        profile.obs_operator(nemo)
+
+        Parameters
+        ----------
+        mask (2D array): Mask array. Where True (or 1), elements of array will
+                     not be included. Should match the mask later passed to
+                     interpolation routines.
+        backend (str): Neighbour backend ("kdtree" or "balltree"). Defaults to
+                     spatial_index.set_default_backend().
+
+        Returns
+        -------
+        coast._utils.spatial_index.SpatialIndex
+        """
+        if mask is not None:
+            mask = np.array(mask, dtype=bool)
+        return spatial_index.get_spatial_index(
+            self.dataset.longitude, self.dataset.latitude, mask=mask, backend=backend
+        )
+
     @staticmethod
     def interpolate_in_space(model_array, new_lon, new_lat, mask=None):
         """
         Interpolates a provided xarray.DataArray in space to new longitudes
-        and latitudes using a nearest neighbour method (BallTree).
+        and latitudes using a nearest neighbour method (spatial index).
 
         Example Usage
         ----------
@@ -513,6 +754,94 @@ class Gridded(Coast):  # TODO Complete this docstring
 
         return interpolated
 
+    @staticmethod
+    def interpolate_in_space_and_time(
+        model_array, new_lon, new_lat, new_times, time_interp="nearest", mask=None, extrapolate=True, chunk_size=None
+    ):
+        """
+        Point-wise interpolation of a provided xarray.DataArray onto a set of
+        (longitude, latitude, time) points, such as along-track altimetry.
+        Space is interpolated using nearest neighbour (as interpolate_in_space).
+        Time is interpolated using general_utils.time_matching_indices(), so only
+        the model time slices either side of each point are used. Unlike
+        calling interpolate_in_space() then interpolate_in_time(), this never
+        creates an (n_points x n_points) intermediate array.
+
+        If model_array is dask-backed, the result is lazy. Use chunk_size to
+        split the points into chunks, so that each chunk is gathered from the
+        model separately when computed.
+
+        Example Usage
+        ----------
+        # Get SSH at altimetry locations and times
+        interpolated = nemo.interpolate_in_space_and_time(nemo.dataset.ssh,
+                                                          altimetry.dataset.longitude,
+                                                          altimetry.dataset.latitude,
+                                                          altimetry.dataset.time)
+        Parameters
+        ----------
+        model_array (xr.DataArray): Model variable DataArray to interpolate
+        new_lon (1Darray): Array of longitudes (degrees) to compare with model
+        new_lat (1Darray): Array of latitudes (degrees) to compare with model
+        new_times (1Darray): Array of times, one for each longitude/latitude
+        time_interp (str): 'nearest' or 'linear'
+        mask (2D array): Mask array. Where True (or 1), elements of array will
+                     not be included. For example, use to mask out land in
+                     case it ends up as the nearest point.
+        extrapolate (bool): If False, points outside of the model time range are NaN
+        chunk_size (int): Number of points per chunk. Default None is one chunk.
+
+        Returns
+        -------
+        Interpolated DataArray with dimension interp_dim
+        """
+        debug(f'Interpolating {get_slug(model_array)} in space and time with time method "{time_interp}"')
+        if time_interp not in ["nearest", "linear"]:
+            raise ValueError(f"time_interp must be 'nearest' or 'linear', not '{time_interp}'")
+
+        new_times = np.array(new_times).flatten()
+        n_pts = len(new_times)
+
+        # Nearest spatial indices and bracketing time indices for every point
+        ind_x, ind_y = general_utils.nearest_indices_2d(
+            model_array.longitude, model_array.latitude, new_lon, new_lat, mask=mask
+        )
+        ind_x = np.atleast_1d(ind_x.values)
+        ind_y = np.atleast_1d(ind_y.values)
+        ind0, ind1, weight = general_utils.time_matching_indices(
+            model_array.time.values, new_times, method=time_interp, extrapolate=extrapolate
+        )
+
+        if chunk_size is None:
+            chunk_size = max(n_pts, 1)
+
+        # With no points, one empty chunk gives an empty result of the right dimensions and type
+        interpolated = []
+        for start_ii in range(0, max(n_pts, 1), chunk_size):
+            pts = slice(start_ii, start_ii + chunk_size)
+            x_pts = xr.DataArray(ind_x[pts], dims="interp_dim")
+            y_pts = xr.DataArray(ind_y[pts], dims="interp_dim")
+            weight_pts = xr.DataArray(weight[pts], dims="interp_dim")
+
+            interp_chunk = model_array.isel(t_dim=xr.DataArray(ind0[pts], dims="interp_dim"), y_dim=y_pts, x_dim=x_pts)
+            if time_interp == "linear":
+                interp_chunk1 = model_array.isel(
+                    t_dim=xr.DataArray(ind1[pts], dims="interp_dim"), y_dim=y_pts, x_dim=x_pts
+                )
+                interp_chunk = interp_chunk + weight_pts * (interp_chunk1 - interp_chunk)
+            else:
+                interp_chunk = interp_chunk.where(~np.isnan(weight_pts))
+            interpolated.append(interp_chunk)
+
+        if len(interpolated) == 1:
+            interpolated = interpolated[0]
+        else:
+            interpolated = xr.concat(interpolated, dim="interp_dim")
+
+        # Times are now those of the new points
+        interpolated = interpolated.assign_coords(time=("interp_dim", new_times))
+        return interpolated
+
     def construct_density(
         self, eos="EOS10", rhobar=False, Zd_mask=[], CT_AS=False, pot_dens=False, Tbar=True, Sbar=True
     ):
@@ -563,91 +892,61 @@ class Gridded(Coast):  # TODO Complete this docstring
                     + ": Density calculation can only be performed for a t-grid object,\
                                  the tracer grid for NEMO."
                 )
-            No_time = False
-            try:
-                shape_ds = (
-                    self.dataset.t_dim.size,
-                    self.dataset.z_dim.size,
-                    self.dataset.y_dim.size,
-                    self.dataset.x_dim.size,
-                )
-                sal = self.dataset.salinity.to_masked_array()
-                temp = self.dataset.temperature.to_masked_array()
-            except AttributeError:
-                No_time = True
-                shape_ds = (1, self.dataset.z_dim.size, self.dataset.y_dim.size, self.dataset.x_dim.size)
-                sal = self.dataset.salinity.to_masked_array()[np.newaxis, ...]
-                temp = self.dataset.temperature.to_masked_array()[np.newaxis, ...]
-
-            density = np.ma.zeros(shape_ds)
-
-            s_levels = self.dataset.depth_0.to_masked_array()
-            lat = self.dataset.latitude.values
-            lon = self.dataset.longitude.values
+            No_time = "t_dim" not in self.dataset.dims
+
+            # Masked (NaN) values propagate through the GSW functions, which are applied
+            # chunk by chunk so that dask-backed fields stay lazy
+            sal = _drop_coords(self.dataset.salinity)
+            temp = _drop_coords(self.dataset.temperature)
+            s_levels = _drop_coords(self.dataset.depth_0)
+            lat = _drop_coords(self.dataset.latitude)
+            lon = _drop_coords(self.dataset.longitude)
             # Absolute Pressure
             if pot_dens:
                 pressure_absolute = 0.0  # calculate potential density
             else:
-                pressure_absolute = np.ma.masked_invalid(gsw.p_from_z(-s_levels, lat))  # depth must be negative
+                pressure_absolute = _apply_gsw(gsw.p_from_z, -s_levels, lat)  # depth must be negative
+            # Absolute Salinity
+            if not CT_AS:  # abs salinity not provided
+                sal_absolute = _apply_gsw(gsw.SA_from_SP, sal, pressure_absolute, lon, lat)
+            else:  # abs salinity provided
+                sal_absolute = sal
             if not rhobar:  # calculate full depth
-                # Absolute Salinity
-                if not CT_AS:  # abs salinity not provided
-                    sal_absolute = np.ma.masked_invalid(gsw.SA_from_SP(sal, pressure_absolute, lon, lat))
-                else:  # abs salinity provided
-                    sal_absolute = np.ma.masked_invalid(sal)
-                sal_absolute = np.ma.masked_less(sal_absolute, 0)
+                sal_absolute = sal_absolute.where(sal_absolute >= 0)
                 # Conservative Temperature
                 if not CT_AS:  # conservative temp not provided
-                    temp_conservative = np.ma.masked_invalid(gsw.CT_from_pt(sal_absolute, temp))
+                    temp_conservative = _apply_gsw(gsw.CT_from_pt, sal_absolute, temp)
                 else:  # conservative temp provided
-                    temp_conservative = np.ma.masked_invalid(temp)
+                    temp_conservative = temp
                 # In-situ density
-                density = np.ma.masked_invalid(gsw.rho(sal_absolute, temp_conservative, pressure_absolute))
+                density = _apply_gsw(gsw.rho, sal_absolute, temp_conservative, pressure_absolute)
                 new_var_name = "density"
             else:  # calculate with depth integrated T S
-                # prepare coordinate variables
-                if np.size(Zd_mask) == 0:
-                    DZ = self.dataset.e3_0.to_masked_array()
-                else:
-                    DZ = self.dataset.e3_0.to_masked_array() * Zd_mask
-                DP = np.sum(DZ, axis=0)
-                # DP=np.repeat(DP[np.newaxis,:,:],shape_ds[1],axis=0)
-
-                DZ = np.repeat(DZ[np.newaxis, :, :, :], shape_ds[0], axis=0)
-                DP = np.repeat(DP[np.newaxis, :, :], shape_ds[0], axis=0)
-
-                # Absolute Salinity
-                if not CT_AS:  # abs salinity not provided
-                    sal_absolute = np.ma.masked_invalid(gsw.SA_from_SP(sal, pressure_absolute, lon, lat))
-                else:  # abs salinity provided
-                    sal_absolute = np.ma.masked_invalid(sal)
-
                 # Conservative Temperature
                 if not CT_AS:  # Conservative temperature not provided
-                    temp_conservative = np.ma.masked_invalid(gsw.CT_from_pt(sal_absolute, temp))
+                    temp_conservative = _apply_gsw(gsw.CT_from_pt, sal_absolute, temp)
                 else:  # conservative temp provided
-                    temp_conservative = np.ma.masked_invalid(temp)
-
-                if pot_dens and (Sbar and Tbar):  # usual case pot_dens and depth averaged everything
-                    sal_absolute = np.sum(np.ma.masked_less(sal_absolute, 0) * DZ, axis=1) / DP
-                    temp_conservative = np.sum(np.ma.masked_less(temp_conservative, 0) * DZ, axis=1) / DP
-                    density = np.ma.masked_invalid(gsw.rho(sal_absolute, temp_conservative, pressure_absolute))
-                    density = np.repeat(density[:, np.newaxis, :, :], shape_ds[1], axis=1)
-
-                else:  # Either insitue density or one of Tbar or Sbar Flase
-                    if Sbar:
-                        sal_absolute = np.repeat(
-                            (np.sum(np.ma.masked_less(sal_absolute, 0) * DZ, axis=1) / DP)[:, np.newaxis, :, :],
-                            shape_ds[1],
-                            axis=1,
-                        )
-                    if Tbar:
-                        temp_conservative = np.repeat(
-                            (np.sum(np.ma.masked_less(temp_conservative, 0) * DZ, axis=1) / DP)[:, np.newaxis, :, :],
-                            shape_ds[1],
-                            axis=1,
-                        )
-                    density = np.ma.masked_invalid(gsw.rho(sal_absolute, temp_conservative, pressure_absolute))
+                    temp_conservative = temp
+
+                # prepare coordinate variables. Depth means are broadcast back onto
+                # every level by the GSW functions rather than repeated.
+                DZ = _drop_coords(self.dataset.e3_0)
+                if np.size(Zd_mask) != 0:
+                    DZ = DZ * Zd_mask
+                DP = DZ.sum(dim="z_dim", min_count=1)
+                DP = DP.where(DP != 0)
+
+                def depth_mean(var):
+                    # negative values are excluded from the mean, but not from the depth
+                    return (var.where(var >= 0) * DZ).sum(dim="z_dim", min_count=1) / DP
+
+                if Sbar:
+                    sal_absolute = depth_mean(sal_absolute)
+                if Tbar:
+                    temp_conservative = depth_mean(temp_conservative)
+                density = _apply_gsw(gsw.rho, sal_absolute, temp_conservative, pressure_absolute)
+                if "z_dim" not in density.dims:  # pot_dens and depth averaged everything
+                    density = density.expand_dims(z_dim=self.dataset.z_dim.size)
 
                 if Tbar and Sbar:
                     new_var_name = "density_bar"
@@ -660,9 +959,9 @@ class Gridded(Coast):  # TODO Complete this docstring
 
             # rho and rhobar
             coords = {
-                "depth_0": (("z_dim", "y_dim", "x_dim"), self.dataset.depth_0.values),
-                "latitude": (("y_dim", "x_dim"), self.dataset.latitude.values),
-                "longitude": (("y_dim", "x_dim"), self.dataset.longitude.values),
+                "depth_0": (("z_dim", "y_dim", "x_dim"), self.dataset.depth_0.data),
+                "latitude": (("y_dim", "x_dim"), self.dataset.latitude.data),
+                "longitude": (("y_dim", "x_dim"), self.dataset.longitude.data),
             }
             dims = ["z_dim", "y_dim", "x_dim"]
 
@@ -673,8 +972,7 @@ class Gridded(Coast):  # TODO Complete this docstring
             if not No_time:
                 coords["time"] = (("t_dim"), self.dataset.time.values)
                 dims.insert(0, "t_dim")
-            else:
-                density = np.squeeze(density)
+            density = density.transpose(*dims).data
             self.dataset[new_var_name] = xr.DataArray(density, coords=coords, dims=dims, attrs=attributes)
 
         except AttributeError as err:
@@ -701,49 +999,50 @@ class Gridded(Coast):  # TODO Complete this docstring
                 print("limits not used as only work with datasets having dimension x_dim")
         return dataset
 
-    def trim_domain_size(self, dataset_domain):
+    def _domain_trim_indices(self, dataset_domain):
         """
-        Trim the domain variables if the dataset object is a spatial subset
+        Finds the corners of the dataset object within the domain, if the dataset object is a spatial subset
 
         Note: This breaks if the SW & NW corner values of nav_lat and nav_lon
         are masked, as can happen if on land...
+
+        :return: (j0, j1, i0, i1), the first and last y and x indices of the subset in the domain, or
+            None if the dataset and domain are the same size
         """
-        debug(f"Trimming {get_slug(self)} variables with {get_slug(dataset_domain)}")
-        if (self.dataset["x_dim"].size != dataset_domain["x_dim"].size) or (
-            self.dataset["y_dim"].size != dataset_domain["y_dim"].size
+        if (self.dataset["x_dim"].size == dataset_domain["x_dim"].size) and (
+            self.dataset["y_dim"].size == dataset_domain["y_dim"].size
         ):
-            info(
-                "The domain  and dataset objects are different sizes:"
-                " [{},{}] cf [{},{}]. Trim domain.".format(
-                    dataset_domain["x_dim"].size,
-                    dataset_domain["y_dim"].size,
-                    self.dataset["x_dim"].size,
-                    self.dataset["y_dim"].size,
-                )
+            return None
+        info(
+            "The domain  and dataset objects are different sizes:"
+            " [{},{}] cf [{},{}]. Trim domain.".format(
+                dataset_domain["x_dim"].size,
+                dataset_domain["y_dim"].size,
+                self.dataset["x_dim"].size,
+                self.dataset["y_dim"].size,
             )
+        )
 
-            # Find the corners of the cut out domain.
-            try:
-                [j0, i0] = self.find_j_i_domain(
-                    lat=self.dataset.latitude[0, 0], lon=self.dataset.longitude[0, 0], dataset_domain=dataset_domain
-                )
-                [j1, i1] = self.find_j_i_domain(
-                    lat=self.dataset.latitude[-1, -1], lon=self.dataset.longitude[-1, -1], dataset_domain=dataset_domain
-                )
-                debug(f"trim_domain_size(): USED dataset.longitude")
-            except:  # if called before variables are re-mapped. Not very pretty...
-                [j0, i0] = self.find_j_i_domain(
-                    lat=self.dataset.nav_lat[0, 0], lon=self.dataset.nav_lon[0, 0], dataset_domain=dataset_domain
-                )
-                [j1, i1] = self.find_j_i_domain(
-                    lat=self.dataset.nav_lat[-1, -1], lon=self.dataset.nav_lon[-1, -1], dataset_domain=dataset_domain
-                )
-                debug(f"trim_domain_size(): USED dataset.nav_lon")
+        # Find the corners of the cut out domain.
+        try:
+            lat, lon = self.dataset.latitude, self.dataset.longitude
+            debug(f"trim_domain_size(): USED dataset.longitude")
+        except:  # if called before variables are re-mapped. Not very pretty...
+            lat, lon = self.dataset.nav_lat, self.dataset.nav_lon
+            debug(f"trim_domain_size(): USED dataset.nav_lon")
+        [j, i, _] = self.nearest_j_i(lat=[lat[0, 0], lat[-1, -1]], lon=[lon[0, 0], lon[-1, -1]], dataset=dataset_domain)
+        return int(j[0]), int(j[1]), int(i[0]), int(i[1])
 
-            dataset_subdomain = dataset_domain.isel(y_dim=slice(j0, j1 + 1), x_dim=slice(i0, i1 + 1))
-            return dataset_subdomain
-        else:
+    def trim_domain_size(self, dataset_domain):
+        """
+        Trim the domain variables if the dataset object is a spatial subset (see _domain_trim_indices)
+        """
+        debug(f"Trimming {get_slug(self)} variables with {get_slug(dataset_domain)}")
+        trim = self._domain_trim_indices(dataset_domain)
+        if trim is None:
             return dataset_domain
+        j0, j1, i0, i1 = trim
+        return dataset_domain.isel(y_dim=slice(j0, j1 + 1), x_dim=slice(i0, i1 + 1))
 
     def copy_domain_vars_to_dataset(self, dataset_domain, grid_vars):
         """
@@ -776,20 +1075,29 @@ class Gridded(Coast):  # TODO Complete this docstring
         approximation. For reference see section 3.1.2 (sec. Discrete operators)
         of the NEMO v4 Handbook.
 
-        Currently the method does not accomodate all possible eventualities. It
-        covers:
-        1) d(grid_t)/dz --> grid_w
+        The difference between neighbouring points along dim lies on another grid of
+        the Arakawa C-grid, where it is divided by that grid's scale factor (e1, e2 or
+        e3_0). The supported combinations are:
+        1) d/dx: grid_t <--> grid_u and grid_v <--> grid_f
+        2) d/dy: grid_t <--> grid_v and grid_u <--> grid_f
+        3) d/dz: grid_t <--> grid_w (z is positive upwards)
 
         Returns  an object (with the appropriate target grid_ref) containing
         derivative (out_var_str) as xr.DataArray
 
+        Where the stencil would need a point beyond the edge of the domain the derivative
+        is NaN, except at the surface for d(grid_t)/dz, where it is zero. If the t-grid
+        bottom_level is available (in this object or out_obj) derivatives at target
+        points on land are also NaN. Dask-backed variables are differentiated lazily
+        with dask's map_overlap, so differences across chunk boundaries are included.
+
         This is hardwired to expect:
         1) depth_0 and e3_0 fields exist
-        2) xr.DataArrays are 4D
-        3) self.filename_domain if out_obj not specified
-        4) If out_obj is not specified, one is built that is  the size of
+        2) the scale factors of the target grid are in out_obj, or
+            self.filename_domain and config_path can be used to build out_obj
+        3) If out_obj is not specified, one is built that is  the size of
             self.filename_domain. I.e. automatic subsetting of out_obj is not
-            supported.
+            supported. It is built once for each target grid and reused by later calls.
 
         Example usage:
         --------------
@@ -805,74 +1113,91 @@ class Gridded(Coast):  # TODO Complete this docstring
         Provide an existing target NEMO object and target variable name:
         nemo_w_1 = nemo_t.differentiate( 'temperature', dim='z_dim', out_var_str='dTdz', out_obj=nemo_w_1 )
 
+        # Compute dT/dx on the u-grid
+        nemo_u = nemo_t.differentiate( 'temperature', dim='x_dim', config_path=fn_config_u_grid )
+
 
         Parameters
         ----------
         in_var_str : str, name of variable to differentiate
-        config_path : str, path to the w grid config file
-        dim : str, dimension to operate over. E.g. {'z_dim', 'y_dim', 'x_dim', 't_dim'}
+        config_path : str, path to the target grid config file
+        dim : str, dimension to operate over. E.g. {'z_dim', 'y_dim', 'x_dim'}
         out_var_str : str, (optional) name of the target xr.DataArray
         out_obj : exiting NEMO obj to store xr.DataArray (optional)
 
         """
-        import xarray as xr
-
-        new_units = ""
-
         # Check in_var_str exists in self.
-        if hasattr(self.dataset, in_var_str):
-            # self.dataset[in_var_str] exists
-
-            var = self.dataset[in_var_str]  # for convenience
-
-            nt = var.sizes["t_dim"]
-            nz = var.sizes["z_dim"]
-            ny = var.sizes["y_dim"]
-            nx = var.sizes["x_dim"]
-
-            # Compute d(t_grid)/dz --> w-grid
-            # Check grid_ref and dir. Determine target grid_ref.
-            if (self.grid_ref == "t-grid") and (dim == "z_dim"):
-                out_grid = "w-grid"
-
-                # If out_obj exists check grid_ref, else create out_obj.
-                if (out_obj is None) or (out_obj.grid_ref != out_grid):
-                    try:
-                        out_obj = Gridded(fn_domain=self.filename_domain, config=config_path)
-                    except:  # TODO Catch specific exception(s)
-                        warn(
-                            "Failed to create target NEMO obj. Perhaps self.",
-                            "filename_domain={} is empty?".format(self.filename_domain),
-                        )
-
-                # Check is out_var_str is defined, else create it
-                if out_var_str is None:
-                    out_var_str = in_var_str + "_dz"
-
-                # Create new DataArray with the same dimensions as the parent
-                # Crucially have a coordinate value that is appropriate to the target location.
-                blank = xr.zeros_like(var.isel(z_dim=[0]))  # Using "z_dim=[0]" as a list preserves z-dimension
-                blank.coords["depth_0"] -= blank.coords["depth_0"]  # reset coord vals to zero
-                # Add blank slice to the 'surface'. Concat over the 'dim' coords
-                diff = xr.concat([blank, var.diff(dim)], dim)
-                diff_ndim, e3w_ndim = xr.broadcast(diff, out_obj.dataset.e3_0.squeeze())
-                # Compute the derivative
-                out_obj.dataset[out_var_str] = -diff_ndim / e3w_ndim
-
-                # Assign attributes
-                new_units = var.units + "/" + out_obj.dataset.depth_0.units
-                # Convert to a xr.DataArray and return
-                out_obj.dataset[out_var_str].attrs = {"units": new_units, "standard_name": out_var_str}
-
-                # Return in object.
-                return out_obj
+        if not hasattr(self.dataset, in_var_str):
+            warn(f"{in_var_str} does not exist in {get_slug(self)} dataset")
+            return None
+        if (self.grid_ref, dim) not in _stencils:
+            warn("Not ready for that combination of grid ({}) and " "derivative ({})".format(self.grid_ref, dim))
+            return None
+        out_grid, forward, sign = _stencils[(self.grid_ref, dim)]
 
-            else:
-                warn("Not ready for that combination of grid ({}) and " "derivative ({})".format(self.grid_ref, dim))
+        # If out_obj exists check grid_ref, else create out_obj.
+        if (out_obj is None) or (out_obj.grid_ref != out_grid):
+            out_obj = self._target_grid(out_grid, config_path)
+            if out_obj is None:
                 return None
+
+        # Check is out_var_str is defined, else create it
+        if out_var_str is None:
+            out_var_str = in_var_str + "_d" + dim[0]
+
+        # Spatial coordinates are those of the target grid, so only keep the time
+        var = self.dataset[in_var_str]
+        var = var.drop_vars([coord for coord in var.coords if set(var[coord].dims) - {"t_dim"}])
+        scale_factor = _drop_coords(out_obj.dataset[_scale_factors[dim]].squeeze())
+        derivative = sign * _difference(var, dim, forward) / scale_factor
+        if out_grid == "w-grid":  # Surface value is set to zero
+            derivative = derivative.where(xr.DataArray(np.arange(var.sizes[dim]), dims=dim) > 0, 0.0)
+
+        # Mask target points on land
+        bottom_level = self.dataset.get("bottom_level", out_obj.dataset.get("bottom_level"))
+        if bottom_level is not None:
+            bottom_level = bottom_level.squeeze().values
+            top_level = self.dataset.get("top_level", out_obj.dataset.get("top_level"))
+            top_level = np.ones_like(bottom_level) if top_level is None else top_level.squeeze().values
+            mask = _grid_mask(_wet_mask(top_level, bottom_level, var.sizes.get("z_dim", 1)), out_grid)
+            if "z_dim" not in var.dims:
+                mask = mask.isel(z_dim=0, drop=True)
+            if derivative.chunks is None:
+                mask = mask.compute()
+            derivative = derivative.where(mask)
+        out_obj.dataset[out_var_str] = derivative.transpose(*var.dims)
+
+        # Assign attributes
+        if dim == "z_dim":
+            new_units = var.attrs.get("units", "") + "/" + out_obj.dataset.depth_0.units
         else:
-            warn(f"{in_var_str} does not exist in {get_slug(self)} dataset")
-            return None
+            new_units = var.attrs.get("units", "") + "/m"
+        out_obj.dataset[out_var_str].attrs = {"units": new_units, "standard_name": out_var_str}
+
+        # Return in object.
+        return out_obj
+
+    def _target_grid(self, grid_ref: str, config_path: str):
+        """
+        Returns a Gridded object on grid_ref for this object's domain, built from
+        filename_domain and config_path on first use and reused afterwards. A shallow
+        copy is returned, so variables added to it are not added to the reused object.
+        """
+        key = (grid_ref, config_path)
+        if key not in self._target_grids:
+            try:
+                target = Gridded(fn_domain=self.filename_domain, config=config_path)
+            except Exception as err:  # TODO Catch specific exception(s)
+                warn(f"Failed to create target NEMO obj. Perhaps self.filename_domain={self.filename_domain} is empty?")
+                debug(f"Error message of {err}")
+                return None
+            if target.grid_ref != grid_ref:
+                warn(f"The config file {config_path} is for the {target.grid_ref}, not the {grid_ref}")
+                return None
+            self._target_grids[key] = target
+        target = copy.copy(self._target_grids[key])
+        target.dataset = target.dataset.copy()
+        return target
 
     def apply_doodson_x0_filter(self, var_str):
         """Applies Doodson X0 filter to a variable.
@@ -909,6 +1234,14 @@ class Gridded(Coast):  # TODO Complete this docstring
         A t-grid NEMO object containing the ssh variable must be passed in. Either
         the domain_cfg path must have been passed in as an argument when the NEMO
         object was created or it must be passed in here using the dom_fn argument.
+        The t-grid scale factors, bottom level and cell areas are taken from nemo_t.
+        Variables on the other grids are taken from the domain nemo_t was created
+        with, shared through the domain cache, so the domain_cfg file is only read
+        if dom_fn is given or nemo_t was not created from a domain_cfg file.
+
+        The scale factors are returned as lazy dask-backed DataArrays, chunked in time
+        like the ssh (or, if the ssh is not chunked, in blocks of about dask's default
+        chunk size), so they can be computed or written out a block at a time.
 
         e.g. e3t,e3v,e3f = coast.NEMO.get_e3_from_ssh(nemo_t,true,false,true,true,false)
 
@@ -938,25 +1271,40 @@ class Gridded(Coast):  # TODO Complete this docstring
         if "t_dim" not in ssh.dims:
             ssh = ssh.expand_dims("t_dim", axis=0)
 
-        # Load domain_cfg
-        if dom_fn is None:
-            dom_fn = nemo_t.filename_domain
-        try:
-            ds_dom = xr.open_dataset(dom_fn).squeeze().rename({"z": "z_dim", "x": "x_dim", "y": "y_dim"})
-        except OSError:
-            print(f"Problem opening domain_cfg file: {dom_fn}")
-            return
+        # t-grid domain variables are reused from nemo_t, and those on other grids
+        # from the domain it was created with. The domain_cfg file is only opened
+        # (lazily) if that is not available.
+        t_vars = {"e3t_0": "e3_0", "bottom_level": "bottom_level", "e1t": "e1", "e2t": "e2"}
+        ds_dom = xr.Dataset(
+            {key: _drop_coords(nemo_t.dataset[var]) for key, var in t_vars.items() if var in nemo_t.dataset}
+        )
+        if np.any([e3u, e3v, e3f, e3w]) or len(ds_dom) < len(t_vars):
+            if dom_fn is None and nemo_t._shared_domain is not None:
+                ds_file = nemo_t._shared_domain.squeeze()
+            else:
+                if dom_fn is None:
+                    dom_fn = nemo_t.filename_domain
+                try:
+                    ds_file = (
+                        xr.open_dataset(dom_fn, chunks={}).squeeze().rename({"z": "z_dim", "x": "x_dim", "y": "y_dim"})
+                    )
+                except OSError as err:
+                    raise OSError(f"Problem opening domain_cfg file: {dom_fn}") from err
+            ds_dom = ds_file.drop_vars(list(ds_dom), errors="ignore").merge(ds_dom)
 
         e3t_0 = ds_dom.e3t_0
+        bottom_level = ds_dom.bottom_level
+        level = xr.DataArray(np.arange(e3t_0.sizes["z_dim"]), dims="z_dim")
+        # Evaluate lazily, a block of time steps at a time (of about dask's default chunk size)
+        if ssh.chunks is None:
+            chunk_size = dask.utils.parse_bytes(dask.config.get("array.chunk-size"))
+            ssh = ssh.chunk({"t_dim": max(chunk_size // (e3t_0.size * 8), 1)})
 
         # Water column thickness, i.e. depth of bottom w-level on horizontal t-grid
-        H = e3t_0.cumsum(dim="z_dim").isel(z_dim=ds_dom.bottom_level.astype("int") - 1)
-        # Add correction to e3t_0 due to change in ssh
-        e3t_new = e3t_0 * (1 + ssh / H)
-        # preserve dimension ordering
-        e3t_new = e3t_new.transpose("t_dim", "z_dim", "y_dim", "x_dim")
-        # mask out correction at layers below bottom level
-        e3t_new = e3t_new.where(e3t_new.z_dim < ds_dom.bottom_level, e3t_0.data)
+        H = e3t_0.cumsum(dim="z_dim").isel(z_dim=bottom_level.astype("int") - 1)
+        # Add correction to e3t_0 due to change in ssh, but not at layers below bottom level
+        e3t_new = (e3t_0 * (1 + ssh / H)).transpose("t_dim", "z_dim", "y_dim", "x_dim")
+        e3t_new = e3t_new.where(level < bottom_level, e3t_0.data)
         # preserve any other t mask
         e3t_new = e3t_new.where(~np.isnan(ssh))
         if e3t:
@@ -964,78 +1312,44 @@ class Gridded(Coast):  # TODO Complete this docstring
 
         if np.any([e3u, e3v, e3f]):
             e1e2t = ds_dom.e1t * ds_dom.e2t
-        if np.any([e3u, e3v, e3w]):
+        if np.any([e3u, e3v, e3f, e3w]):
             e3t_dt = e3t_new - e3t_0
 
         # area averaged interpolation onto the u-grid to get e3u
         if np.any([e3u, e3f]):
             e1e2u = ds_dom.e1u * ds_dom.e2u
-            # interpolate onto u-grid
-            e3u_temp = (
-                (0.5 / e1e2u[:, :-1]) * ((e1e2t[:, :-1] * e3t_dt[:, :, :, :-1]) + (e1e2t[:, 1:] * e3t_dt[:, :, :, 1:]))
-            ).transpose("t_dim", "z_dim", "y_dim", "x_dim")
-            # u mask
-            e3u_temp = e3u_temp.where(e3t_dt[:, :, :, 1:] != 0, 0)
-            # mask out correction at layers below bottom level
-            e3u_temp = e3u_temp.where(e3u_temp.z_dim < ds_dom.bottom_level[:, :-1], 0)
-            # Add correction to e3u_0
-            e3u_temp = e3u_temp + ds_dom.e3u_0[:, :, :-1]
-            e3u_new = xr.zeros_like(e3t_new)
-            e3u_new = e3u_new.load()
-            e3u_new[:, :, :, :-1] = e3u_temp
-            e3u_new[:, :, :, -1] = ds_dom.e3u_0[:, :, -1]
+            e3u_new = _e3_on_face(e3t_dt, e1e2t, e1e2u, ds_dom.e3u_0, bottom_level, "x_dim")
             e3u_new["longitude"] = ds_dom.glamu
             e3u_new["latitude"] = ds_dom.gphiu
             if e3u:
                 e3_return.append(e3u_new.squeeze())
 
-        # area averaged interpolation onto the u-grid to get e3v
+        # area averaged interpolation onto the v-grid to get e3v
         if e3v:
             e1e2v = ds_dom.e1v * ds_dom.e2v
-            e3v_temp = (
-                (0.5 / e1e2v[:-1, :]) * ((e1e2t[:-1, :] * e3t_dt[:, :, :-1, :]) + (e1e2t[1:, :] * e3t_dt[:, :, 1:, :]))
-            ).transpose("t_dim", "z_dim", "y_dim", "x_dim")
-            e3v_temp = e3v_temp.where(e3t_dt[:, :, 1:, :] != 0, 0)
-            e3v_temp = e3v_temp.where(e3v_temp.z_dim < ds_dom.bottom_level[:-1, :], 0)
-            e3v_temp = e3v_temp + ds_dom.e3v_0[:, :-1, :]
-            e3v_new = xr.zeros_like(e3t_new)
-            e3v_new = e3v_new.load()
-            e3v_new[:, :, :-1, :] = e3v_temp
-            e3v_new[:, :, -1, :] = ds_dom.e3v_0[:, -1, :]
+            e3v_new = _e3_on_face(e3t_dt, e1e2t, e1e2v, ds_dom.e3v_0, bottom_level, "y_dim")
             e3v_new["longitude"] = ds_dom.glamv
             e3v_new["latitude"] = ds_dom.gphiv
             e3_return.append(e3v_new.squeeze())
 
-        # area averaged interpolation onto the u-grid to get e3f
+        # area averaged interpolation of e3u onto the f-grid to get e3f
         if e3f:
             e1e2f = ds_dom.e1f * ds_dom.e2f
             e3u_dt = e3u_new - ds_dom.e3u_0
-            e3f_temp = (
-                (0.5 / e1e2f[:-1, :]) * ((e1e2u[:-1, :] * e3u_dt[:, :, :-1, :]) + (e1e2u[1:, :] * e3u_dt[:, :, 1:, :]))
-            ).transpose("t_dim", "z_dim", "y_dim", "x_dim")
-            e3f_temp = e3f_temp.where(e3u_dt[:, :, 1:, :] != 0, 0)
-            e3f_temp = e3f_temp.where(e3f_temp.z_dim < ds_dom.bottom_level[:-1, :], 0)
-            e3f_temp = e3f_temp + ds_dom.e3f_0[:, :-1, :]
-            e3f_new = xr.zeros_like(e3t_new)
-            e3f_new = e3f_new.load()
-            e3f_new[:, :, :-1, :] = e3f_temp
-            e3f_new[:, :, -1, :] = ds_dom.e3f_0[:, -1, :]
+            e3f_new = _e3_on_face(e3u_dt, e1e2u, e1e2f, ds_dom.e3f_0, bottom_level, "y_dim")
             e3f_new["longitude"] = ds_dom.glamf
             e3f_new["latitude"] = ds_dom.gphif
             e3_return.append(e3f_new.squeeze())
 
         # simple vertical interpolation for e3w. Special treatment of top and bottom levels
         if e3w:
-            # top levels correction same at e3t
-            e3w_new = (ds_dom.e3w_0 + e3t_dt).transpose("t_dim", "z_dim", "y_dim", "x_dim")
-            # levels between top and bottom
-            e3w_new = e3w_new.load()
-            e3w_new[dict(z_dim=slice(1, None))] = (
-                0.5 * e3t_dt[:, :-1, :, :] + 0.5 * e3t_dt[:, 1:, :, :] + ds_dom.e3w_0[1:, :, :]
-            )
+            e3w_0 = ds_dom.e3w_0
+            e3t_dt_above = e3t_dt.shift(z_dim=1)
+            # top levels correction same at e3t, levels between top and bottom the mean of those either side
+            e3w_new = xr.where(level > 0, 0.5 * e3t_dt_above + 0.5 * e3t_dt + e3w_0, e3w_0 + e3t_dt)
             # bottom and below levels
-            e3w_new = e3w_new.where(e3w_new.z_dim < ds_dom.bottom_level, e3t_dt.shift(z_dim=1) + ds_dom.e3w_0)
-            e3_return.append(e3w_new.squeeze())
+            e3w_new = e3w_new.where(level < bottom_level, e3t_dt_above + e3w_0)
+            e3_return.append(e3w_new.transpose("t_dim", "z_dim", "y_dim", "x_dim").squeeze())
 
         return tuple(e3_return)
 
@@ -1161,37 +1475,44 @@ class Gridded(Coast):  # TODO Complete this docstring
     def calculate_vertical_mask(self, Zmax):
         """
         Calculates a 3D mask to a specified level Zmax. 1 for sea; 0 for below sea bed
-        and linearly ramped for last level
+        and linearly ramped for last level. Vectorised over all columns, so it is
+        evaluated lazily if the domain variables are dask arrays.
+
+        Returns:
+            Zd_mask (array): (z_dim, y_dim, x_dim) mask.
+            kmax (array): (y_dim, x_dim) number of levels above the sea bed or
+                          index of the level containing Zmax if it is shallower.
+            Ikmax (tuple): Flat indices of the levels containing Zmax.
         """
-        Z = self.dataset.variables["depth_0"].values
-        e3_0 = self.dataset.variables["e3_0"].values
+        if not Zmax > 0:
+            # The surface W-level must be shallower than Zmax to place the ramp
+            raise ValueError(f"Zmax must be positive, got {Zmax}")
+        e3_0 = self.dataset.variables["e3_0"].data
+        mbot = self.dataset.variables["bottom_level"].data.astype(int)
+        nz = e3_0.shape[0]
+        levels = np.arange(nz).reshape((nz, 1, 1))
         # calculate W-level - might want this done as stanbdard in gridded
-        ZW = np.zeros_like(e3_0)
-        ZW[0, :, :] = 0.0
-        ZW[1:, :, :] = np.cumsum(e3_0, axis=0)[:-1, :, :]
-        mbot = self.dataset.variables["bottom_level"].values.astype(int)
+        ZW = np.cumsum(e3_0, axis=0)[:-1, :, :]
+        ZW = np.concatenate([np.zeros_like(e3_0[:1, :, :]), np.where(ZW == 0, np.nan, ZW)], axis=0)
         mask = mbot != 0
-        ZZ = ZW[1:, :, :]
-        ZZ[ZZ == 0] = np.nan
-        ZW[1:, :, :] = ZZ
-
-        Zd_mask = np.zeros((Z.shape))
-        nz, ny, nx = np.shape(Z)
-        kmax = np.zeros((ny, nx)).astype(int)
-        IIkmax = np.zeros(np.shape(Z))
-        #
+
+        def level_value(k):
+            # ZW at level k of each column; k is (y_dim, x_dim)
+            return np.where(levels == k, ZW, 0).sum(axis=0)
+
         # careful assumes mbot is 1st sea point above bed ie new definition
-        for i in range(nx):
-            for j in range(ny):
-                if mask[j, i] == 1:
-                    Zd_mask[0 : mbot[j, i], j, i] = 1  # mbot is not python style index so no +1
-                    kmax[j, i] = mbot[j, i]
-                    if ZW[mbot[j, i], j, i] > Zmax:
-                        kkmax = np.max(np.where(ZW[:, j, i] < Zmax))
-                        Zd_mask[kkmax + 1 :, j, i] = 0
-                        Zd_mask[kkmax, j, i] = (Zmax - ZW[kkmax, j, i]) / (ZW[kkmax + 1, j, i] - ZW[kkmax, j, i])
-                        kmax[j, i] = kkmax
-                        IIkmax[kkmax, j, i] = 1
+        # mbot is not python style index so no +1
+        Zd_mask = (mask & (levels < mbot)).astype(float)
+        kmax = np.where(mask, mbot, 0)
+        # Columns deeper than Zmax are cut at the last W-level above Zmax (NaN never is)
+        deep = mask & (level_value(np.minimum(mbot, nz - 1)) > Zmax)
+        kkmax = nz - 1 - np.argmax((ZW < Zmax)[::-1, :, :], axis=0)
+        ZW_k = level_value(kkmax)
+        ramp = (Zmax - ZW_k) / np.where(deep, level_value(np.minimum(kkmax + 1, nz - 1)) - ZW_k, 1.0)
+        IIkmax = deep & (levels == kkmax)
+        Zd_mask = np.where(deep & (levels > kkmax), 0.0, Zd_mask)
+        Zd_mask = np.where(IIkmax, ramp, Zd_mask)
+        kmax = np.where(deep, kkmax, kmax)
         Ikmax = np.nonzero(IIkmax.ravel())
 
         return Zd_mask, kmax, Ikmax
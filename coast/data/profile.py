@@ -2,7 +2,7 @@
 from .index import Indexed
 import numpy as np
 import xarray as xr
-from .._utils import general_utils, plot_util
+from .._utils import general_utils, plot_util, obs_cache
 import matplotlib.pyplot as plt
 import glob
 import datetime
@@ -10,6 +10,8 @@ from .._utils.logging_util import get_slug, debug, info, warn, warning
 from typing import Union
 from pathlib import Path
 import pandas as pd
+import dask
+import dask.array
 
 
 class Profile(Indexed):
@@ -53,6 +55,21 @@ class Profile(Indexed):
     will rename dimensions and variables as dictated.
     """
 
+    # EN4 QC bits that give the reason for rejecting temperature or salinity
+    # levels, per EN4 version. Bits 0 and 1 mark rejected temperature and salinity.
+    # from https://www.metoffice.gov.uk/hadobs/en4/en4-0-2-profile-file-format.html
+    # and https://www.metoffice.gov.uk/hadobs/en4/en4-2-2-profile-file-format.html
+    en4_qc_reasons = {
+        "4.2.0": {
+            "temperature": [2, 3, 8, 9, 10, 11, 12, 13, 14, 15, 16],
+            "salinity": [2, 3, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29],
+        },
+        "4.2.2": {
+            "temperature": [2, 3, 8, 9, 10, 11, 12, 13, 14, 15, 16],
+            "salinity": [2, 3, 21, 22, 23, 24, 25, 26, 27, 28, 29],
+        },
+    }
+
     def __init__(self, dataset=None, config: Union[Path, str] = None):
         """Initialization and file reading. You may initialize
 
@@ -194,7 +211,7 @@ class Profile(Indexed):
 
     """======================= Model Comparison ======================="""
 
-    def process_en4(self, sort_time=True, remove_flagged_neighbours=False):
+    def process_en4(self, sort_time=True, remove_flagged_neighbours=False, qc_reasons=None):
         """
         VERSION 1.4 (05/07/2021)
 
@@ -227,6 +244,14 @@ class Profile(Indexed):
                 profiles would have not been stored in the data files. Setting this flag
                 as True removes these profiles.
 
+        qc_reasons: EN4 version string (a key of Profile.en4_qc_reasons) or a dictionary
+                with "temperature" and "salinity" lists of the QC bits that reject levels.
+                By default, the version is taken from the dataset history attribute.
+
+        If a cache directory has been set with coast.obs_cache.set_cache_dir() and the
+        dataset was read from files, the processed dataset is written to the cache and
+        later calls on the same profiles with the same options read it back lazily.
+
         EXAMPLE USEAGE:
          profile = coast.PROFILE()
          profile.read_EN4(fn_en4, chunks={'N_PROF':10000})
@@ -235,28 +260,44 @@ class Profile(Indexed):
                                               lonbounds = [-10, 10],
                                               latbounds = [45, 65])
         """
+        sources = obs_cache.dataset_sources(self.dataset)
+        if obs_cache.get_cache_dir() is None or not sources:
+            return self._process_en4(sort_time, remove_flagged_neighbours, qc_reasons)
+
+        # The dataset may be a subset of its source files or changed in memory, so every
+        # variable (shape and values, or dask graph if chunked) is part of the key
+        options = {
+            "sort_time": sort_time,
+            "remove_flagged_neighbours": remove_flagged_neighbours,
+            "qc_reasons": self._en4_qc_reasons(qc_reasons),
+            "dataset": dask.base.tokenize(self.dataset),
+        }
+        return_prof = Profile()
+        return_prof.dataset = obs_cache.cached_dataset(
+            "en4",
+            sources,
+            options,
+            lambda: self._process_en4(sort_time, remove_flagged_neighbours, qc_reasons).dataset,
+        )
+        return return_prof
 
+    def _process_en4(self, sort_time=True, remove_flagged_neighbours=False, qc_reasons=None):
+        """Applies EN4 quality control without the observation cache. See process_en4()."""
         ds = self.dataset
 
         # Load in the quality control flags
         debug(f" Applying QUALITY CONTROL to EN4 data...")
-        ds.qc_flags_profiles.load()
+        qc_prof = ds.qc_flags_profiles.values.astype(np.int64)
 
-        # This line reads converts the QC integer to a binary string.
-        # Each bit of this string is a different QC flag. Which flag is which can
+        # Each bit of the QC integer is a different QC flag. Which flag is which can
         # be found on the EN4 website:
         # https://www.metoffice.gov.uk/hadobs/en4/en4-0-2-profile-file-format.html
-        qc_str = [
-            np.binary_repr(ds.qc_flags_profiles.astype(int).values[pp]).zfill(32)[::-1]
-            for pp in range(ds.sizes["id_dim"])
-        ]
-
         # Determine indices of the profiles that we want to keep
-        reject_tem_prof = np.array([int(qq[0]) for qq in qc_str], dtype=bool)
-        reject_sal_prof = np.array([int(qq[1]) for qq in qc_str], dtype=bool)
+        reject_tem_prof = np.bitwise_and(qc_prof, 1) > 0
+        reject_sal_prof = np.bitwise_and(qc_prof, 2) > 0
         reject_both_prof = np.logical_and(reject_tem_prof, reject_sal_prof)
         if remove_flagged_neighbours:
-            reject_close_flagged_prof = np.array([int(qq[2]) for qq in qc_str], dtype=bool)
+            reject_close_flagged_prof = np.bitwise_and(qc_prof, 4) > 0
             reject_both_prof = np.logical_or(reject_both_prof, reject_close_flagged_prof)
         ds["reject_tem_prof"] = (["id_dim"], reject_tem_prof)
         ds["reject_sal_prof"] = (["id_dim"], reject_sal_prof)
@@ -264,42 +305,25 @@ class Profile(Indexed):
 
         # Subset profile dataset to remove profiles that are COMPLETELY empty
         ds = ds.isel(id_dim=~reject_both_prof)
-        reject_tem_prof = reject_tem_prof[~reject_both_prof]
-        reject_sal_prof = reject_sal_prof[~reject_both_prof]
         debug(f" QC: Additional profiles converted to NaNs: ")
-        debug(f"     >>> {0} temperature profiles ".format(np.sum(reject_tem_prof)))
-        debug(f"     >>> {0} salinity profiles ".format(np.sum(reject_sal_prof)))
-
-        debug(f"MASKING rejected profiles, replacing with NaNs...")
-        reject_tem_prof_arr = ds.reject_tem_prof.broadcast_like(ds.potential_temperature).values
-        reject_sal_prof_arr = ds.reject_sal_prof.broadcast_like(ds.practical_salinity).values
-        ds["temperature"] = xr.where(~reject_tem_prof_arr, ds["temperature"], np.nan)
-        ds["potential_temperature"] = xr.where(~reject_tem_prof_arr, ds["potential_temperature"], np.nan)
-        ds["practical_salinity"] = xr.where(~reject_sal_prof_arr, ds["practical_salinity"], np.nan)
-
-        # Get new QC flags array
-        qc_lev = ds.qc_flags_levels.values
-        #
-        reject_tem_lev = np.zeros((ds.dims["id_dim"], ds.dims["z_dim"]), dtype=bool)
-        reject_sal_lev = np.zeros((ds.dims["id_dim"], ds.dims["z_dim"]), dtype=bool)
-
-        # Get lists of QC integers that marks levels for masking
-        int_tem, int_sal, int_both = self.calculate_en4_qc_flags_levels()
-        for ii in range(len(int_tem)):
-            reject_tem_lev[qc_lev == int_tem[ii]] = 1
-        for ii in range(len(int_sal)):
-            reject_sal_lev[qc_lev == int_sal[ii]] = 1
-        for ii in range(len(int_both)):
-            reject_tem_lev[qc_lev == int_both[ii]] = 1
-            reject_sal_lev[qc_lev == int_both[ii]] = 1
-
-        ds["reject_tem_datapoint"] = (["id_dim", "z_dim"], reject_tem_lev)
-        ds["reject_sal_datapoint"] = (["id_dim", "z_dim"], reject_sal_lev)
-
-        debug(f"MASKING rejected datapoints, replacing with NaNs...")
-        ds["temperature"] = xr.where(~reject_tem_lev, ds["temperature"], np.nan)
-        ds["potential_temperature"] = xr.where(~reject_tem_lev, ds["potential_temperature"], np.nan)
-        ds["practical_salinity"] = xr.where(~reject_sal_lev, ds["practical_salinity"], np.nan)
+        debug(f"     >>> {0} temperature profiles ".format(np.sum(ds.reject_tem_prof.values)))
+        debug(f"     >>> {0} salinity profiles ".format(np.sum(ds.reject_sal_prof.values)))
+
+        # Rejected levels, decoded from the level QC integers. Lazy if the dataset is chunked.
+        tem_reasons, sal_reasons = self._en4_qc_reasons(qc_reasons)
+        qc_lev = ds.qc_flags_levels
+        if qc_lev.dtype.kind == "f":
+            qc_lev = qc_lev.fillna(0)
+        reject_tem_lev, reject_sal_lev = self._decode_en4_qc_levels(qc_lev.astype(np.int64), tem_reasons, sal_reasons)
+        ds["reject_tem_datapoint"] = reject_tem_lev.transpose("id_dim", "z_dim")
+        ds["reject_sal_datapoint"] = reject_sal_lev.transpose("id_dim", "z_dim")
+
+        debug(f"MASKING rejected profiles and datapoints, replacing with NaNs...")
+        reject_tem = np.logical_or(ds.reject_tem_prof, ds.reject_tem_datapoint)
+        reject_sal = np.logical_or(ds.reject_sal_prof, ds.reject_sal_datapoint)
+        ds["temperature"] = xr.where(~reject_tem, ds["temperature"], np.nan)
+        ds["potential_temperature"] = xr.where(~reject_tem, ds["potential_temperature"], np.nan)
+        ds["practical_salinity"] = xr.where(~reject_sal, ds["practical_salinity"], np.nan)
 
         if sort_time:
             debug(f"Sorting Time Dimension...")
@@ -311,7 +335,7 @@ class Profile(Indexed):
         return_prof.dataset = ds
         return return_prof
 
-    def obs_operator(self, gridded, mask_bottom_level=True):
+    def obs_operator(self, gridded, mask_bottom_level=True, streaming=False, scheduler=None, n_workers=None):
         """
         VERSION 2.0 (04/10/2021)
         Author: David Byrne
@@ -330,6 +354,13 @@ class Profile(Indexed):
         used, then using one chunk per file will be most efficient. Time
         chunking is generally the better option for this routine.
 
+        If streaming=True, whole chunks are not loaded. Instead, only the
+        (t, y, x) points needed from each time chunk are gathered and
+        written into a preallocated output, in the same order as the
+        profiles. The gathering for all chunks is done by dask, so it can be
+        run on threads, processes or an existing dask.distributed Client
+        (see scheduler).
+
         INPUTS:
          gridded (Gridded)        : gridded object created on t-grid
          mask_bottom_level (bool) : Whether or not to mask any data below the
@@ -337,6 +368,16 @@ class Profile(Indexed):
                                     the Gridded object's dataset contain's a
                                     bottom_level variable with dims
                                     (y_dim, x_dim).
+         streaming (bool)         : Gather points chunk by chunk instead of
+                                    loading whole chunks. Default False.
+         scheduler (str)          : [streaming only] Dask scheduler used to
+                                    gather chunks: 'threads', 'processes',
+                                    'synchronous' or a dask.distributed
+                                    Client. Default None uses the dask default
+                                    (a Client, if one has been set up).
+         n_workers (int)          : [streaming only] Number of threads or
+                                    processes to use. Default None lets dask
+                                    decide.
 
         OUTPUTS:
          Returns a new PROFILE object containing a computed dataset of extracted
@@ -367,7 +408,7 @@ class Profile(Indexed):
 
         # TIME indices - model nearest to obs time
         en4_time = en4.time.values
-        ind_t = [np.argmin(np.abs(mod_time - en4_time[tt])) for tt in range(en4.dims["id_dim"])]
+        ind_t, _, _ = general_utils.time_matching_indices(mod_time, en4_time, method="nearest")
         ind_t = xr.DataArray(ind_t)
         debug(f"Time Indices Calculated")
 
@@ -380,6 +421,14 @@ class Profile(Indexed):
             if cond1:
                 bl_var_list.append(vv)
 
+        if streaming:
+            mod_profiles = self._gather_model_points(
+                gridded, ind_x, ind_y, ind_t, scheduler=scheduler, n_workers=n_workers
+            )
+            if mask_bottom_level:
+                mod_profiles = self._mask_below_bottom_level(mod_profiles, bl_var_list)
+            return self._finish_obs_operator(en4, en4_time, mod_profiles, ind_x, ind_y, ind_t)
+
         # Get chunks along the time dimension and determine whether chunks
         # are described by a single equal size, or a tuples of sizes
         time_chunks = gridded.chunks["t_dim"]
@@ -416,17 +465,8 @@ class Profile(Indexed):
             ds_tmp_indexed = ds_tmp_indexed.rename({"dim_0": "id_dim"})
 
             # Mask out all levels deeper than bottom_level
-            # Here I have used set_coords() and reset_coords() to omit variables
-            # with no z_dim from the masking. Otherwise xr.where expands these
-            # dimensions into full 2D arrays.
             if mask_bottom_level:
-                n_z_tmp = ds_tmp_indexed.dims["z_dim"]
-                bl_array = ds_tmp_indexed.bottom_level.values
-                z_index, bl_index = np.meshgrid(np.arange(0, n_z_tmp), bl_array)
-                mask2 = xr.DataArray(z_index < bl_index, dims=["id_dim", "z_dim"])
-                ds_tmp_indexed = ds_tmp_indexed.set_coords(bl_var_list)
-                ds_tmp_indexed = ds_tmp_indexed.where(mask2)
-                ds_tmp_indexed = ds_tmp_indexed.reset_coords(bl_var_list)
+                ds_tmp_indexed = self._mask_below_bottom_level(ds_tmp_indexed, bl_var_list)
 
             # If not first iteration, concatenate this indexed chunk onto
             # final output dataset
@@ -442,6 +482,112 @@ class Profile(Indexed):
             start_ii = end_ii
             count_ii = count_ii + 1
 
+        return self._finish_obs_operator(en4, en4_time, mod_profiles, ind_x, ind_y, ind_t)
+
+    @staticmethod
+    def _mask_below_bottom_level(mod_profiles, bl_var_list):
+        """
+        Masks all levels deeper than bottom_level in a dataset of extracted
+        model profiles. Used by obs_operator().
+        """
+        # Here I have used set_coords() and reset_coords() to omit variables
+        # with no z_dim from the masking. Otherwise xr.where expands these
+        # dimensions into full 2D arrays.
+        n_z_tmp = mod_profiles.dims["z_dim"]
+        bl_array = mod_profiles.bottom_level.values
+        z_index, bl_index = np.meshgrid(np.arange(0, n_z_tmp), bl_array)
+        mask2 = xr.DataArray(z_index < bl_index, dims=["id_dim", "z_dim"])
+        mod_profiles = mod_profiles.set_coords(bl_var_list)
+        mod_profiles = mod_profiles.where(mask2)
+        mod_profiles = mod_profiles.reset_coords(bl_var_list)
+        return mod_profiles
+
+    @staticmethod
+    def _gather_model_points(gridded, ind_x, ind_y, ind_t, scheduler=None, n_workers=None):
+        """
+        Extracts model data at (ind_t, ind_y, ind_x) points from a gridded
+        dataset, one time chunk at a time. Only the requested points are
+        gathered from each chunk and all chunks are computed together by dask.
+        Results are written into preallocated arrays in the order of the input
+        indices. Used by obs_operator(streaming=True).
+
+        INPUTS:
+         gridded (Dataset)   : Gridded dataset to extract from
+         ind_x, ind_y, ind_t : 1D integer arrays of indices, one per profile
+         scheduler           : Dask scheduler, passed to dask.compute()
+         n_workers (int)     : Number of workers, passed to dask.compute()
+
+        OUTPUTS:
+         xarray.Dataset with dimension id_dim.
+        """
+        ind_x = np.asarray(ind_x)
+        ind_y = np.asarray(ind_y)
+        ind_t = np.asarray(ind_t)
+        n_prof = len(ind_t)
+
+        # Time chunk boundaries. An unchunked dataset is treated as one chunk
+        if gridded.chunks and "t_dim" in gridded.chunks:
+            time_chunks = gridded.chunks["t_dim"]
+        else:
+            time_chunks = (gridded.dims["t_dim"],)
+        chunk_bounds = np.cumsum((0,) + tuple(time_chunks))
+
+        # Build one lazy point-gather per time chunk that contains profiles
+        chunk_ind = []
+        lazy_gathers = []
+        for start_ii, end_ii in zip(chunk_bounds[:-1], chunk_bounds[1:]):
+            ind_in_chunk = np.where(np.logical_and(ind_t >= start_ii, ind_t < end_ii))[0]
+            if len(ind_in_chunk) == 0:
+                continue
+            debug(f"Gathering {len(ind_in_chunk)} points from time indices {start_ii} > {end_ii}")
+            chunk_ind.append(ind_in_chunk)
+            lazy_gathers.append(
+                gridded.isel(
+                    t_dim=xr.DataArray(ind_t[ind_in_chunk], dims="id_dim"),
+                    y_dim=xr.DataArray(ind_y[ind_in_chunk], dims="id_dim"),
+                    x_dim=xr.DataArray(ind_x[ind_in_chunk], dims="id_dim"),
+                )
+            )
+
+        if len(lazy_gathers) == 0:
+            return xr.Dataset()
+
+        compute_kwargs = {}
+        if scheduler is not None:
+            compute_kwargs["scheduler"] = scheduler
+        if n_workers is not None:
+            compute_kwargs["num_workers"] = n_workers
+        gathered = dask.compute(*lazy_gathers, **compute_kwargs)
+
+        # Preallocate output using the first chunk as a template, then fill
+        template = gathered[0]
+        output = {}
+        for vv in template.variables:
+            var = template[vv]
+            if "id_dim" in var.dims:
+                shape = tuple(n_prof if dd == "id_dim" else var.sizes[dd] for dd in var.dims)
+                output[vv] = (var.dims, np.empty(shape, dtype=var.dtype), var.attrs)
+            else:
+                output[vv] = (var.dims, var.values, var.attrs)
+
+        for ind_in_chunk, ds_chunk in zip(chunk_ind, gathered):
+            for vv, (dims, values, _) in output.items():
+                if "id_dim" in dims:
+                    axis = dims.index("id_dim")
+                    np.moveaxis(values, axis, 0)[ind_in_chunk] = np.moveaxis(ds_chunk[vv].values, axis, 0)
+
+        mod_profiles = xr.Dataset(
+            {vv: output[vv] for vv in template.data_vars},
+            coords={vv: output[vv] for vv in template.coords if vv in output},
+        )
+        return mod_profiles
+
+    @staticmethod
+    def _finish_obs_operator(en4, en4_time, mod_profiles, ind_x, ind_y, ind_t):
+        """
+        Adds observation times, interpolation distances/lags and nearest
+        indices to extracted model profiles. Used by obs_operator().
+        """
         # Put obs time into the output array
         mod_profiles["obs_time"] = (["id_dim"], en4_time)
 
@@ -483,20 +629,7 @@ class Profile(Indexed):
 
         reject_tem_ind = 0
         reject_sal_ind = 1
-        if "4.2.0" in self.dataset.history:
-            # from https://www.metoffice.gov.uk/hadobs/en4/en4-0-2-profile-file-format.html
-            reject_tem_reasons = [2, 3, 8, 9, 10, 11, 12, 13, 14, 15, 16]
-            reject_sal_reasons = [2, 3, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29]
-        elif "4.2.2" in self.dataset.history:
-            # from https://www.metoffice.gov.uk/hadobs/en4/en4-2-2-profile-file-format.html
-            reject_tem_reasons = [2, 3, 8, 9, 10, 11, 12, 13, 14, 15, 16]
-            reject_sal_reasons = [2, 3, 21, 22, 23, 24, 25, 26, 27, 28, 29]
-        else:
-            reject_tem_reasons = [2, 3, 8, 9, 10, 11, 12, 13, 14, 15, 16]
-            reject_sal_reasons = [2, 3, 21, 22, 23, 24, 25, 26, 27, 28, 29]
-            debug(
-                f"Assume QC flags following 4.2.2: https://www.metoffice.gov.uk/hadobs/en4/en4-2-2-profile-file-format.html"
-            )
+        reject_tem_reasons, reject_sal_reasons = self._en4_qc_reasons()
 
         qc_integers_tem = []
         qc_integers_sal = []
@@ -535,9 +668,77 @@ class Profile(Indexed):
 
         return qc_integers_tem, qc_integers_sal, qc_integers_both
 
+    def _en4_qc_reasons(self, qc_reasons=None):
+        """
+        Returns lists of the EN4 QC bits that reject temperature and salinity
+        levels. qc_reasons may be a version string (key of en4_qc_reasons) or a
+        dictionary with "temperature" and "salinity" lists. If None, the
+        version is found from the dataset history, defaulting to 4.2.2.
+        """
+        if qc_reasons is None:
+            history = self.dataset.attrs.get("history", "")
+            if "4.2.0" in history:
+                qc_reasons = "4.2.0"
+            else:
+                qc_reasons = "4.2.2"
+                if "4.2.2" not in history:
+                    debug(
+                        f"Assume QC flags following 4.2.2: https://www.metoffice.gov.uk/hadobs/en4/en4-2-2-profile-file-format.html"
+                    )
+        if isinstance(qc_reasons, str):
+            if qc_reasons not in self.en4_qc_reasons:
+                raise ValueError(
+                    f"Unknown EN4 version {qc_reasons}. Options are {list(self.en4_qc_reasons)} or a dictionary."
+                )
+            qc_reasons = self.en4_qc_reasons[qc_reasons]
+        return list(qc_reasons["temperature"]), list(qc_reasons["salinity"])
+
+    @staticmethod
+    def _decode_en4_qc_levels(qc_lev, tem_reasons, sal_reasons):
+        """
+        Decodes integer EN4 level QC flags into boolean arrays of rejected
+        temperature and salinity levels using bitwise operations, so works
+        lazily on dask arrays. A level is rejected when it matches one of the
+        QC integers from calculate_en4_qc_flags_levels(): bit 0 (temperature)
+        and/or bit 1 (salinity) set, together with exactly one reason bit for
+        each rejected variable and no other bits.
+
+        INPUTS
+         qc_lev (xr.DataArray) : Integer level QC flags
+         tem_reasons (list)    : QC bits rejecting temperature
+         sal_reasons (list)    : QC bits rejecting salinity
+
+        OUTPUTS
+         reject_tem, reject_sal : Boolean DataArrays, shaped like qc_lev
+        """
+        tem_mask = np.int64(np.sum([1 << bb for bb in set(tem_reasons)]))
+        sal_mask = np.int64(np.sum([1 << bb for bb in set(sal_reasons)]))
+        flags = qc_lev & 3
+        reasons = qc_lev & ~np.int64(3)
+
+        # Split the reason bits into their lowest set bit and the rest
+        low = reasons & -reasons
+        high = reasons ^ low
+        one_reason = (reasons != 0) & (high == 0)
+        two_reasons = (high != 0) & ((high & (high - 1)) == 0)
+
+        tem_only = (flags == 1) & one_reason & ((reasons & ~tem_mask) == 0)
+        sal_only = (flags == 2) & one_reason & ((reasons & ~sal_mask) == 0)
+        both = (flags == 3) & (
+            (one_reason & ((reasons & tem_mask & sal_mask) != 0))
+            | (
+                two_reasons
+                & (
+                    (((low & tem_mask) != 0) & ((high & sal_mask) != 0))
+                    | (((low & sal_mask) != 0) & ((high & tem_mask) != 0))
+                )
+            )
+        )
+        return tem_only | both, sal_only | both
+
     """================Reshape to 2D================"""
 
-    def reshape_2d(self, var_user_want):
+    def reshape_2d(self, var_user_want, chunks: int = None):
         """
         OBSERVATION type class for reshaping World Ocean Data (WOD) or similar that
         contains 1D profiles (profile * depth levels)  into a 2D array.
@@ -562,107 +763,20 @@ class Profile(Indexed):
                                 a variable is not observed at a location
             z_dim         ::   The dimension for depth levels.
             var_user_want ::   List of observations the user wants to reshape       
+            chunks        ::   Number of casts per chunk. If given, or if the 1D
+                               arrays are dask arrays, the 2D arrays are built
+                               lazily, chunk by chunk over casts.
         """
 
         # find maximum z levels in any of the profiles
-        d_max = int(np.max(self.dataset.z_row_size.values))
-        # number of profiles
-        prof_size = self.dataset.z_row_size.shape[0]
-
-        # set a 2D array (relevant to maximum depth)
-        depth_2d = np.empty(
-            (
-                prof_size,
-                d_max,
-            )
-        )
-        depth_2d[:] = np.nan
-        # reshape depth information from 1D to 2D
-        if np.isnan(self.dataset.z_row_size.values[0]) == False:
-            I_SIZE = int(self.dataset.z_row_size.values[0])
-            depth_2d[0, :I_SIZE] = self.dataset.depth[0:I_SIZE].values
-        for iJ in range(1, prof_size):
-            if np.isnan(self.dataset.z_row_size.values[iJ]) == False:
-                I_START = int(np.nansum(self.dataset.z_row_size.values[:iJ]))
-                I_END = int(np.nansum(self.dataset.z_row_size.values[: iJ + 1]))
-                I_SIZE = int(self.dataset.z_row_size.values[iJ])
-                depth_2d[iJ, 0:I_SIZE] = self.dataset.depth[I_START:I_END].values
-
-        # check reshape
-        T_OBS1 = np.delete(np.ravel(depth_2d), np.isnan(np.ravel(depth_2d)))
-        T_OBS2 = np.delete(self.dataset.depth.values, np.isnan(self.dataset.depth.values))
-        if T_OBS1.size == T_OBS2.size and (int(np.min(T_OBS1 - T_OBS2)) == 0 or int(np.max(T_OBS1 - T_OBS2)) == 0):
-            print("Depth OK reshape successful")
-        else:
-            print("Depth WRONG!! reshape")
-
-        # reshape obs for each variable from 1D to 2D
-        var_all = np.empty(
-            (
-                len(var_user_want),
-                prof_size,
-                d_max,
-            )
-        )
-        var_list = var_user_want[:]
-        counter_i = 0
-        for iN in range(0, len(var_user_want)):
-            print(var_user_want[iN])
-            # check that variable exist in the WOD observations file
-            if var_user_want[iN] in self.dataset:
-                print("observed variable exist")
-                # reshape it into 2D
-                var_2d = np.empty(
-                    (
-                        prof_size,
-                        d_max,
-                    )
-                )
-                var_2d[:] = np.nan
-                # populate array but make sure that the indexing for number of levels
-                # is not nan, as in the data there are nan indexings for number of levels
-                # indicating no observations there
-                if np.isnan(self.dataset[var_user_want[iN] + "_row_size"][0].values) == False:
-                    I_SIZE = int(self.dataset[var_user_want[iN] + "_row_size"][0].values)
-                    var_2d[0, :I_SIZE] = self.dataset[var_user_want[iN]][0:I_SIZE].values
-                for iJ in range(1, prof_size):
-                    if np.isnan(self.dataset[var_user_want[iN] + "_row_size"].values[iJ]) == False:
-                        I_START = int(np.nansum(self.dataset[var_user_want[iN] + "_row_size"].values[:iJ]))
-                        I_END = int(np.nansum(self.dataset[var_user_want[iN] + "_row_size"].values[: iJ + 1]))
-                        I_SIZE = int(self.dataset[var_user_want[iN] + "_row_size"].values[iJ])
-                        var_2d[iJ, 0:I_SIZE] = self.dataset[var_user_want[iN]].values[I_START:I_END]
-
-                # all variables in one array
-                var_all[counter_i, :, :] = var_2d
-                counter_i = counter_i + 1
-                # check that you did everything correctly and the obs in yoru reshaped
-                # array match the observations in original array
-                T_OBS1 = np.delete(np.ravel(var_2d), np.isnan(np.ravel(var_2d)))
-                del I_START, I_END, I_SIZE, var_2d
-                T_OBS2 = np.delete(
-                    self.dataset[var_user_want[iN]].values, np.isnan(self.dataset[var_user_want[iN]].values)
-                )
-
-                if T_OBS1.size == T_OBS2.size and (
-                    int(np.min(T_OBS1 - T_OBS2)) == 0 or int(np.max(T_OBS1 - T_OBS2)) == 0
-                ):
-                    print("OK reshape successful")
-                else:
-                    print("WRONG!! reshape")
-
-            else:
-                print("variable not in observations")
-                var_list[iN] = "NO"
-
-        # REMOVE DUBLICATES
-        var_list = list(dict.fromkeys(var_list))
-        # REMOVE the non-observed variables from the list of variables
-        var_list.remove("NO")
+        z_row_size = self.dataset.z_row_size.values
+        d_max = int(np.nanmax(z_row_size))
+        lazy = chunks is not None or self.dataset.depth.chunks is not None
 
         # create the new 2D dataset array
         wod_profiles_2d = xr.Dataset(
             {
-                "depth": (["id_dim", "z_dim"], depth_2d),
+                "depth": (["id_dim", "z_dim"], self._ragged_to_2d(self.dataset.depth, z_row_size, d_max, lazy, chunks)),
             },
             coords={
                 "time": (["id_dim"], self.dataset.time.values),
@@ -670,13 +784,64 @@ class Profile(Indexed):
                 "longitude": (["id_dim"], self.dataset.longitude.values),
             },
         )
-        for iN in range(0, len(var_list)):
-            wod_profiles_2d[var_list[iN]] = (["id_dim", "z_dim"], var_all[iN, :, :])
+
+        # reshape obs for each variable from 1D to 2D. Skip variables that are not
+        # in the WOD observations file.
+        for var in dict.fromkeys(var_user_want):
+            if var not in self.dataset:
+                debug(f"{var} not in observations")
+                continue
+            var_row_size = self.dataset[var + "_row_size"].values
+            wod_profiles_2d[var] = (
+                ["id_dim", "z_dim"],
+                self._ragged_to_2d(self.dataset[var], var_row_size, d_max, lazy, chunks),
+            )
 
         return_prof = Profile()
         return_prof.dataset = wod_profiles_2d
         return return_prof
 
+    @staticmethod
+    def _ragged_to_2d(ragged, row_size, n_levels, lazy=False, chunks=None):
+        """
+        Scatters a contiguous ragged array (as in WOD files) into a NaN padded
+        2D array of shape (number of casts, n_levels). Cast ii occupies the
+        row_size[ii] values starting at the cumulative sum of the previous row
+        sizes. NaN row sizes mean no observations for that cast.
+
+        If lazy, a dask array is returned, built from chunks of `chunks` casts
+        (or the whole array if chunks is None) so only one chunk is in memory
+        at a time.
+        """
+        row_size = np.nan_to_num(np.array(row_size, dtype=float)).astype(int)
+        offsets = np.concatenate(([0], np.cumsum(row_size)))
+        if offsets[-1] > ragged.shape[0]:
+            raise ValueError(
+                f"Row sizes of {get_slug(ragged)} add up to {offsets[-1]}, but it only has {ragged.shape[0]} values"
+            )
+
+        def scatter(values, sizes):
+            # One fancy-index assignment: (cast, level) position of every value
+            start = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            rows = np.repeat(np.arange(len(sizes)), sizes)
+            cols = np.arange(len(rows)) - np.repeat(start, sizes)
+            array_2d = np.full((len(sizes), n_levels), np.nan)
+            array_2d[rows, cols] = values
+            return array_2d
+
+        n_casts = len(row_size)
+        if not lazy:
+            return scatter(np.asarray(ragged[: offsets[-1]]), row_size)
+
+        data = ragged.data
+        chunks = n_casts if chunks is None else chunks
+        blocks = []
+        for c0 in range(0, n_casts, chunks):
+            c1 = min(c0 + chunks, n_casts)
+            block = dask.delayed(scatter)(data[offsets[c0] : offsets[c1]], row_size[c0:c1])
+            blocks.append(dask.array.from_delayed(block, shape=(c1 - c0, n_levels), dtype=float))
+        return dask.array.concatenate(blocks, axis=0)
+
     def time_slice(self, date0, date1):
         """Return new Gridded object, indexed between dates date0 and date1"""
         dataset = self.dataset
@@ -7,7 +7,8 @@ import pandas as pd
 import glob
 import re
 import pytz
-from .._utils import general_utils, plot_util, crps_util, stats_util
+from concurrent.futures import ProcessPoolExecutor
+from .._utils import general_utils, plot_util, crps_util, stats_util, tidegauge_parser, obs_cache
 from .._utils.logging_util import get_slug, debug, error, info
 from typing import Union
 from pathlib import Path
@@ -41,6 +42,9 @@ class Tidegauge(Timeseries):
     should also be used for quality control/data rejection.
     """
 
+    # Data lines of BODC files start with a cycle number, e.g. "    1) "
+    bodc_data_pattern = r"^\s*\d+\)\s"
+
     def __init__(self, dataset=None, config: Union[Path, str] = None, new_time_coords=None):
         """
         Initialise TIDEGAUGE object as empty or by providing an existing
@@ -110,7 +114,7 @@ class Tidegauge(Timeseries):
             # multiple = False
             self.read_gesla(fn_gesla, date_start=date_start, date_end=date_end, format="v3")
 
-    def read_gesla(self, fn_gesla, date_start=None, date_end=None, format="v3"):
+    def read_gesla(self, fn_gesla, date_start=None, date_end=None, format="v3", n_workers: int = 1, stack=False):
         """
         For reading from a GESLA2 (Format version 3.0) or GESLA3 (Format v5.0)
         file(s) into an xarray dataset.
@@ -128,19 +132,21 @@ class Tidegauge(Timeseries):
         date_start (datetime) : start date for returning data
         date_end (datetime) : end date for returning data
         format (str) : accepts "v3" or "v5"
+        n_workers (int) : number of processes used to read multiple files
+        stack (bool) : if True and multiple files are provided, all gauges are
+                       stacked along id_dim into this object's dataset (times
+                       are merged, with NaN padding) instead of returning a list
 
         Returns
         -------
         Creates xarray.dataset within tidegauge object containing loaded data.
         If multiple files are provided then instead returns a list of NEW
-        tidegauge objects.
+        tidegauge objects (unless stack is True).
         """
         if format != "v3" and format != "v5":
             raise NotImplementedError(f"Not written code for format {format}")
 
         debug(f'Reading "{fn_gesla}" as a GESLA file with {get_slug(self)}')
-        # TODO Maybe include start/end dates
-        dataset = None
 
         # See if its a file list input, or a glob
         if not isinstance(fn_gesla, list):
@@ -152,37 +158,70 @@ class Tidegauge(Timeseries):
         if len(file_list) > 1:
             multiple = True
 
-        ds_list = []
-        # Loop over files and put resulting dataset into an output list
-        for fn in file_list:
-            try:
-                if format == "v3":
-                    header_dict = self._read_gesla_header_v3(fn)
-                elif format == "v5":
-                    header_dict = self._read_gesla_header_v5(fn)
-                dataset = self._read_gesla_data(fn, date_start, date_end, header_length=header_dict["header_length"])
-            except:
-                raise Exception("Problem reading GESLA file: " + fn)
-            # Attributes
-            dataset["longitude"] = ("id_dim", [header_dict["longitude"]])
-            dataset["latitude"] = ("id_dim", [header_dict["latitude"]])
-            dataset["id_name"] = ("id_dim", [header_dict["site_name"]])
-            dataset = dataset.set_coords(["longitude", "latitude", "id_name"])
-
-            # Create tidegauge object, save dataset and append to list
-            if multiple:
+        # Read every file into a dataset, in parallel if requested
+        n_files = len(file_list)
+        read_args = (file_list, [date_start] * n_files, [date_end] * n_files, [format] * n_files)
+        if multiple and n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                ds_list = list(executor.map(self._read_gesla_file, *read_args))
+        else:
+            ds_list = list(map(self._read_gesla_file, *read_args))
+
+        if multiple and stack:
+            # Align all gauges on the union of their times
+            ds_list = [ds.swap_dims({"t_dim": "time"}) for ds in ds_list]
+            dataset = xr.concat(ds_list, dim="id_dim", join="outer").swap_dims({"time": "t_dim"})
+            self.dataset = dataset
+            self.apply_config_mappings()
+        elif multiple:
+            # Create tidegauge objects, save datasets and return list
+            tg_list = []
+            for dataset in ds_list:
                 tg_tmp = Tidegauge()
                 tg_tmp.dataset = dataset
                 tg_tmp.apply_config_mappings()
-                ds_list.append(tg_tmp)
-
-        # If there is only one file, then just return the dataset, not a list
-        if multiple:
-            return ds_list
+                tg_list.append(tg_tmp)
+            return tg_list
         else:
-            self.dataset = dataset
+            # If there is only one file, then just return the dataset, not a list
+            self.dataset = ds_list[0] if ds_list else None
             self.apply_config_mappings()
 
+    @classmethod
+    def _read_gesla_file(cls, fn_gesla, date_start=None, date_end=None, format="v3"):
+        """
+        Reads the header and data of a single GESLA file into a dataset with
+        longitude, latitude and id_name coordinates. Used by read_gesla().
+        The dataset is cached on disk if obs_cache.set_cache_dir() has been used.
+        """
+        options = {"date_start": cls._cache_date(date_start), "date_end": cls._cache_date(date_end), "format": format}
+        return obs_cache.cached_dataset(
+            "gesla", [fn_gesla], options, lambda: cls._parse_gesla_file(fn_gesla, date_start, date_end, format)
+        )
+
+    @staticmethod
+    def _cache_date(date):
+        """Date as a string for observation cache keys, so equal datetimes of different types give the same key."""
+        return None if date is None else str(np.datetime64(date, "ns"))
+
+    @classmethod
+    def _parse_gesla_file(cls, fn_gesla, date_start=None, date_end=None, format="v3"):
+        """Reads a GESLA file without the observation cache. See _read_gesla_file()."""
+        try:
+            if format == "v3":
+                header_dict = cls._read_gesla_header_v3(fn_gesla)
+            elif format == "v5":
+                header_dict = cls._read_gesla_header_v5(fn_gesla)
+            dataset = cls._read_gesla_data(fn_gesla, date_start, date_end, header_length=header_dict["header_length"])
+        except:
+            raise Exception("Problem reading GESLA file: " + fn_gesla)
+        # Attributes
+        dataset["longitude"] = ("id_dim", [header_dict["longitude"]])
+        dataset["latitude"] = ("id_dim", [header_dict["latitude"]])
+        dataset["id_name"] = ("id_dim", [header_dict["site_name"]])
+        dataset = dataset.set_coords(["longitude", "latitude", "id_name"])
+        return dataset
+
     @classmethod
     def _read_gesla_header_v5(cls, fn_gesla):
         """
@@ -197,7 +236,7 @@ class Tidegauge(Timeseries):
         dictionary of attributes
         """
         debug(f'Reading GESLA header from "{fn_gesla}"')
-        with open(fn_gesla) as fid:
+        with tidegauge_parser.header_stream(fn_gesla, 42) as fid:
             # Read lines one by one (hopefully formatting is consistent)
             format_version = float(fid.readline().split()[3])
             # Geographical stuff
@@ -288,7 +327,7 @@ class Tidegauge(Timeseries):
         dictionary of attributes
         """
         debug(f'Reading GESLA header from "{fn_gesla}"')
-        with open(fn_gesla) as fid:
+        with tidegauge_parser.header_stream(fn_gesla, 32) as fid:
             # Read lines one by one (hopefully formatting is consistent)
             format_version = float(fid.readline().split()[3])
             # Geographical stuff
@@ -355,46 +394,25 @@ class Tidegauge(Timeseries):
         -------
         xarray.Dataset containing times, sealevel and quality control flags
         """
-        # Initialise empty dataset and lists
         debug(f'Reading GESLA data from "{fn_gesla}"')
         dataset = xr.Dataset()
-        time = []
-        ssh = []
-        qc_flags = []
-        # Open file and loop until EOF
-        with open(fn_gesla) as file:
-            line_count = 1
-            for line in file:
-                # Read all data. Date boundaries are set later.
-                if line_count > header_length:
-                    working_line = line.split()
-                    if working_line[0] != "#":
-                        time.append(working_line[0] + " " + working_line[1])
-                        ssh.append(float(working_line[2]))
-                        qc_flags.append(int(working_line[3]))
-
-                line_count = line_count + 1
-            debug(f'Read done, close file "{fn_gesla}"')
-
-        # Convert time list to datetimes using pandas
-        time = np.array(pd.to_datetime(time))
+        # Lines are in time order, so stop reading after date_end (to the second, as in the file)
+        end_key = None
+        if date_end is not None:
+            end_key = str(np.datetime64(date_end).astype("datetime64[s]")).replace("-", "/").replace("T", " ").encode()
+        columns = tidegauge_parser.read_columns(fn_gesla, skiprows=header_length, end_key=end_key)
+        debug(f'Read done, close file "{fn_gesla}"')
 
         # Return only values between stated dates
-        start_index = 0
-        end_index = len(time)
-        if date_start is not None:
-            date_start = np.datetime64(date_start)
-            start_index = np.argmax(time >= date_start)
-        if date_end is not None:
-            date_end = np.datetime64(date_end)
-            end_index = np.argmax(time > date_end)
-        time = time[start_index:end_index]
-        ssh = ssh[start_index:end_index]
-        qc_flags = qc_flags[start_index:end_index]
+        if len(columns) == 0:
+            columns = [np.array([], dtype="S1")] * 4
+        time = tidegauge_parser.parse_datetimes(columns[0], columns[1], "%Y/%m/%d", "%H:%M:%S")
+        keep = tidegauge_parser.date_mask(time, date_start, date_end)
+        time = time[keep]
+        ssh = columns[2][keep].astype(np.float64)
+        qc_flags = columns[3][keep].astype(np.int64)
 
         # Set null values to nan
-        ssh = np.array(ssh)
-        qc_flags = np.array(qc_flags)
         ssh[qc_flags == 5] = np.nan
 
         # Assign arrays to Dataset
@@ -433,10 +451,19 @@ class Tidegauge(Timeseries):
         xarray.Dataset object.
         """
         debug(f'Reading "{fn_hlw}" as a HLW file with {get_slug(self)}')
+        options = {"date_start": self._cache_date(date_start), "date_end": self._cache_date(date_end)}
+        self.dataset = obs_cache.cached_dataset(
+            "hlw", [fn_hlw], options, lambda: self._parse_hlw_file(fn_hlw, date_start, date_end)
+        )
+        self.apply_config_mappings()
+
+    @classmethod
+    def _parse_hlw_file(cls, fn_hlw, date_start=None, date_end=None):
+        """Reads the header and data of a HLW file into a dataset. Used by read_hlw()."""
         # TODO Maybe include start/end dates
         try:
-            header_dict = self._read_hlw_header(fn_hlw)
-            dataset = self._read_hlw_data(fn_hlw, header_dict, date_start, date_end)
+            header_dict = cls._read_hlw_header(fn_hlw)
+            dataset = cls._read_hlw_data(fn_hlw, header_dict, date_start, date_end)
             if header_dict["field"] == "TZ:UT(GMT)/BST":
                 debug("Read in as BST, stored as UTC")
             elif header_dict["field"] == "TZ:GMTonly":
@@ -448,8 +475,7 @@ class Tidegauge(Timeseries):
             raise Exception("Problem reading HLW file: " + fn_hlw)
 
         dataset.attrs = header_dict
-        self.dataset = dataset
-        self.apply_config_mappings()
+        return dataset
 
     @classmethod
     def _read_hlw_header(cls, filnam):
@@ -472,10 +498,7 @@ class Tidegauge(Timeseries):
         dictionary of attributes
         """
         debug(f'Reading HLW header from "{filnam}" ')
-        fid = open(filnam)
-
-        # Read lines one by one (hopefully formatting is consistent)
-        header = re.split(r"\s{2,}", fid.readline())
+        header = re.split(r"\s{2,}", tidegauge_parser.read_header_lines(filnam, 1)[0])
         site_name = header[0]
         site_name = site_name.replace(" ", "")
 
@@ -488,8 +511,6 @@ class Tidegauge(Timeseries):
         datum = header[3]
         datum = datum.replace(" ", "")
 
-        debug(f'Read done, close file "{filnam}"')
-        fid.close()
         # Put all header info into an attributes dictionary
         header_dict = {"site_name": site_name, "field": field, "units": units, "datum": datum}
         return header_dict
@@ -510,54 +531,30 @@ class Tidegauge(Timeseries):
         -------
         xarray.Dataset containing times, High and Low water values
         """
-        import datetime
-
-        # Initialise empty dataset and lists
+        # Initialise empty dataset
         debug(f'Reading HLW data from "{filnam}"')
         dataset = xr.Dataset()
-        time = []
-        ssh = []
+        columns = tidegauge_parser.read_columns(filnam, skiprows=header_length)
+        debug(f'Read done, close file "{filnam}"')
+        if len(columns) == 0:
+            columns = [np.array([], dtype="S1")] * 3
 
+        # Read all data. Date boundaries are set later.
+        time = tidegauge_parser.parse_datetimes(columns[0], columns[1], "%d/%m/%Y", "%H:%M")
         if header_dict["field"] == "TZ:UT(GMT)/BST":
-            localtime_flag = True
-        else:
-            localtime_flag = False
-
-        # Open file and loop until EOF
-        with open(filnam) as file:
-            line_count = 1
-            for line in file:
-                # Read all data. Date boundaries are set later.
-                if line_count > header_length:
-                    working_line = line.split()
-                    if working_line[0] != "#":
-                        time_str = working_line[0] + " " + working_line[1]
-                        # Read time as datetime.datetime because it can handle local timezone easily AND the unusual date format
-                        datetime_obj = datetime.datetime.strptime(time_str, "%d/%m/%Y %H:%M")
-                        if localtime_flag == True:
-                            bst_obj = pytz.timezone("Europe/London")
-                            time.append(np.datetime64(bst_obj.localize(datetime_obj).astimezone(pytz.utc)))
-                        else:
-                            time.append(np.datetime64(datetime_obj))
-                        ssh.append(float(working_line[2]))
-                line_count = line_count + 1
-            debug(f'Read done, close file "{filnam}"')
+            # Local UK time to UTC. Times that are ambiguous or skipped when
+            # the clocks change are taken as GMT.
+            utc_time = pd.DatetimeIndex(time).tz_localize(
+                "Europe/London", ambiguous=np.zeros(len(time), dtype=bool), nonexistent="NaT"
+            )
+            utc_time = utc_time.tz_convert("UTC").tz_localize(None).values
+            time = np.where(np.isnat(utc_time), time, utc_time)
+        ssh = columns[2].astype(float)
 
         # Return only values between stated dates
-        start_index = 0
-        end_index = len(time)
-        if date_start is not None:
-            # start_index = general_utils.nearest_datetime_ind(time, date_start)
-            date_start = np.datetime64(date_start)
-            start_index = np.argmax(time >= date_start)
-            debug(f"date_start: {date_start}. start_index: {start_index}")
-        if date_end is not None:
-            # end_index = general_utils.nearest_datetime_ind(time, date_end)
-            date_end = np.datetime64(date_end)
-            end_index = np.argmax(time > date_end)
-            debug(f"date_end: {date_end}. end_index: {end_index}")
-        time = time[start_index:end_index]
-        ssh = ssh[start_index:end_index]
+        keep = tidegauge_parser.date_mask(time, date_start, date_end)
+        time = time[keep]
+        ssh = ssh[keep]
         debug(f"ssh: {ssh}")
         # Assign arrays to Dataset
         dataset["ssh"] = xr.DataArray(ssh, dims=["time"]).expand_dims("id_dim")
@@ -828,10 +825,19 @@ class Tidegauge(Timeseries):
         xarray.Dataset object.
         """
         debug(f'Reading "{fn_bodc}" as a BODC file with {get_slug(self)}')
+        options = {"date_start": self._cache_date(date_start), "date_end": self._cache_date(date_end)}
+        self.dataset = obs_cache.cached_dataset(
+            "bodc", [fn_bodc], options, lambda: self._parse_bodc_file(fn_bodc, date_start, date_end)
+        )
+        self.apply_config_mappings()
+
+    @classmethod
+    def _parse_bodc_file(cls, fn_bodc, date_start=None, date_end=None):
+        """Reads the header and data of a BODC file into a dataset. Used by read_bodc()."""
         # TODO Maybe include start/end dates
         try:
-            header_dict = self._read_bodc_header(fn_bodc)
-            dataset = self._read_bodc_data(fn_bodc, date_start, date_end)
+            header_dict = cls._read_bodc_header(fn_bodc)
+            dataset = cls._read_bodc_data(fn_bodc, date_start, date_end)
         except:
             raise Exception("Problem reading BODC file: " + fn_bodc)
         # Attributes
@@ -845,8 +851,7 @@ class Tidegauge(Timeseries):
         del header_dict["site_name"]
 
         dataset.attrs = header_dict
-        self.dataset = dataset
-        self.apply_config_mappings()
+        return dataset
 
     @staticmethod
     def _read_bodc_header(fn_bodc):
@@ -862,25 +867,20 @@ class Tidegauge(Timeseries):
         dictionary of attributes
         """
         debug(f'Reading BODC header from "{fn_bodc}"')
-        fid = open(fn_bodc)
+        n_header = tidegauge_parser.count_header_lines(fn_bodc, Tidegauge.bodc_data_pattern)
 
         # Read lines one by one (hopefully formatting is consistent)
         # Geographical stuff
         header_dict = {}
-        header = True
-        for line in fid:
-            if ":" in line and header == True:
-                (key, val) = line.split(":")
-                key = key.lower().strip().replace(" ", "_")
-                val = val.lower().strip().replace(" ", "_")
-                header_dict[key] = val
-                debug(f"Header key: {key} and value: {val}")
-            else:
-                # debug('No colon')
-                header = False
+        for line in tidegauge_parser.read_header_lines(fn_bodc, n_header):
+            if ":" not in line:
+                break
+            (key, val) = line.split(":")
+            key = key.lower().strip().replace(" ", "_")
+            val = val.lower().strip().replace(" ", "_")
+            header_dict[key] = val
+            debug(f"Header key: {key} and value: {val}")
         header_dict["site_name"] = header_dict["site"]  # duplicate as standard name
-        debug(f'Read done, close file "{fn_bodc}"')
-        fid.close()
 
         header_dict["latitude"] = float(header_dict["latitude"])
         header_dict["longitude"] = float(header_dict["longitude"])
@@ -888,7 +888,7 @@ class Tidegauge(Timeseries):
         return header_dict
 
     @staticmethod
-    def _read_bodc_data(fn_bodc, date_start=None, date_end=None, header_length: int = 11):
+    def _read_bodc_data(fn_bodc, date_start=None, date_end=None, header_length: int = None):
         """
         Reads observation data from a BODC file.
 
@@ -897,72 +897,35 @@ class Tidegauge(Timeseries):
         fn_bodc (str) : path to bodc tide gauge file
         date_start (datetime) : start date for returning data
         date_end (datetime) : end date for returning data
-        header_length (int) : number of lines in header (to skip when reading)
+        header_length (int) : number of lines in header (to skip when reading).
+                              By default, lines before the first numbered cycle.
 
         Returns
         -------
         xarray.Dataset containing times, sealevel and quality control flags
         """
-        # Initialise empty dataset and lists
+        # Initialise empty dataset
         debug(f'Reading BODC data from "{fn_bodc}"')
         dataset = xr.Dataset()
-        time = []
-        ssh = []
-        qc_flags = []
-        residual = []
-        # Open file and loop until EOF
-        with open(fn_bodc) as file:
-            line_count = 1
-            for line in file:
-                # Read all data. Date boundaries are set later.
-                if line_count > header_length:
-                    try:
-                        working_line = line.split()
-                        time_str = working_line[1] + " " + working_line[2]  # Empty lines cause trouble
-                        ssh_str = working_line[3]
-                        residual_str = working_line[4]
-                        if ssh_str[-1].isalpha():
-                            qc_flag_str = ssh_str[-1]
-                            ssh_str = ssh_str.replace(qc_flag_str, "")
-                            residual_str = residual_str.replace(qc_flag_str, "")
-                        elif residual_str[-1].isalpha():  # sometimes residual has a
-                            # flag when elevation does not
-                            qc_flag_str = residual_str[-1]
-                            ssh_str = ssh_str.replace(qc_flag_str, "")
-                            residual_str = residual_str.replace(qc_flag_str, "")
-                        else:
-                            qc_flag_str = ""
-                        # debug(line_count-header_length, residual_str, float(residual_str))
-                        # debug(working_line, ssh_str, qc_flag_str)
-                        time.append(time_str)
-                        qc_flags.append(qc_flag_str)
-                        ssh.append(float(ssh_str))
-                        residual.append(float(residual_str))
-                    except:
-                        debug(f"{file} probably empty line at end. Breaks split()")
-                line_count = line_count + 1
-            debug(f'Read done, close file "{fn_bodc}"')
-
-        # Convert time list to datetimes using pandas
-        time = np.array(pd.to_datetime(time))
+        if header_length is None:
+            header_length = tidegauge_parser.count_header_lines(fn_bodc, Tidegauge.bodc_data_pattern)
+        columns = tidegauge_parser.read_columns(fn_bodc, skiprows=header_length)
+        debug(f'Read done, close file "{fn_bodc}"')
+        if len(columns) == 0:
+            columns = [np.array([], dtype="S1")] * 5
 
-        # Return only values between stated dates
-        start_index = 0
-        end_index = len(time)
-        if date_start is not None:
-            date_start = np.datetime64(date_start)
-            start_index = np.argmax(time >= date_start)
-        if date_end is not None:
-            date_end = np.datetime64(date_end)
-            end_index = np.argmax(time > date_end)
-        time = time[start_index:end_index]
-        ssh = ssh[start_index:end_index]
-        qc_flags = qc_flags[start_index:end_index]
+        # Columns are cycle number, date, time, elevation and residual
+        time = tidegauge_parser.parse_datetimes(columns[1], columns[2], "%Y/%m/%d", "%H:%M:%S")
 
-        # Set null values to nan
-        ssh = np.array(ssh)
-        qc_flags = np.array(qc_flags)
-        # ssh[qc_flags==5] = np.nan
+        # Return only values between stated dates
+        keep = tidegauge_parser.date_mask(time, date_start, date_end)
+        time = time[keep]
+
+        # Values may have a trailing QC flag, e.g. 5.354M. The residual
+        # sometimes has a flag when the elevation does not.
+        ssh, qc_flags = tidegauge_parser.split_flags(columns[3][keep])
+        residual_flags = tidegauge_parser.split_flags(columns[4][keep])[1]
+        qc_flags = np.where(qc_flags == "", residual_flags, qc_flags)
 
         # Assign arrays to Dataset
         dataset["ssh"] = xr.DataArray(ssh, dims=["time"]).expand_dims("id_dim")
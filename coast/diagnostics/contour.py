@@ -9,9 +9,9 @@ from ..data.coast import Coast
 from ..data.gridded import Gridded
 from scipy import interpolate
 from scipy.integrate import cumtrapz
-from sklearn.neighbors import BallTree
 from skimage import measure
 from .._utils.logging_util import warn, error
+from .._utils.spatial_index import SpatialIndex
 
 # =============================================================================
 # The contour module is a place for code related to contours only
@@ -113,16 +113,13 @@ class Contour:
         x_ind = contour[:, 1]
 
         # Create tree of lat and lon on the pre-processed contour
-        ball_tree = BallTree(
-            np.deg2rad(
-                list(zip(gridded.dataset.latitude.values[y_ind, x_ind], gridded.dataset.longitude.values[y_ind, x_ind]))
-            ),
-            metric="haversine",
+        tree = SpatialIndex(
+            gridded.dataset.longitude.values[y_ind, x_ind], gridded.dataset.latitude.values[y_ind, x_ind]
         )
 
         # Get start and end indices for contour and subset accordingly
-        start_idx = ball_tree.query(np.deg2rad([start_coords]))[1][0][0]
-        end_idx = ball_tree.query(np.deg2rad([end_coords]))[1][0][0]
+        _, (ind,) = tree.query([start_coords[1], end_coords[1]], [start_coords[0], end_coords[0]])
+        start_idx, end_idx = ind[:, 0]
         if start_idx > end_idx:
             y_ind = y_ind[end_idx : start_idx + 1]
             x_ind = x_ind[end_idx : start_idx + 1]
@@ -422,6 +422,11 @@ class ProfileAnalysis(Indexed):
         another profile object is passed, profiles will be mapped and
         interpolated onto the other objects depth array.
 
+        For 'linear' and 'nearest' interpolation, all profiles are interpolated
+        at once using general_utils.interpolate_1d_rows(). If the profile
+        dataset is dask-backed, this is done lazily chunk-by-chunk over id_dim.
+        Any other method falls back to looping over profiles with scipy.
+
         INPUTS:
          new_depth (array or dataArray) : new depths onto which to interpolate
                                           see description above for more info.
@@ -435,6 +440,85 @@ class ProfileAnalysis(Indexed):
         if type(new_depth) is Profile:
             new_depth = new_depth.dataset.depth
 
+        if interp_method not in ["linear", "nearest"]:
+            return cls._interpolate_vertical_loop(profile, new_depth, interp_method, print_progress)
+
+        ds = profile.dataset
+
+        # Get variable names on z_dim dimension
+        zvars = []
+        notzvars = []
+        for items in ds.keys():
+            if "z_dim" in ds[items].dims:
+                zvars.append(items)
+            else:
+                notzvars.append(items)
+
+        # New depths get their own core dimension during interpolation
+        if len(new_depth.shape) == 1:
+            debug(f"Interpolating onto reference depths")
+            new_depth = xr.DataArray(np.asarray(new_depth), dims=["z_dim_new"])
+            new_depth_2d = new_depth.expand_dims(id_dim=ds.sizes["id_dim"])
+        else:
+            debug(f"Interpolating onto depths of existing Profile object")
+            # Profiles are mapped in order, so drop coordinates to avoid alignment
+            new_depth = xr.DataArray(new_depth).rename({"z_dim": "z_dim_new"})
+            new_depth = new_depth.drop_vars(list(new_depth.coords))
+            if new_depth.chunks is not None:
+                new_depth = new_depth.chunk({"z_dim_new": -1})
+            new_depth_2d = new_depth
+        n_z_new = new_depth.sizes["z_dim_new"]
+
+        # Core dimensions must be a single chunk for apply_ufunc
+        depth = ds.depth.reset_coords(drop=True)
+        depth = depth.drop_vars(list(depth.coords))
+        if depth.chunks is not None:
+            depth = depth.chunk({"z_dim": -1})
+
+        # Keep everything without a z_dim. Any other z_dim coordinates only
+        # make sense if the number of levels is unchanged.
+        interpolated = ds[notzvars].drop_vars("depth", errors="ignore")
+        if n_z_new != ds.sizes["z_dim"]:
+            interpolated = interpolated.drop_dims("z_dim", errors="ignore")
+
+        for vv in zvars:
+            if vv == "depth":
+                continue
+            var = ds[vv].drop_vars(list(ds[vv].coords))
+            if var.shape != depth.shape:
+                continue
+            if var.chunks is not None:
+                var = var.chunk({"z_dim": -1})
+
+            var_interp = xr.apply_ufunc(
+                general_utils.interpolate_1d_rows,
+                depth,
+                var,
+                new_depth,
+                kwargs={"method": interp_method},
+                input_core_dims=[["z_dim"], ["z_dim"], ["z_dim_new"]],
+                output_core_dims=[["z_dim_new"]],
+                dask="parallelized",
+                output_dtypes=[np.result_type(var.dtype, np.float64)],
+                dask_gufunc_kwargs={"output_sizes": {"z_dim_new": n_z_new}},
+            )
+            interpolated[vv] = var_interp.transpose("id_dim", "z_dim_new").rename({"z_dim_new": "z_dim"})
+
+        # Put the new depth into the interpolated profiles
+        interpolated["depth"] = new_depth_2d.transpose("id_dim", "z_dim_new").rename({"z_dim_new": "z_dim"})
+
+        # Set depth to be a coordinate and return a new Profile object.
+        interpolated = interpolated.set_coords(["depth"])
+        return Profile(dataset=interpolated)
+
+    @classmethod
+    def _interpolate_vertical_loop(cls, profile, new_depth, interp_method="linear", print_progress=False):
+        """
+        Profile-by-profile version of interpolate_vertical(), using
+        scipy.interpolate.interp1d. Used for interpolation methods other than
+        'linear' and 'nearest'.
+        """
+
         # If input is 1D, then interpolation will be done onto this for all.
         if len(new_depth.shape) == 1:
             repeated_depth = True
@@ -521,13 +605,21 @@ class ProfileAnalysis(Indexed):
         return Profile(dataset=interpolated)
 
     @classmethod
-    def average_into_grid_boxes(cls, profile, grid_lon, grid_lat, min_datapoints=1, season=None, var_modifier=""):
+    def average_into_grid_boxes(
+        cls, profile, grid_lon, grid_lat, min_datapoints=1, season=None, var_modifier="", chunk_size=None
+    ):
         """
         Takes the contents of this Profile() object and averages each variables
         into geographical grid boxes. At the moment, this expects there to be
         no vertical dimension (z_dim), so make sure to slice the data out you
         want first using isel, Profile.depth_means() or Profile.bottom_means().
 
+        Profiles are assigned to boxes once, then the sums, sums of squares and
+        counts in every box are accumulated with np.bincount, so the cost does
+        not depend on the number of boxes. This is done over chunks of profiles
+        (chunk_size, or the dask chunks of the dataset), so only one chunk of
+        the dataset needs to be in memory at a time.
+
         INPUTS
          grid_lon (array)     : 1d array of longitudes
          grid_lat (array)     : 1d array of latitude
@@ -537,71 +629,108 @@ class ProfileAnalysis(Indexed):
                                 grid_N, which tells you how many points were
                                 averaged into each box.
         season (str)          : 'DJF','MAM','JJA' or 'SON'. Will only average
-                                data from specified season.
+                                data from specified season. May also be a list
+                                of seasons, in which case all are averaged in
+                                one pass and "_<season>" is added to the output
+                                variable names (after var_modifier).
         var_modifier (str)    : Suffix to add to all averaged variables in the
                                 output dataset. For example you may want to add
                                 _DJF to all vars if restricting only to winter.
+        chunk_size (int)      : Number of profiles to process at once. Defaults to
+                                the dataset chunks along id_dim, or all profiles.
 
         OUTPUTS
-         COAsT Gridded object containing averaged data.
+         COAsT Gridded object containing averaged data. For each variable, the
+         mean (named as the input variable) and the standard deviation (with
+         suffix _std) are returned, along with grid_N.
         """
 
         # Get the dataset in this object
         ds = profile.dataset
 
-        # Get a list of variables in this dataset
-        vars_in = [items for items in ds.keys()]
-        vars_out = [vv + "{0}".format(var_modifier) for vv in vars_in]
+        # Get a list of (numeric) variables in this dataset
+        vars_in = [items for items in ds.keys() if ds[items].dtype.kind in "biuf"]
 
         # Get output dimensions and create 2D longitude and latitude arrays
+        grid_lon = np.array(grid_lon)
+        grid_lat = np.array(grid_lat)
         n_r = len(grid_lat) - 1
         n_c = len(grid_lon) - 1
+        n_boxes = n_r * n_c
         lon_mids = (grid_lon[1:] + grid_lon[:-1]) / 2
         lat_mids = (grid_lat[1:] + grid_lat[:-1]) / 2
         lon2, lat2 = np.meshgrid(lon_mids, lat_mids)
 
-        # Create empty output dataset
+        # Each season gets its own set of boxes
+        if season is None or isinstance(season, str):
+            seasons = [season]
+            suffixes = [var_modifier]
+        else:
+            seasons = list(season)
+            suffixes = ["{0}_{1}".format(var_modifier, ss) for ss in seasons]
+        n_bins = n_boxes * len(seasons)
+
+        # Accumulate counts, sums and sums of squares over chunks of profiles
+        if chunk_size is None:
+            chunk_size = ds.chunks.get("id_dim", [ds.dims["id_dim"]])[0]
+        chunk_size = max(int(chunk_size), 1)
+        grid_n = np.zeros(n_bins)
+        counts = {vv: np.zeros(n_bins) for vv in vars_in}
+        sums = {vv: np.zeros(n_bins) for vv in vars_in}
+        sums_sq = {vv: np.zeros(n_bins) for vv in vars_in}
+        shifts = {}
+        for start in range(0, ds.dims["id_dim"], chunk_size):
+            ds_chunk = ds.isel(id_dim=slice(start, start + chunk_size))
+
+            # Box index of every profile (boxes include their lower bounds)
+            col = np.searchsorted(grid_lon, ds_chunk.longitude.values, side="right") - 1
+            row = np.searchsorted(grid_lat, ds_chunk.latitude.values, side="right") - 1
+            in_grid = (col >= 0) & (col < n_c) & (row >= 0) & (row < n_r)
+            bins = np.where(in_grid, row * n_c + col, -1)
+
+            # Offset boxes by season, dropping profiles in other seasons
+            if seasons != [None]:
+                season_array = general_utils.determine_season(ds_chunk.time)
+                season_ind = np.full(len(bins), -1)
+                for ss, season_name in enumerate(seasons):
+                    season_ind[season_array == season_name] = ss
+                bins = np.where((bins >= 0) & (season_ind >= 0), bins + season_ind * n_boxes, -1)
+
+            keep = bins >= 0
+            bins = bins[keep]
+            grid_n += np.bincount(bins, minlength=n_bins)
+            for vv in vars_in:
+                values = ds_chunk[vv].transpose("id_dim", ...).values[keep].astype(float)
+                values = values.reshape(len(bins), -1)
+                valid = np.isfinite(values)
+                if vv not in shifts and np.any(valid):
+                    # Shift values before squaring, for a more accurate variance
+                    shifts[vv] = values[valid][0]
+                shifted = np.where(valid, values - shifts.get(vv, 0), 0)
+                bins_vv = np.broadcast_to(bins[:, None], values.shape)
+                counts[vv] += np.bincount(bins_vv.ravel(), weights=valid.ravel(), minlength=n_bins)
+                sums[vv] += np.bincount(bins_vv.ravel(), weights=shifted.ravel(), minlength=n_bins)
+                sums_sq[vv] += np.bincount(bins_vv.ravel(), weights=(shifted**2).ravel(), minlength=n_bins)
+
+        # Create output dataset. Only average if N > min_datapoints
         ds_out = xr.Dataset(coords=dict(longitude=(["y_dim", "x_dim"], lon2), latitude=(["y_dim", "x_dim"], lat2)))
+        enough_data = grid_n > min_datapoints
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for vv in vars_in:
+                mean_shifted = np.where(enough_data, sums[vv] / counts[vv], np.nan)
+                variance = np.maximum(sums_sq[vv] / counts[vv] - mean_shifted**2, 0)
+                mean = mean_shifted + shifts.get(vv, 0)
+                for ss, suffix in enumerate(suffixes):
+                    box_slice = slice(ss * n_boxes, (ss + 1) * n_boxes)
+                    ds_out[vv + suffix] = (["y_dim", "x_dim"], mean[box_slice].reshape(n_r, n_c))
+                    ds_out[vv + "_std" + suffix] = (["y_dim", "x_dim"], np.sqrt(variance[box_slice]).reshape(n_r, n_c))
 
-        # Loop over variables and create empty placeholders
-        for vv in vars_out:
-            ds_out[vv] = (["y_dim", "x_dim"], np.zeros((n_r, n_c)) * np.nan)
         # Grid_N is the count ineach box
-        ds_out["grid_N{0}".format(var_modifier)] = (["y_dim", "x_dim"], np.zeros((n_r, n_c)) * np.nan)
-
-        # Extract season if needed
-        if season is not None:
-            season_array = general_utils.determine_season(ds.time)
-            s_ind = season_array == season
-            ds = ds.isel(id_dim=s_ind)
-
-        # Loop over every box (slow??)
-        for rr in range(n_r - 1):
-            for cc in range(n_c - 1):
-                # Get box bounds for easier understanding
-                lon_min = grid_lon[cc]
-                lon_max = grid_lon[cc + 1]
-                lat_min = grid_lat[rr]
-                lat_max = grid_lat[rr + 1]
-
-                # Get profiles inside this box
-                condition1 = np.logical_and(ds.longitude >= lon_min, ds.longitude < lon_max)
-                condition2 = np.logical_and(ds.latitude >= lat_min, ds.latitude < lat_max)
-                prof_ind = np.logical_and(condition1, condition2)
-
-                # Only average if N > min_datapoints
-                if np.sum(prof_ind) > min_datapoints:
-                    for vv in range(len(vars_in)):
-                        vv_in = vars_in[vv]
-                        vv_out = vars_out[vv]
-
-                        # Check datatype isn't string
-                        if ds[vv_in].dtype in ["S1", "S2"]:
-                            continue
-                        ds_out[vv_out][rr, cc] = ds[vv_in].isel(id_dim=prof_ind).mean()
-
-                # Store N in own variable
-                ds_out["grid_N{0}".format(var_modifier)][rr, cc] = np.sum(prof_ind)
+        for ss, suffix in enumerate(suffixes):
+            ds_out["grid_N{0}".format(suffix)] = (
+                ["y_dim", "x_dim"],
+                grid_n[ss * n_boxes : (ss + 1) * n_boxes].reshape(n_r, n_c),
+            )
 
         # Create and populate output dataset
         gridded_out = Gridded()
@@ -1,8 +1,10 @@
 """An analysis class for tide gauge."""
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import pandas as pd
 import xarray as xr
 from ..data.tidegauge import Tidegauge
-from .._utils import general_utils, stats_util, crps_util
+from .._utils import general_utils, stats_util, crps_util, harmonic_util
 import matplotlib.dates as mdates
 import utide as ut
 import scipy.signal as signal
@@ -55,12 +57,14 @@ class TidegaugeAnalysis:
         method="ols",
         conf_int="linear",
         Rayleigh_min=0.95,
+        n_workers=1,
+        batch=True,
     ):
         """
         Does a harmonic analysis for each timeseries inside this object using
-        the utide library. All arguments except min_datapoints are arguments
-        that are passed to ut.solve(). Please see the utide  website for more
-        information:
+        the utide library. All arguments except min_datapoints, n_workers and
+        batch are arguments that are passed to ut.solve(). Please see the utide
+        website for more information:
 
             https://pypi.org/project/UTide/
 
@@ -74,11 +78,19 @@ class TidegaugeAnalysis:
         list can be passed to reconstruct_tide_utide() in this object to create
         a new TidegaugeMultiple object containing reconstructed tide data.
 
+        When method="ols", timeseries with missing values in the same places
+        (e.g. gauges on a common time axis) share one harmonic model matrix and
+        are solved together, which is much faster than one at a time and gives
+        the same result. Set batch=False to call ut.solve() for every series.
+
         INPUTS
          data_array     : Xarray data_array from a coast.Tidegauge() object
                           e.g. tidegauge.dataset.ssh
          min_datapoints : If a time series has less than this value number of
                           datapoints, then omit from the analysis.
+         n_workers      : Number of processes to share the analyses between.
+         batch          : If True, solve timeseries with the same missing
+                          values together (see above).
          <all_others>   : Inputs to utide.solve(). See website above.
 
         OUTPUTS
@@ -86,76 +98,86 @@ class TidegaugeAnalysis:
          is omitted, it will contain [] for it's entry.
         """
         # Make name shorter for computations and get dimension lengths
-        ds = data_array
+        ds = data_array.transpose("id_dim", "t_dim")
         n_port = ds.sizes["id_dim"]
         n_time = ds.sizes["t_dim"]
 
         # Harmonic analysis datenums -- for utide to work correctly < 0.3.0
         # time = mdates.date2num(ds.time.values)
         time = ds.time.values  # accepts np.datetime64 uTide >= 0.3.0
+        values = ds.values
+        latitudes = np.broadcast_to(ds.latitude.values, n_port)
+        opts = dict(nodal=nodal, trend=trend, method=method, conf_int=conf_int, Rayleigh_min=Rayleigh_min)
+
+        # Ports without enough datapoints for analysis get an empty list
+        analyses = [[] for pp in range(n_port)]
+        ports = np.flatnonzero(n_time - np.sum(np.isnan(values), axis=1) >= min_datapoints)
+        if len(ports) == 0:
+            return analyses
+
+        # Share ports between workers, keeping those that can be solved together
+        if batch:
+            groups = harmonic_util.group_stations(values[ports], latitudes[ports] if nodal else None)
+        else:
+            groups = [np.array([ii]) for ii in range(len(ports))]
+        if n_workers > 1:
+            n_chunks = int(np.ceil(n_workers / len(groups)))
+            groups = [chunk for group in groups for chunk in np.array_split(group, n_chunks) if len(chunk) > 0]
+        tasks = [ports[group] for group in groups]
+        task_args = (
+            [time] * len(tasks),
+            [values[task] for task in tasks],
+            [latitudes[task] for task in tasks],
+            [opts] * len(tasks),
+            [batch] * len(tasks),
+        )
+
+        # Do harmonic analysis using UTide
+        if n_workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                results = list(executor.map(harmonic_util.solve_stations, *task_args))
+        else:
+            results = list(map(harmonic_util.solve_stations, *task_args))
 
-        # Create empty list of analyses
-        analyses = []
-
-        # Loop over ports
-        for pp in range(0, n_port):
-            # Temporary in-loop datasets
-            ds_port = ds.isel(id_dim=pp).load()
-            number_of_nan = np.sum(np.isnan(ds_port.values))
-
-            # If not enough datapoints for analysis then append an empty list
-            if (n_time - number_of_nan) < min_datapoints:
-                analyses.append([])
-                continue
-
-            # Do harmonic analysis using UTide
-            uts_obs = ut.solve(
-                time,
-                ds_port.values,
-                lat=ds_port.latitude.values,
-                nodal=nodal,
-                trend=trend,
-                method=method,
-                conf_int=conf_int,
-                Rayleigh_min=Rayleigh_min,
-            )
-
-            analyses.append(uts_obs)
+        for task, solutions in zip(tasks, results):
+            for pp, uts_obs in zip(task, solutions):
+                analyses[pp] = uts_obs
 
         return analyses
 
     @classmethod
-    def reconstruct_tide_utide(cls, data_array, utide_solution_list, constit=None, output_name="reconstructed"):
+    def reconstruct_tide_utide(
+        cls, data_array, utide_solution_list, constit=None, output_name="reconstructed", n_workers=1
+    ):
         """
         Use the tarray of times to reconstruct a time series series using a
         list of utide analysis objects. This list can be obtained
         using harmonic_analysis_utide(). Specify constituents to use in the
         reconstruction by passing a list of strings such as 'M2' to the constit
         argument. This won't work if a specified constituent is not present in
-        the analysis.
+        the analysis. Reconstructions are shared between n_workers processes.
         """
 
         # Get dimension lengths
         n_port = len(utide_solution_list)
-        n_time = len(data_array.time)
 
         # Harmonic analysis datenums -- needed for utide < 0.3.0
         # time = mdates.date2num(data_array.time)
         time = data_array.time  # accepts np.datetime64 uTide >= 0.3.0
 
-        # Get  coordinates from data_array and convert to Dataset for output
-        reconstructed = np.zeros((n_port, n_time)) * np.nan
-
-        # Loop over ports
-        for pp in np.arange(n_port):
-            # Reconstruct full tidal signal using utide
-            pp_solution = utide_solution_list[pp]
-            if len(pp_solution) == 0:
-                continue
-
-            # Call utide.reconstruct
-            tide = np.array(ut.reconstruct(time, pp_solution, constit=constit).h)
-            reconstructed[pp] = tide
+        # Reconstruct full tidal signal using utide
+        if n_workers > 1 and n_port > 1:
+            chunks = np.array_split(np.arange(n_port), min(n_workers, n_port))
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                results = executor.map(
+                    harmonic_util.reconstruct_stations,
+                    [time.values] * len(chunks),
+                    [[utide_solution_list[pp] for pp in chunk] for chunk in chunks],
+                    [constit] * len(chunks),
+                )
+                reconstructed = np.concatenate(list(results))
+        else:
+            reconstructed = harmonic_util.reconstruct_stations(time, utide_solution_list, constit=constit)
 
         # Create output dataset and return it in new Tidegauge object.
         ds_out = xr.Dataset(data_array.coords)
@@ -200,7 +222,7 @@ class TidegaugeAnalysis:
         return Tidegauge(dataset=ds_coords)
 
     @classmethod
-    def threshold_statistics(cls, dataset, thresholds=np.arange(-0.4, 2, 0.1), peak_separation=12):
+    def threshold_statistics(cls, dataset, thresholds=np.arange(-0.4, 2, 0.1), peak_separation=12, n_workers: int = 1):
         """
         Do some threshold statistics for all variables with a time dimension
         inside this tidegauge_multiple object. Specifically, this routine will
@@ -223,6 +245,9 @@ class TidegaugeAnalysis:
         Output is a xarray dataset containing analysed variables. The name of
         each analysis variable is constructed using the original variable name
         and one of the above analysis categories.
+
+        Peaks and maxima are found once for each port and counted over all
+        thresholds together. Ports are shared between n_workers processes.
         """
 
         # Set up working datasets and lists
@@ -232,44 +257,34 @@ class TidegaugeAnalysis:
         var_list = list(ds.keys())
         n_thresholds = len(thresholds)
         n_port = ds.sizes["id_dim"]
+        stat_names = ["peak_count_", "time_over_threshold_", "dailymax_count_", "monthlymax_count_"]
+
+        # Daily and monthly maxima are grouped by day of month and month of year
+        time = pd.DatetimeIndex(ds.time.values)
+        group_keys = (time.day.values, time.month.values)
 
         # Loop over vars in the input dataset
         for vv in var_list:
-            empty_thresh = np.zeros((n_port, n_thresholds)) * np.nan
-            ds_thresh["peak_count_" + vv] = (["id_dim", "threshold"], np.array(empty_thresh))
-            ds_thresh["time_over_threshold_" + vv] = (["id_dim", "threshold"], np.array(empty_thresh))
-            ds_thresh["dailymax_count_" + vv] = (["id_dim", "threshold"], np.array(empty_thresh))
-            ds_thresh["monthlymax_count_" + vv] = (["id_dim", "threshold"], np.array(empty_thresh))
-
-            for pp in range(n_port):
-                # Identify NTR peaks for threshold analysis
-                data_pp = ds[vv].isel(id_dim=pp)
-                if np.sum(np.isnan(data_pp.values)) == ds.sizes["t_dim"]:
-                    continue
-
-                pk_ind, _ = signal.find_peaks(data_pp.values.copy(), distance=peak_separation)
-                pk_values = data_pp[pk_ind]
-
-                # Threshold Analysis
-                for nn in range(0, n_thresholds):
-                    # Calculate daily and monthly maxima for threshold analysis
-                    ds_daily = data_pp.groupby("time.day")
-                    ds_daily_max = ds_daily.max(skipna=True)
-                    ds_monthly = data_pp.groupby("time.month")
-                    ds_monthly_max = ds_monthly.max(skipna=True)
-
-                    threshn = thresholds[nn]
-                    # NTR: Threshold Frequency (Peaks)
-                    ds_thresh["peak_count_" + vv][pp, nn] = np.sum(pk_values >= threshn)
-
-                    # NTR: Threshold integral (Timestamps over threshold)
-                    ds_thresh["time_over_threshold_" + vv][pp, nn] = np.sum(data_pp >= threshn)  # sum of booleans
-
-                    # NTR: Number of daily maxima over threshold
-                    ds_thresh["dailymax_count_" + vv][pp, nn] = np.sum(ds_daily_max.values >= threshn)
-
-                    # NTR: Number of monthly maxima over threshold
-                    ds_thresh["monthlymax_count_" + vv][pp, nn] = np.sum(ds_monthly_max.values >= threshn)
+            values = ds[vv].transpose("id_dim", "t_dim").values
+            # Ports with no data are left as NaN
+            ports = [pp for pp in range(n_port) if not np.all(np.isnan(values[pp]))]
+            task_args = (
+                [values[pp] for pp in ports],
+                [thresholds] * len(ports),
+                [peak_separation] * len(ports),
+                [group_keys] * len(ports),
+            )
+            if n_workers > 1 and len(ports) > 1:
+                with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                    results = list(executor.map(stats_util.threshold_counts, *task_args))
+            else:
+                results = list(map(stats_util.threshold_counts, *task_args))
+
+            stats = np.full((len(stat_names), n_port, n_thresholds), np.nan)
+            for pp, counts in zip(ports, results):
+                stats[:, pp] = counts
+            for name, stat in zip(stat_names, stats):
+                ds_thresh[name + vv] = (["id_dim", "threshold"], stat)
 
         return ds_thresh
 
@@ -406,6 +421,7 @@ class TidegaugeAnalysis:
         gridded_data,
         nh_radius: float = 20,
         time_interp: str = "linear",
+        n_workers: int = 1,
     ):
         """
         Comparison of observed variable to modelled using the Continuous
@@ -425,6 +441,7 @@ class TidegaugeAnalysis:
         time_interp (str)    : Type of time interpolation to use (s)
         create_new_obj (bool): If True, save output to new TIDEGAUGE obj.
                                Otherwise, save to this obj.
+        n_workers (int)      : Number of processes to share tide gauges between.
 
         Returns
         -------
@@ -436,32 +453,19 @@ class TidegaugeAnalysis:
         crps = altimetry.crps(nemo, 'sossheig', 'ssh')
         """
 
-        # Extract variables and get shape
-        mod_var = gridded_data
-        obs_var = tidegauge_data
-        n_id, n_time = obs_var.shape
-
-        # Make output CRPS array
-        crps_out = np.zeros((n_id, n_time))
-        N_out = np.zeros((n_id, n_time))
-
-        # Loop over location indices
-        for ii in range(n_id):
-            obs_ii = obs_var.isel(id_dim=ii)
-
-            # Calculate CRPS
-            crps_list, n_model_pts, contains_land = crps_util.crps_sonf_fixed(
-                mod_var,
-                tidegauge_data.longitude.values,
-                tidegauge_data.latitude.values,
-                obs_ii.values,
-                tidegauge_data.time.values,
-                nh_radius,
-                time_interp,
-            )
-
-            crps_out[ii] = crps_list
-            N_out[ii] = n_model_pts
+        # Neighbourhoods of all locations are found and read together,
+        # then CRPS is calculated for each location
+        obs_var = tidegauge_data.transpose("id_dim", "t_dim")
+        crps_out, N_out, _ = crps_util.crps_sonf_stations(
+            gridded_data,
+            np.broadcast_to(obs_var.longitude.values, obs_var.sizes["id_dim"]),
+            np.broadcast_to(obs_var.latitude.values, obs_var.sizes["id_dim"]),
+            obs_var.values,
+            obs_var.time.values,
+            nh_radius,
+            time_interp,
+            n_workers=n_workers,
+        )
 
         # Put into new object
         new_dataset = xr.Dataset(tidegauge_data.coords)
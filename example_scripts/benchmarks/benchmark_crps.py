@@ -0,0 +1,81 @@
+# This script measures the time taken by neighbourhood CRPS calculations in
+# coast._utils.crps_util for a synthetic altimetry-like track (moving
+# observations) and a synthetic tide gauge (fixed observations) against a
+# synthetic hourly model grid (including many gauges at once with
+# crps_sonf_stations()), and by crps_empirical_batch() for a synthetic
+# ensemble forecast.
+#
+# No input files are needed. Edit the sizes below to suit.
+
+import sys
+
+# IF USING A DEVELOPMENT BRANCH OF COAST, ADD THE REPOSITORY TO PATH:
+# sys.path.append('<PATH_TO_COAST_REPO')
+import time
+import numpy as np
+import pandas as pd
+import xarray as xr
+from coast._utils import crps_util
+
+n_y, n_x, n_days = 400, 300, 7
+n_track = 200000
+n_ensemble_obs, n_members = 1000000, 50
+nh_radius = 20
+rng = np.random.default_rng(0)
+
+# Model grid of roughly 3 km spacing, with land in one corner
+longitude, latitude = np.meshgrid(np.linspace(-12, 2, n_x), np.linspace(48, 60, n_y))
+model_time = pd.date_range("2020-01-01", periods=n_days * 24, freq="1h")
+ssh = rng.normal(0, 1, (len(model_time), n_y, n_x)).astype(np.float32)
+ssh[:, : n_y // 5, : n_x // 5] = np.nan
+model = xr.DataArray(
+    ssh,
+    dims=("t_dim", "y_dim", "x_dim"),
+    coords={
+        "longitude": (("y_dim", "x_dim"), longitude),
+        "latitude": (("y_dim", "x_dim"), latitude),
+        "time": ("t_dim", model_time),
+    },
+)
+
+# Satellite passes crossing the domain
+track_time = model_time[0] + pd.to_timedelta(np.sort(rng.uniform(0, n_days * 86400, n_track)), "s")
+track_lon = rng.uniform(-12, 2, n_track)
+track_lat = 48 + (track_lon + 12) * 12 / 14 + rng.normal(0, 0.5, n_track)
+track_ssh = rng.normal(0, 1, n_track)
+
+for time_interp in ["nearest", "linear"]:
+    t0 = time.perf_counter()
+    crps_util.crps_sonf_moving(model, track_lon, track_lat, track_ssh, track_time.values, nh_radius, time_interp)
+    elapsed = time.perf_counter() - t0
+    print(f"Moving observations ({time_interp}): {n_track} CRPS values in {elapsed:.2f}s", flush=True)
+
+# Tide gauges every 15 minutes
+n_gauges, n_workers = 100, 4
+gauge_time = pd.date_range(model_time[0], model_time[-1], freq="15min")
+t0 = time.perf_counter()
+crps_util.crps_sonf_fixed(model, -4, 55, rng.normal(0, 1, len(gauge_time)), gauge_time.values, nh_radius, "linear")
+elapsed = time.perf_counter() - t0
+print(f"Fixed observations (linear): {len(gauge_time)} CRPS values in {elapsed:.2f}s", flush=True)
+
+gauge_lon = rng.uniform(-9, 2, n_gauges)
+gauge_lat = rng.uniform(51, 60, n_gauges)
+gauge_ssh = rng.normal(0, 1, (n_gauges, len(gauge_time)))
+for workers in [1, n_workers]:
+    t0 = time.perf_counter()
+    crps_util.crps_sonf_stations(
+        model, gauge_lon, gauge_lat, gauge_ssh, gauge_time.values, nh_radius, "linear", n_workers=workers
+    )
+    elapsed = time.perf_counter() - t0
+    print(f"{n_gauges} tide gauges ({workers} workers): {gauge_ssh.size} CRPS values in {elapsed:.2f}s", flush=True)
+
+# Ensemble forecasts, one row per observation
+ensemble = rng.normal(0, 1, (n_ensemble_obs, n_members))
+ensemble_obs = rng.normal(0, 1, n_ensemble_obs)
+for chunk_size in [None, 100000]:
+    t0 = time.perf_counter()
+    crps = crps_util.crps_empirical_batch(ensemble, ensemble_obs, chunk_size=chunk_size)
+    if chunk_size is not None:
+        crps = crps.compute()
+    elapsed = time.perf_counter() - t0
+    print(f"Ensemble (chunk_size={chunk_size}): {n_ensemble_obs} CRPS values in {elapsed:.2f}s", flush=True)
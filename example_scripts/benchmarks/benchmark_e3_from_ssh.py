@@ -0,0 +1,71 @@
+# This script measures the time taken and peak memory used by
+# Gridded.get_e3_from_ssh() for synthetic hourly sea surface height of
+# increasing length, with a synthetic domain_cfg file written to a temporary
+# directory. The scale factors are returned lazily, so each is reduced to its
+# total here, which evaluates it without holding the full 4D field in memory.
+#
+# No input files are needed. Edit the sizes below to suit.
+
+import sys
+
+# IF USING A DEVELOPMENT BRANCH OF COAST, ADD THE REPOSITORY TO PATH:
+# sys.path.append('<PATH_TO_COAST_REPO')
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import xarray as xr
+import coast
+
+n_z, n_y, n_x = 50, 200, 200
+n_times = [24, 96, 192]
+rng = np.random.default_rng(0)
+
+
+def domain_variable(low, high, n_z=None):
+    shape = (1, n_y, n_x) if n_z is None else (1, n_z, n_y, n_x)
+    dims = ("t", "y", "x") if n_z is None else ("t", "z", "y", "x")
+    return dims, rng.uniform(low, high, shape)
+
+
+domain = {f"e3{grid}_0": domain_variable(1, 20, n_z) for grid in "tuvfw"}
+for grid in "tuvf":
+    domain[f"e1{grid}"] = domain_variable(1000, 2000)
+    domain[f"e2{grid}"] = domain_variable(1000, 2000)
+    domain[f"glam{grid}"] = domain_variable(-5, 0)
+    domain[f"gphi{grid}"] = domain_variable(50, 55)
+domain["bottom_level"] = (("t", "y", "x"), rng.integers(0, n_z, (1, n_y, n_x)).astype(np.int32))
+
+with tempfile.TemporaryDirectory() as dn_tmp:
+    fn_domain = os.path.join(dn_tmp, "domain_cfg.nc")
+    xr.Dataset(domain).to_netcdf(fn_domain)
+    ds_domain = xr.open_dataset(fn_domain).squeeze().rename({"z": "z_dim", "y": "y_dim", "x": "x_dim"})
+
+    for n_time in n_times:
+        nemo_t = coast.Gridded()
+        nemo_t.filename_domain = fn_domain
+        nemo_t.dataset = xr.Dataset(
+            {
+                "ssh": (("t_dim", "y_dim", "x_dim"), rng.normal(0, 1, (n_time, n_y, n_x))),
+                "e3_0": ds_domain.e3t_0,
+                "bottom_level": ds_domain.bottom_level,
+                "e1": ds_domain.e1t,
+                "e2": ds_domain.e2t,
+            },
+            coords={"time": ("t_dim", pd.date_range("2020-01-01", periods=n_time, freq="1h"))},
+        )
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        e3 = coast.Gridded.get_e3_from_ssh(nemo_t, True, True, True, True, True)
+        totals = [float(e3_grid.sum()) for e3_grid in e3]
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        size = n_time * n_z * n_y * n_x * 8 / 1024**2
+        print(
+            f"{n_time} times ({size:.0f} MB per grid): all five grids in {elapsed:.2f}s, peak memory {peak / 1024**2:.0f} MB",
+            flush=True,
+        )
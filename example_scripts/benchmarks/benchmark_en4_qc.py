@@ -0,0 +1,50 @@
+# This script measures the throughput (profiles per second) of the EN4 quality
+# control in Profile.process_en4() on a synthetic EN4-like dataset, both in
+# memory and lazily with dask chunks over profiles.
+#
+# No input files are needed. Edit n_profiles, n_levels and chunk_size below to suit.
+
+import sys
+
+# IF USING A DEVELOPMENT BRANCH OF COAST, ADD THE REPOSITORY TO PATH:
+# sys.path.append('<PATH_TO_COAST_REPO')
+import time
+import numpy as np
+import xarray as xr
+import coast
+
+n_profiles = [10000, 100000]
+n_levels = 400
+chunk_size = 10000
+
+rng = np.random.default_rng(0)
+qc_pool = coast.Profile(dataset=xr.Dataset(attrs={"history": "EN.4.2.2"})).calculate_en4_qc_flags_levels()
+qc_pool = np.array(sum(qc_pool, []) + [0], dtype=np.int32)
+
+for n_prof in n_profiles:
+    # Mostly good data, with ~5% of levels and profiles flagged
+    qc_levels = np.where(rng.random((n_prof, n_levels)) < 0.05, rng.choice(qc_pool, (n_prof, n_levels)), 0)
+    qc_profiles = np.where(rng.random(n_prof) < 0.05, rng.integers(0, 8, n_prof), 0)
+    data = rng.normal(10, 2, (n_prof, n_levels)).astype(np.float32)
+    dataset = xr.Dataset(
+        {
+            "temperature": (["id_dim", "z_dim"], data),
+            "potential_temperature": (["id_dim", "z_dim"], data),
+            "practical_salinity": (["id_dim", "z_dim"], data + 25),
+            "qc_flags_profiles": (["id_dim"], qc_profiles),
+            "qc_flags_levels": (["id_dim", "z_dim"], qc_levels.astype(np.int32)),
+        },
+        coords={"time": (["id_dim"], np.datetime64("2010-01-01") + np.arange(n_prof) * np.timedelta64(1, "m"))},
+        attrs={"history": "EN.4.2.2"},
+    )
+
+    for label, chunks in [("in memory", None), (f"dask chunks of {chunk_size}", {"id_dim": chunk_size})]:
+        profile = coast.Profile(dataset=dataset if chunks is None else dataset.chunk(chunks))
+        t0 = time.perf_counter()
+        processed = profile.process_en4()
+        processed.dataset.load()
+        elapsed = time.perf_counter() - t0
+        print(
+            f"{n_prof} profiles x {n_levels} levels, {label}: {elapsed:.2f}s ({n_prof / elapsed:,.0f} profiles/s)",
+            flush=True,
+        )
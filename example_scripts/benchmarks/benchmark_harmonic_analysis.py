@@ -0,0 +1,58 @@
+# This script measures the time taken by TidegaugeAnalysis.harmonic_analysis_utide()
+# and reconstruct_tide_utide() for many synthetic tide gauges on a common hourly
+# time axis: one utide.solve() call per gauge (batch=False), gauges with the
+# same missing values solved together (batch=True), and both shared between
+# processes (n_workers).
+#
+# No input files are needed. Edit n_port, n_days and n_workers below to suit.
+
+import sys
+
+# IF USING A DEVELOPMENT BRANCH OF COAST, ADD THE REPOSITORY TO PATH:
+# sys.path.append('<PATH_TO_COAST_REPO')
+import time
+import numpy as np
+import pandas as pd
+import xarray as xr
+import coast
+
+n_port = 100
+n_days = 365
+n_workers = 4
+rng = np.random.default_rng(0)
+
+# Hourly M2, S2, K1 and O1 tides with noise. A few gauges have a gap.
+times = pd.date_range("2010-01-01", periods=n_days * 24, freq="1h")
+days = np.arange(len(times)) / 24
+periods = [0.5175, 0.5, 0.9973, 1.0758]
+ssh = np.zeros((n_port, len(times)))
+for period in periods:
+    ssh += rng.uniform(0.1, 2, (n_port, 1)) * np.cos(2 * np.pi * days / period - rng.uniform(0, 2 * np.pi, (n_port, 1)))
+ssh += rng.normal(0, 0.1, ssh.shape)
+ssh[: n_port // 10, 1000:1200] = np.nan
+
+dataset = xr.Dataset(
+    {"ssh": (["id_dim", "t_dim"], ssh)},
+    coords={
+        "time": ("t_dim", times),
+        "longitude": ("id_dim", rng.uniform(-10, 2, n_port)),
+        "latitude": ("id_dim", rng.uniform(50, 60, n_port)),
+    },
+)
+tganalysis = coast.TidegaugeAnalysis()
+
+for label, kwargs in [
+    ("one station at a time", dict(batch=False)),
+    ("batched", dict(batch=True)),
+    (f"batched, {n_workers} workers", dict(batch=True, n_workers=n_workers)),
+]:
+    t0 = time.perf_counter()
+    analyses = tganalysis.harmonic_analysis_utide(dataset.ssh, **kwargs)
+    elapsed = time.perf_counter() - t0
+    print(f"harmonic_analysis_utide, {label}: {n_port} gauges in {elapsed:.2f}s", flush=True)
+
+for workers in [1, n_workers]:
+    t0 = time.perf_counter()
+    tganalysis.reconstruct_tide_utide(dataset.ssh, analyses, n_workers=workers)
+    elapsed = time.perf_counter() - t0
+    print(f"reconstruct_tide_utide, {workers} workers: {n_port} gauges in {elapsed:.2f}s", flush=True)
@@ -0,0 +1,50 @@
+# This script compares the nearest neighbour backends in coast._utils.spatial_index
+# (used by general_utils.nearest_indices_2d and friends) on synthetic curvilinear
+# grids of realistic sizes. For each grid it times building the tree, a k=1 query
+# for a set of observation locations and a radius query, and checks that both
+# backends return the same nearest neighbours.
+#
+# No input files are needed. Edit grid_sizes and n_obs below to suit.
+
+import sys
+
+# IF USING A DEVELOPMENT BRANCH OF COAST, ADD THE REPOSITORY TO PATH:
+# sys.path.append('<PATH_TO_COAST_REPO')
+import time
+import numpy as np
+from coast._utils import spatial_index
+
+grid_sizes = [(375, 297), (1240, 1458), (3059, 4322)]  # AMM7, AMM15, ORCA12-like
+n_obs = 100000
+radius_km = 10
+backends = ["balltree", "kdtree"]
+
+rng = np.random.default_rng(0)
+for ny, nx in grid_sizes:
+    # Slightly rotated grid over the north west European shelf
+    jj, ii = np.meshgrid(np.linspace(0, 1, ny), np.linspace(0, 1, nx), indexing="ij")
+    longitude = -20 + 33 * ii + 2 * jj
+    latitude = 40 + 25 * jj - 1 * ii
+    obs_lon = rng.uniform(-18, 12, n_obs)
+    obs_lat = rng.uniform(41, 64, n_obs)
+
+    print(f"Grid {ny} x {nx} ({ny * nx} points), {n_obs} observations", flush=True)
+    results = {}
+    for backend in backends:
+        t0 = time.perf_counter()
+        index = spatial_index.SpatialIndex(longitude, latitude, backend=backend)
+        t1 = time.perf_counter()
+        _, (ind_y, ind_x) = index.query(obs_lon, obs_lat)
+        t2 = time.perf_counter()
+        index.query_radius(obs_lon[:1000], obs_lat[:1000], radius_km / 6371)
+        t3 = time.perf_counter()
+        results[backend] = (ind_y, ind_x)
+        print(
+            f"  {backend:>8}: build {t1 - t0:7.2f}s, query {t2 - t1:7.2f}s, radius query (1000 pts) {t3 - t2:7.2f}s",
+            flush=True,
+        )
+
+    n_same = np.sum(
+        np.logical_and(results["kdtree"][0] == results["balltree"][0], results["kdtree"][1] == results["balltree"][1])
+    )
+    print(f"  Identical nearest neighbours: {n_same} / {n_obs}", flush=True)
@@ -0,0 +1,82 @@
+# This script measures the time taken by the ASCII tide gauge readers
+# (Tidegauge.read_gesla(), read_bodc() and read_hlw()) on synthetic multi-year
+# records, written to a temporary directory in each file format.
+#
+# No input files are needed. Edit n_years below to suit.
+
+import sys
+
+# IF USING A DEVELOPMENT BRANCH OF COAST, ADD THE REPOSITORY TO PATH:
+# sys.path.append('<PATH_TO_COAST_REPO')
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import coast
+
+n_years = 20
+rng = np.random.default_rng(0)
+
+# 15 minute sea level record with occasional QC flags
+times = pd.date_range("2000-01-01", periods=n_years * 365 * 96, freq="15min")
+ssh = 5 + 3 * np.sin(2 * np.pi * np.arange(len(times)) / 49.7) + rng.normal(0, 0.1, len(times))
+residual = rng.normal(0, 0.2, len(times))
+gesla_qc = np.where(rng.random(len(times)) < 0.02, 5, 1)
+bodc_flags = np.where(rng.random(len(times)) < 0.02, "M", " ")
+
+# High and low waters, roughly every 6 hours 12 minutes
+hlw_times = times[0] + pd.to_timedelta(np.cumsum(rng.integers(360, 385, n_years * 705)), "min")
+hlw_times = hlw_times.floor("min")
+
+
+def column(values, fmt):
+    return pd.Series(values).map(fmt.format).values.astype(str)
+
+
+with tempfile.TemporaryDirectory() as dn_tmp:
+    fn_gesla = os.path.join(dn_tmp, "synthetic-gesla")
+    with open(fn_gesla, "w") as file:
+        file.write("# FORMAT VERSION 3.0\n# SITE NAME Synthetic\n# COUNTRY gbr\n# CONTRIBUTOR none\n")
+        file.write("# LATITUDE 53.45\n# LONGITUDE -3.02\n# COORDINATE SYSTEM WGS84\n")
+        file.write(f"# START DATE/TIME {times[0]:%Y/%m/%d %H:%M:%S}\n# END DATE/TIME {times[-1]:%Y/%m/%d %H:%M:%S}\n")
+        file.write("# TIME ZONE HOURS 0\n# DATUM INFORMATION Chart datum\n# INSTRUMENT unknown\n")
+        file.write("# PRECISION 0.001\n# NULL VALUE -99.9999\n" + "#\n" * 18)
+        lines = np.char.add(times.strftime("%Y/%m/%d %H:%M:%S").values.astype(str), column(ssh, " {:10.4f}"))
+        lines = np.char.add(lines, column(gesla_qc, " {:5d}    1\n"))
+        file.write("".join(lines))
+
+    fn_bodc = os.path.join(dn_tmp, "synthetic-bodc.txt")
+    with open(fn_bodc, "w") as file:
+        file.write("Port:              P000\nSite:              Synthetic\nLatitude:          53.45\n")
+        file.write("Longitude:         -3.02\nStart Date:        01JAN2000-00.00.00\n")
+        file.write("End Date:          31DEC2019-23.45.00\nContributor:       None\n")
+        file.write("Datum information: The data refer to Admiralty Chart Datum (ACD)\n")
+        file.write("Parameter code:    ASLVBG02 = Surface elevation (unspecified datum)\n")
+        file.write("  Cycle    Date      Time    ASLVBG02   Residual\n")
+        file.write(" Number yyyy mm dd hh mi ssf         f          f\n")
+        lines = np.char.add(
+            column(np.arange(1, len(times) + 1), "{:>8}) "), times.strftime("%Y/%m/%d %H:%M:%S").values.astype(str)
+        )
+        lines = np.char.add(np.char.add(lines, column(ssh, " {:10.3f}")), bodc_flags)
+        lines = np.char.add(np.char.add(lines, column(residual, " {:10.3f}")), np.char.add(bodc_flags, "\n"))
+        file.write("".join(lines))
+
+    fn_hlw = os.path.join(dn_tmp, "synthetic-hlw.txt")
+    with open(fn_hlw, "w") as file:
+        file.write("SYNTHETIC    TZ: UT(GMT)/BST     Units: METRES    Datum: Chart Datum\n")
+        lines = np.char.add(
+            hlw_times.strftime("%d/%m/%Y  %H:%M").values.astype(str), column(ssh[: len(hlw_times)], " {:7.2f}\n")
+        )
+        file.write("".join(lines))
+
+    for label, method, fn_tg, n_lines in [
+        ("GESLA", "read_gesla", fn_gesla, len(times)),
+        ("BODC", "read_bodc", fn_bodc, len(times)),
+        ("HLW", "read_hlw", fn_hlw, len(hlw_times)),
+    ]:
+        tidegauge = coast.Tidegauge()
+        t0 = time.perf_counter()
+        getattr(tidegauge, method)(fn_tg)
+        elapsed = time.perf_counter() - t0
+        print(f"{label}: {n_lines} records in {elapsed:.2f}s ({n_lines / elapsed:,.0f} records/s)", flush=True)
@@ -0,0 +1,422 @@
+# Test with PyTest
+
+import os
+
+import coast
+import gsw
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from coast._utils import domain_cache
+from coast.data import gridded
+
+CONFIG_T = "config/example_nemo_grid_t.json"
+CONFIG_U = "config/example_nemo_grid_u.json"
+CONFIG_W = "config/example_nemo_grid_w.json"
+
+
+@pytest.fixture
+def write_domain():
+    # Writes a domain_cfg file with uniform 10 m levels and 1 km cells on the t, u, v and f grids
+    def write(fn_domain, n_z=3, n_y=5, n_x=6, bottom_level=None):
+        jj, ii = np.meshgrid(np.arange(n_y), np.arange(n_x), indexing="ij")
+        if bottom_level is None:
+            bottom_level = np.full((n_y, n_x), n_z)
+        domain = {
+            "bathymetry": (("t", "y", "x"), (100 + 10 * ii)[np.newaxis].astype(float)),
+            "top_level": (("t", "y", "x"), np.ones((1, n_y, n_x), dtype=int)),
+            "bottom_level": (("t", "y", "x"), np.array(bottom_level)[np.newaxis]),
+            "e3w_0": (("t", "z", "y", "x"), np.full((1, n_z, n_y, n_x), 10.0)),
+        }
+        for grid, x_offset, y_offset in [("t", 0, 0), ("u", 0.5, 0), ("v", 0, 0.5), ("f", 0.5, 0.5)]:
+            domain[f"glam{grid}"] = (("t", "y", "x"), (ii + x_offset)[np.newaxis].astype(float))
+            domain[f"gphi{grid}"] = (("t", "y", "x"), (50 + jj + y_offset)[np.newaxis].astype(float))
+            domain[f"e1{grid}"] = (("t", "y", "x"), np.full((1, n_y, n_x), 1000.0))
+            domain[f"e2{grid}"] = (("t", "y", "x"), np.full((1, n_y, n_x), 1000.0))
+            domain[f"e3{grid}_0"] = (("t", "z", "y", "x"), np.full((1, n_z, n_y, n_x), 10.0))
+        xr.Dataset(domain).to_netcdf(fn_domain)
+
+    return write
+
+
+@pytest.fixture
+def fn_domain(tmp_path, write_domain):
+    fn_domain = str(tmp_path / "domain_cfg.nc")
+    write_domain(fn_domain)
+    return fn_domain
+
+
+@pytest.fixture
+def empty_domain_cache():
+    domain_cache.clear_cache()
+    yield
+    domain_cache.clear_cache()
+
+
+@pytest.fixture
+def level_domain():
+    # Two 10 m thick levels; rows of a land column, a one level column and a two level column
+    e3 = np.full((1, 2, 2, 3), 10.0)
+    levels = np.array([[[0, 1, 2], [0, 1, 2]]], dtype=np.int32)
+    return xr.Dataset(
+        {
+            "e3_0": (("t", "z_dim", "y_dim", "x_dim"), e3),
+            "e3t_0": (("t", "z_dim", "y_dim", "x_dim"), e3),
+            "e3u_0": (("t", "z_dim", "y_dim", "x_dim"), e3),
+            "top_level": (("t", "y_dim", "x_dim"), np.minimum(levels, 1)),
+            "bottom_level": (("t", "y_dim", "x_dim"), levels),
+        }
+    )
+
+
+@pytest.fixture
+def column_gridded():
+    # Three 10 m thick levels above a land level; a land column, a column 20 m deep and one 30 m deep
+    e3_0 = np.full((4, 1, 3), 10.0)
+    e3_0[:, 0, 0] = 0
+    e3_0[2:, 0, 1] = 0
+    e3_0[3, 0, 2] = 0
+    nemo = coast.Gridded()
+    nemo.dataset = xr.Dataset(
+        {
+            "e3_0": (("z_dim", "y_dim", "x_dim"), e3_0),
+            "depth_0": (("z_dim", "y_dim", "x_dim"), np.cumsum(e3_0, axis=0) - e3_0 / 2),
+            "bottom_level": (("y_dim", "x_dim"), np.array([[0, 2, 3]])),
+        }
+    )
+    return nemo
+
+
+@pytest.fixture
+def ts_gridded():
+    # Lazy temperature and salinity on a small t-grid, with one missing column
+    rng = np.random.default_rng(0)
+    shape = (2, 3, 4, 5)
+    lon, lat = np.meshgrid(np.linspace(-5, 0, shape[3]), np.linspace(50, 55, shape[2]))
+    e3_0 = np.full(shape[1:], 10.0)
+    temperature = rng.uniform(5, 15, shape)
+    temperature[:, :, 0, 0] = np.nan
+    nemo = coast.Gridded()
+    nemo.grid_ref = "t-grid"
+    nemo.dataset = xr.Dataset(
+        {
+            "salinity": (("t_dim", "z_dim", "y_dim", "x_dim"), rng.uniform(30, 36, shape)),
+            "temperature": (("t_dim", "z_dim", "y_dim", "x_dim"), temperature),
+            "e3_0": (("z_dim", "y_dim", "x_dim"), e3_0),
+        },
+        coords={
+            "depth_0": (("z_dim", "y_dim", "x_dim"), np.cumsum(e3_0, axis=0) - 5),
+            "latitude": (("y_dim", "x_dim"), lat),
+            "longitude": (("y_dim", "x_dim"), lon),
+            "time": ("t_dim", np.array(["2020-01-01", "2020-01-02"], dtype="datetime64[ns]")),
+        },
+    ).chunk({"t_dim": 1, "y_dim": 2})
+    return nemo
+
+
+@pytest.fixture
+def c_grids():
+    # t, u and v grids with 1 km by 2 km cells and 10 m levels; the last column of t points is land
+    n_z, n_y, n_x = 3, 4, 6
+    e1 = np.full((n_y, n_x), 1000.0)
+    e3 = np.full((n_z, n_y, n_x), 10.0)
+    grids = {}
+    for grid_ref in ["t-grid", "u-grid", "v-grid"]:
+        nemo = coast.Gridded()
+        nemo.grid_ref = grid_ref
+        nemo.dataset = xr.Dataset(
+            {
+                "e1": (("y_dim", "x_dim"), e1),
+                "e2": (("y_dim", "x_dim"), 2 * e1),
+                "e3_0": (("z_dim", "y_dim", "x_dim"), e3),
+            },
+            coords={"depth_0": (("z_dim", "y_dim", "x_dim"), np.cumsum(e3, axis=0), {"units": "m"})},
+        )
+        grids[grid_ref] = nemo
+    bottom_level = np.full((n_y, n_x), n_z)
+    bottom_level[:, -1] = 0
+    grids["t-grid"].dataset["bottom_level"] = (("y_dim", "x_dim"), bottom_level)
+    return grids
+
+
+@pytest.fixture
+def rotated_gridded():
+    # A rotated grid, so that the nearest point in degrees is not always the nearest on the sphere
+    jj, ii = np.meshgrid(np.arange(40), np.arange(60), indexing="ij")
+    nemo = coast.Gridded()
+    nemo.dataset = xr.Dataset(
+        coords={
+            "longitude": (("y_dim", "x_dim"), -10 + 0.2 * ii - 0.1 * jj),
+            "latitude": (("y_dim", "x_dim"), 50 + 0.05 * ii + 0.1 * jj),
+        }
+    )
+    return nemo
+
+
+@pytest.fixture
+def model_array():
+    lon, lat = np.meshgrid(np.linspace(-5, 5, 6), np.linspace(50, 55, 5))
+    time = pd.date_range("2020-01-01", periods=4, freq="1h").values
+    return xr.DataArray(
+        np.arange(4 * 5 * 6, dtype=float).reshape(4, 5, 6),
+        dims=("t_dim", "y_dim", "x_dim"),
+        coords={"longitude": (("y_dim", "x_dim"), lon), "latitude": (("y_dim", "x_dim"), lat), "time": ("t_dim", time)},
+    )
+
+
+def great_circle_argmin(nemo, lat, lon):
+    lon_rad, lat_rad = np.radians(nemo.dataset.longitude.values), np.radians(nemo.dataset.latitude.values)
+    cos_dist = np.sin(lat_rad) * np.sin(np.radians(lat)) + np.cos(lat_rad) * np.cos(np.radians(lat)) * np.cos(
+        lon_rad - np.radians(lon)
+    )
+    return list(np.unravel_index(np.argmax(cos_dist), cos_dist.shape))
+
+
+def test_domain_cache(fn_domain, write_domain, empty_domain_cache):
+    nemo_t = coast.Gridded(fn_domain=fn_domain, config=CONFIG_T)
+    nemo_u = coast.Gridded(fn_domain=fn_domain, config=CONFIG_U)
+    # The u-grid object reuses the domain opened for the t-grid, and renames it for its own grid
+    info = domain_cache.cache_info()
+    assert (info["hits"], info["misses"], info["size"]) == (1, 1, 1)
+    nemo_t2 = coast.Gridded(fn_domain=fn_domain, config=CONFIG_T)
+    assert domain_cache.cache_info()["hits"] == 2
+    xr.testing.assert_identical(nemo_t.dataset, nemo_t2.dataset)
+    # Building the u-grid (which averages bathymetry onto u points) does not change the shared domain
+    assert np.allclose(nemo_t2.dataset.bathymetry[0], 100 + 10 * np.arange(6))
+    assert np.allclose(nemo_u.dataset.bathymetry[0, :-1], 105 + 10 * np.arange(5))
+
+    # Subset limits are part of the key
+    nemo_sub = coast.Gridded(fn_domain=fn_domain, config=CONFIG_T, lims=[1, 4, 0, 3])
+    assert nemo_sub.dataset.longitude.shape == (3, 3)
+    assert domain_cache.cache_info()["misses"] == 2
+
+    # A changed file is read again
+    write_domain(fn_domain + ".new", n_x=7)
+    os.utime(fn_domain + ".new", (0, 0))
+    os.replace(fn_domain + ".new", fn_domain)
+    assert coast.Gridded(fn_domain=fn_domain, config=CONFIG_T).dataset.longitude.shape == (5, 7)
+    assert domain_cache.cache_info()["misses"] == 3
+
+
+def test_timezero_depths(fn_domain, empty_domain_cache):
+    nemo_t = coast.Gridded(fn_domain=fn_domain, config=CONFIG_T)
+    nemo_u = coast.Gridded(fn_domain=fn_domain, config=CONFIG_U)
+    nemo_t2 = coast.Gridded(fn_domain=fn_domain, config=CONFIG_T)
+    nemo_u2 = coast.Gridded(fn_domain=fn_domain, config=CONFIG_U)
+    # Depths are lazy, and all grid objects on the same domain share them
+    assert domain_cache.cache_info()["misses"] == 1
+    assert nemo_t.dataset.depth_0.chunks is not None
+    assert nemo_t.dataset.depth_0.data is nemo_t2.dataset.depth_0.data
+    assert nemo_u.dataset.depth_0.data is nemo_u2.dataset.depth_0.data
+    assert np.allclose(nemo_t.dataset.depth_0[:, 0, 0], [5, 15, 25])
+    # The last column of u points has no t point to the east
+    assert np.allclose(nemo_u.dataset.depth_0[:, 0, :-1], np.array([5, 15, 25])[:, np.newaxis])
+    assert np.allclose(nemo_u.dataset.depth_0[:, :, -1], 0)
+
+
+def test_shared_wet_mask(fn_domain, empty_domain_cache, monkeypatch):
+    calls = []
+
+    def wet_mask(*args):
+        calls.append(args)
+        return wet_mask_lazy(*args)
+
+    wet_mask_lazy = gridded._wet_mask
+    monkeypatch.setattr(gridded, "_wet_mask", wet_mask)
+
+    # The wet mask is computed once for the domain and used by both grids
+    nemo_t = coast.Gridded(fn_domain=fn_domain, config=CONFIG_T, calculate_bathymetry=True)
+    nemo_w = coast.Gridded(fn_domain=fn_domain, config=CONFIG_W, calculate_bathymetry=True)
+    assert len(calls) == 1
+    assert np.allclose(nemo_t.dataset.bathymetry, 30)
+    assert np.allclose(nemo_w.dataset.bathymetry, 30)
+
+
+def test_calc_bathymetry(level_domain):
+    nemo = coast.Gridded()
+    nemo.grid_ref = "t-grid"
+    bathymetry, mask, time_mask = nemo.calc_bathymetry(level_domain)
+    assert np.array_equal(bathymetry.compute(), [[0, 10, 20], [0, 10, 20]])
+    assert mask is None
+    assert np.array_equal(time_mask[:, 0, :], [[0, 1, 1], [0, 0, 1]])
+
+    # The u-grid is wet where both neighbouring t-points are
+    nemo.grid_ref = "u-grid"
+    bathymetry, mask, _ = nemo.calc_bathymetry(level_domain)
+    assert np.array_equal(bathymetry.compute(), [[0, 10, 0], [0, 10, 0]])
+    assert np.array_equal(mask[:, 0, :], [[0, 1, 0], [0, 0, 0]])
+
+
+def test_calculate_vertical_mask(column_gridded):
+    Zd_mask, kmax, Ikmax = column_gridded.calculate_vertical_mask(15)
+    assert np.array_equal(Zd_mask[:, 0, :], [[0, 1, 1], [0, 0.5, 0.5], [0, 0, 0], [0, 0, 0]])
+    assert np.array_equal(kmax, [[0, 1, 1]])
+    assert np.array_equal(Ikmax[0], [4, 5])
+
+    # Columns shallower than Zmax are masked at the sea bed
+    Zd_mask, kmax, Ikmax = column_gridded.calculate_vertical_mask(25)
+    assert np.array_equal(Zd_mask[:, 0, :], [[0, 1, 1], [0, 1, 1], [0, 0, 0.5], [0, 0, 0]])
+    assert np.array_equal(kmax, [[0, 2, 2]])
+    assert np.array_equal(Ikmax[0], [8])
+
+    # Dask-backed domains give the same, lazily
+    column_gridded.dataset = column_gridded.dataset.chunk({"x_dim": 2})
+    Zd_mask_lazy, kmax_lazy, _ = column_gridded.calculate_vertical_mask(25)
+    assert np.array_equal(Zd_mask_lazy.compute(), Zd_mask)
+    assert np.array_equal(kmax_lazy.compute(), kmax)
+
+
+@pytest.mark.parametrize("Zmax", [0, -5])
+def test_calculate_vertical_mask_non_positive_zmax(column_gridded, Zmax):
+    with pytest.raises(ValueError):
+        column_gridded.calculate_vertical_mask(Zmax)
+
+
+def test_construct_density_lazy(ts_gridded):
+    ts_gridded.construct_density(CT_AS=True)
+    ts_gridded.construct_density(rhobar=True, CT_AS=True, pot_dens=True)
+    density = ts_gridded.dataset.density
+    density_bar = ts_gridded.dataset.density_bar
+    assert density.chunks is not None and density_bar.chunks is not None
+    assert density.dims == density_bar.dims == ("t_dim", "z_dim", "y_dim", "x_dim")
+
+    point = ts_gridded.dataset.isel(t_dim=1, y_dim=2, x_dim=3).compute()
+    pressure = gsw.p_from_z(-point.depth_0.values, point.latitude.values)
+    expected = gsw.rho(point.salinity.values, point.temperature.values, pressure)
+    assert np.allclose(density.isel(t_dim=1, y_dim=2, x_dim=3), expected)
+
+    # Depth mean T and S give the same potential density on every level
+    expected = gsw.rho(point.salinity.values.mean(), point.temperature.values.mean(), 0)
+    assert np.allclose(density_bar.isel(t_dim=1, y_dim=2, x_dim=3), expected)
+    assert np.isnan(density_bar.isel(y_dim=0, x_dim=0)).all()
+
+
+def test_get_e3_from_ssh(tmp_path, write_domain):
+    # Two 10 m levels and a land column, with the t-grid domain variables in the object
+    fn_domain = str(tmp_path / "domain_cfg.nc")
+    bottom_level = np.array([[0, 2, 2], [0, 2, 1]])
+    write_domain(fn_domain, n_z=2, n_y=2, n_x=3, bottom_level=bottom_level)
+    nemo_t = coast.Gridded()
+    nemo_t.filename_domain = fn_domain
+    nemo_t.dataset = xr.Dataset(
+        {
+            "ssh": (("t_dim", "y_dim", "x_dim"), np.full((2, 2, 3), 2.0)),
+            "e3_0": (("z_dim", "y_dim", "x_dim"), np.full((2, 2, 3), 10.0)),
+            "bottom_level": (("y_dim", "x_dim"), bottom_level),
+            "e1": (("y_dim", "x_dim"), np.full((2, 3), 1000.0)),
+            "e2": (("y_dim", "x_dim"), np.full((2, 3), 1000.0)),
+        }
+    )
+
+    e3t = coast.Gridded.get_e3_from_ssh(nemo_t)[0]
+    assert e3t.chunks is not None
+    # 2 m on a 20 m water column stretches each level by 10%, and by 20% in the one level column
+    assert np.allclose(e3t[:, :, 1, 1], 11) and np.allclose(e3t[:, :, 1, 2], [12, 10])
+    assert np.allclose(e3t[:, :, :, 0], 10)
+
+    e3u, e3w = coast.Gridded.get_e3_from_ssh(nemo_t, False, True, False, False, True)
+    # u points between wet t points get the mean change, the last column is unchanged
+    assert np.allclose(e3u[0, :, 0, 1], 11) and np.allclose(e3u[0, :, :, 2], 10)
+    assert np.allclose(e3w[0, :, 0, 1], 11)
+
+
+def test_get_e3_from_ssh_shared_domain(tmp_path, write_domain, empty_domain_cache, monkeypatch):
+    # u-grid variables come from the domain the object was created with, without opening the file again
+    fn_domain = str(tmp_path / "domain_cfg.nc")
+    write_domain(fn_domain, n_z=2, n_y=2, n_x=3, bottom_level=[[0, 2, 2], [0, 2, 1]])
+    nemo_t = coast.Gridded(fn_domain=fn_domain, config=CONFIG_T)
+    nemo_t.dataset["ssh"] = (("t_dim", "y_dim", "x_dim"), np.full((2, 2, 3), 2.0))
+
+    def open_dataset(*args, **kwargs):
+        raise AssertionError("The domain file was opened again")
+
+    monkeypatch.setattr(xr, "open_dataset", open_dataset)
+    e3u = coast.Gridded.get_e3_from_ssh(nemo_t, False, True)[0]
+    assert np.allclose(e3u[0, :, 0, 1], 11) and np.allclose(e3u[0, :, :, 2], 10)
+
+
+def test_get_e3_from_ssh_missing_domain():
+    nemo_t = coast.Gridded()
+    nemo_t.filename_domain = "missing_domain_cfg.nc"
+    nemo_t.dataset = xr.Dataset({"ssh": (("t_dim", "y_dim", "x_dim"), np.zeros((1, 2, 3)))})
+    with pytest.raises(OSError):
+        coast.Gridded.get_e3_from_ssh(nemo_t, False, True)
+
+
+def test_differentiate_horizontal(c_grids):
+    nemo_t, nemo_u, nemo_v = c_grids["t-grid"], c_grids["u-grid"], c_grids["v-grid"]
+    n_t, n_z, n_y, n_x = 2, 3, 4, 6
+    x_t = np.arange(n_x) * 1000.0
+    nemo_t.dataset["x4D"] = (("t_dim", "z_dim", "y_dim", "x_dim"), np.broadcast_to(x_t, (n_t, n_z, n_y, n_x)))
+    nemo_t.dataset["x4D"].attrs["units"] = "m"
+
+    nemo_u = nemo_t.differentiate("x4D", dim="x_dim", out_obj=nemo_u)
+    dxdx = nemo_u.dataset.x4D_dx
+    assert dxdx.dims == ("t_dim", "z_dim", "y_dim", "x_dim")
+    assert dxdx.attrs["units"] == "m/m"
+    # u points next to the land column are masked
+    assert np.allclose(dxdx[..., :-2], 1) and np.isnan(dxdx[..., -2:]).all()
+
+    # Chunked variables give the same result lazily, including across chunk boundaries
+    nemo_t.dataset = nemo_t.dataset.chunk({"x_dim": 2, "y_dim": 3})
+    nemo_u = nemo_t.differentiate("x4D", dim="x_dim", out_obj=nemo_u, out_var_str="lazy")
+    assert nemo_u.dataset.lazy.chunks is not None
+    xr.testing.assert_equal(nemo_u.dataset.lazy.compute().rename("x4D_dx"), dxdx)
+
+    # Back from the u-grid to the t-grid, y derivatives to the v-grid
+    nemo_t_2 = nemo_u.differentiate("x4D_dx", dim="x_dim", out_obj=nemo_t)
+    assert np.allclose(nemo_t_2.dataset.x4D_dx_dx[..., 1:-2], 0) and np.isnan(nemo_t_2.dataset.x4D_dx_dx[..., 0]).all()
+    nemo_v = nemo_t.differentiate("x4D", dim="y_dim", out_obj=nemo_v)
+    assert np.allclose(nemo_v.dataset.x4D_dy[:, :, :-1, :-1], 0)
+    assert nemo_t.differentiate("x4D", dim="t_dim") is None
+
+
+def test_find_j_i(rotated_gridded):
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(51, 54, 20)
+    lon = rng.uniform(-11, -1, 20)
+    for lat0, lon0 in zip(lat, lon):
+        assert rotated_gridded.find_j_i(lat=lat0, lon=lon0) == great_circle_argmin(rotated_gridded, lat0, lon0)
+
+    # Batched queries give the same points, and the index is built once for this grid
+    [j, i, _] = rotated_gridded.nearest_j_i(lat=lat, lon=lon)
+    assert [[jj, ii] for jj, ii in zip(j, i)] == [rotated_gridded.find_j_i(lat=a, lon=b) for a, b in zip(lat, lon)]
+    assert rotated_gridded._lookup_index() is rotated_gridded._lookup_index()
+    [j_list, i_list, _] = rotated_gridded.find_j_i_list(lat=lat, lon=lon)
+    assert np.array_equal(j_list, j) and np.array_equal(i_list, i)
+
+    # Domain datasets may have a leading time dimension
+    domain = rotated_gridded.dataset.expand_dims("t_dim")
+    assert rotated_gridded.find_j_i_domain(lat=lat[0], lon=lon[0], dataset_domain=domain) == [j[0], i[0]]
+
+
+def test_transect_and_subset_indices(rotated_gridded):
+    start, end = (51.0, -9.0), (53.0, -4.0)
+    j1, i1 = rotated_gridded.find_j_i(lat=start[0], lon=start[1])
+    j2, i2 = rotated_gridded.find_j_i(lat=end[0], lon=end[1])
+    jj, ii, line_length = rotated_gridded.transect_indices(start, end)
+    assert (jj[0], ii[0], jj[-1], ii[-1]) == (j1, i1, j2, i2)
+    assert line_length == max(abs(j2 - j1), abs(i2 - i1)) + 1
+    jj, ii = rotated_gridded.subset_indices(start=start, end=end)
+    assert jj == list(range(j1, j2 + 1)) and ii == list(range(i1, i2 + 1))
+
+
+@pytest.mark.parametrize("time_interp", ["nearest", "linear"])
+@pytest.mark.parametrize("chunk_size", [None, 2])
+def test_interpolate_no_points(model_array, time_interp, chunk_size):
+    no_times = np.array([], dtype="datetime64[ns]")
+    for array in [model_array, model_array.chunk({"t_dim": 2})]:
+        interpolated = coast.Gridded.interpolate_in_space_and_time(
+            array, [], [], no_times, time_interp=time_interp, chunk_size=chunk_size
+        )
+        assert interpolated.dims == ("interp_dim",) and interpolated.sizes["interp_dim"] == 0
+        assert interpolated.time.dtype == no_times.dtype
+
+
+def test_interpolate_one_point(model_array):
+    # A single point at a model time and grid point
+    one = coast.Gridded.interpolate_in_space_and_time(
+        model_array, [0.1], [52.4], model_array.time.values[1:2], "linear"
+    )
+    assert np.allclose(one, model_array[1, 2, 3])
@@ -0,0 +1,122 @@
+# Test with PyTest
+
+import os
+import coast
+import numpy as np
+import pytest
+import xarray as xr
+from coast._utils import obs_cache
+
+GESLA_HEADER = [
+    "# FORMAT VERSION 3.0",
+    "# SITE NAME Lowestoft",
+    "# COUNTRY gbr",
+    "# CONTRIBUTOR bodc",
+    "# LATITUDE 52.47",
+    "# LONGITUDE 1.75",
+    "# COORDINATE SYSTEM WGS84",
+    "# START DATE/TIME 2007/01/10 00:00:00",
+    "# END DATE/TIME 2007/01/10 00:45:00",
+    "# TIME ZONE HOURS 0",
+    "# DATUM INFORMATION Chart datum",
+    "# INSTRUMENT unknown",
+    "# PRECISION 0.001",
+    "# NULL VALUE -99.9999",
+] + ["#"] * 18
+GESLA_DATA = [
+    "2007/01/10 00:00:00     2.1750     1    1",
+    "2007/01/10 00:15:00     2.0920     1    1",
+    "2007/01/10 00:30:00   -99.9999     5    1",
+    "2007/01/10 00:45:00     1.8500     2    1",
+]
+
+
+@pytest.fixture
+def write_gesla():
+    def write(fn_gesla, n_lines=4):
+        with open(fn_gesla, "w") as file:
+            file.write("\n".join(GESLA_HEADER + GESLA_DATA[:n_lines]) + "\n")
+
+    return write
+
+
+@pytest.fixture
+def fn_en4(tmp_path):
+    fn_en4 = str(tmp_path / "en4.nc")
+    rng = np.random.default_rng(0)
+    n_prof, n_z = 4, 10
+    temperature = rng.uniform(5, 15, (n_prof, n_z))
+    xr.Dataset(
+        {
+            "temperature": (("id_dim", "z_dim"), temperature),
+            "potential_temperature": (("id_dim", "z_dim"), temperature),
+            "practical_salinity": (("id_dim", "z_dim"), rng.uniform(34, 36, (n_prof, n_z))),
+            "qc_flags_profiles": ("id_dim", np.zeros(n_prof, dtype=int)),
+            "qc_flags_levels": (("id_dim", "z_dim"), np.zeros((n_prof, n_z), dtype=int)),
+        },
+        coords={
+            "time": ("id_dim", np.arange(n_prof).astype("datetime64[h]").astype("datetime64[ns]")),
+            "longitude": ("id_dim", np.linspace(-5, 5, n_prof)),
+            "latitude": ("id_dim", np.linspace(50, 55, n_prof)),
+        },
+    ).to_netcdf(fn_en4)
+    return fn_en4
+
+
+def test_tidegauge_cache(tmp_path, write_gesla):
+    fn_gesla = str(tmp_path / "lowestoft")
+    write_gesla(fn_gesla)
+    uncached = coast.Tidegauge()
+    uncached.read_gesla(fn_gesla)
+
+    obs_cache.set_cache_dir(tmp_path / "cache")
+    try:
+        first = coast.Tidegauge()
+        first.read_gesla(fn_gesla)
+        second = coast.Tidegauge()
+        second.read_gesla(fn_gesla)
+        assert obs_cache.cache_info()["n_files"] == 1
+        xr.testing.assert_identical(second.dataset.load(), uncached.dataset)
+
+        # Different options or a changed source file give a new cache entry
+        subset = coast.Tidegauge()
+        subset.read_gesla(fn_gesla, date_end=np.datetime64("2007-01-10T00:15"))
+        assert subset.dataset.sizes["t_dim"] == 2
+        write_gesla(fn_gesla, n_lines=3)
+        os.utime(fn_gesla, ns=(0, 0))
+        changed = coast.Tidegauge()
+        changed.read_gesla(fn_gesla)
+        assert changed.dataset.sizes["t_dim"] == 3
+        assert obs_cache.cache_info()["n_files"] == 3
+
+        # Least recently used files are removed first
+        fn_cache = sorted(obs_cache._cached_files())[-1][2]
+        obs_cache.set_max_size(os.path.getsize(fn_cache))
+        assert [fn for _, _, fn in obs_cache._cached_files()] == [fn_cache]
+        obs_cache.clear_cache()
+        assert obs_cache.cache_info()["n_files"] == 0
+    finally:
+        obs_cache.set_cache_dir(None)
+        obs_cache.set_max_size(10 * 1024**3)
+
+
+def test_en4_cache(tmp_path, fn_en4):
+    obs_cache.set_cache_dir(tmp_path / "cache")
+    try:
+        profile = coast.Profile(dataset=xr.open_dataset(fn_en4))
+        first = profile.process_en4()
+        second = coast.Profile(dataset=xr.open_dataset(fn_en4)).process_en4()
+        assert obs_cache.cache_info()["n_files"] == 1
+        xr.testing.assert_identical(second.dataset.load(), first.dataset.load())
+
+        # A subset of the levels, or values changed in memory, are not read from the cache
+        subset = coast.Profile(dataset=xr.open_dataset(fn_en4).isel(z_dim=slice(0, 3))).process_en4()
+        assert subset.dataset.sizes["z_dim"] == 3
+        modified = xr.open_dataset(fn_en4)
+        modified["temperature"] = modified.temperature + 100
+        warm = coast.Profile(dataset=modified).process_en4()
+        assert np.allclose(warm.dataset.temperature, first.dataset.temperature + 100)
+        assert obs_cache.cache_info()["n_files"] == 3
+    finally:
+        obs_cache.clear_cache()
+        obs_cache.set_cache_dir(None)
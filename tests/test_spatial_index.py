@@ -0,0 +1,37 @@
+# Test with PyTest
+
+import numpy as np
+from coast._utils import spatial_index
+
+
+def test_spatial_index_cache():
+    lon, lat = np.meshgrid(np.linspace(-10, 10, 41), np.linspace(45, 60, 31))
+    mask = lat > 58
+    spatial_index.clear_cache()
+    built = spatial_index.get_spatial_index(lon, lat, mask=mask)
+
+    # The same grid and mask reuse the index, another mask builds a new one
+    assert spatial_index.get_spatial_index(lon.copy(), lat.copy(), mask=mask.copy()) is built
+    unmasked = spatial_index.get_spatial_index(lon, lat)
+    assert unmasked is not built and len(unmasked.valid_ind) == lon.size
+    info = spatial_index.cache_info()
+    assert (info["hits"], info["misses"], info["size"]) == (1, 2, 2)
+    new_lon, new_lat = np.array([-9.9, 0.1, 5.3]), np.array([45.2, 50.0, 59.9])
+    ind_y, _ = built.query(new_lon, new_lat)[1]
+    assert np.all(lat[ind_y, 0] <= 58)
+    spatial_index.clear_cache()
+
+
+def test_too_many_neighbours():
+    lon, lat = np.meshgrid(np.linspace(-1, 1, 3), np.linspace(50, 51, 2))
+    mask = np.zeros(lon.shape, dtype=bool)
+    mask[0] = True
+    for backend in ["kdtree", "balltree"]:
+        index = spatial_index.SpatialIndex(lon, lat, mask=mask, backend=backend)
+        dist, (ind_y, ind_x) = index.query([0.1], [50.9], k=3)
+        assert np.all(ind_y == 1) and np.all(np.isfinite(dist))
+        try:
+            index.query([0.1], [50.9], k=4)
+            assert False, "no error for more neighbours than unmasked points"
+        except ValueError:
+            pass
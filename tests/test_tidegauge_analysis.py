@@ -0,0 +1,120 @@
+# Test with PyTest
+
+import coast
+import numpy as np
+import pandas as pd
+import pytest
+import utide as ut
+import xarray as xr
+from coast._utils import crps_util, harmonic_util
+
+
+@pytest.fixture
+def records():
+    # Three 30 day hourly records of M2 and S2 tides with a little noise, on one time axis
+    time = pd.date_range("2010-01-01", periods=30 * 24, freq="1h").values
+    hours = np.arange(len(time))
+    rng = np.random.default_rng(0)
+    values = np.array(
+        [
+            amp * np.cos(2 * np.pi * hours / 12.42)
+            + 0.3 * np.cos(2 * np.pi * hours / 12)
+            + rng.normal(0, 0.05, len(time))
+            for amp in np.arange(1, 4)
+        ]
+    )
+    return time, values
+
+
+@pytest.fixture
+def model_ssh():
+    # Hourly model sea surface height, with land in one corner
+    rng = np.random.default_rng(0)
+    longitude, latitude = np.meshgrid(np.linspace(-5, 0, 30), np.linspace(50, 54, 40))
+    ssh = rng.normal(0, 1, (24, 40, 30))
+    ssh[:, :8, :8] = np.nan
+    return xr.DataArray(
+        ssh,
+        dims=("t_dim", "y_dim", "x_dim"),
+        coords={
+            "longitude": (("y_dim", "x_dim"), longitude),
+            "latitude": (("y_dim", "x_dim"), latitude),
+            "time": ("t_dim", pd.date_range("2020-01-01", periods=24, freq="1h")),
+        },
+    )
+
+
+@pytest.fixture
+def gauges():
+    # Gauges in the sea, next to land, on land and outside of the model domain
+    rng = np.random.default_rng(1)
+    return xr.DataArray(
+        rng.normal(0, 1, (4, 90)),
+        dims=("id_dim", "t_dim"),
+        coords={
+            "time": ("t_dim", pd.date_range("2020-01-01", periods=90, freq="15min")),
+            "longitude": ("id_dim", [-2.5, -3.4, -4.6, -9]),
+            "latitude": ("id_dim", [52, 50.5, 50.2, 52]),
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "opts",
+    [
+        dict(constit=["M2", "S2"]),
+        dict(constit="auto"),
+        dict(constit=["M2", "S2"], nodal=False, trend=False, white=True),
+        dict(constit=["M2", "S2"], conf_int="none"),
+    ],
+)
+def test_solve_group_matches_utide(records, opts):
+    # The batched solver uses utide internals. Fail here, rather than falling back quietly, if they change.
+    assert harmonic_util._batch_available
+    time, values = records
+    opts = dict(opts, verbose=False)
+    batched = harmonic_util._solve_group(time, values, 52.0, opts)
+    for record, solution in zip(values, batched):
+        expected = ut.solve(time, record, lat=52.0, **opts)
+        assert sorted(solution) == sorted(expected)
+        for name in set(expected) - {"aux", "diagn", "weights"}:
+            if np.asarray(expected[name]).dtype.kind in "fc":
+                assert np.allclose(solution[name], expected[name], equal_nan=True), name
+            else:
+                assert np.array_equal(solution[name], expected[name]), name
+
+
+def test_solve_stations_fallback(records, monkeypatch):
+    time, values = records
+    opts = dict(constit=["M2", "S2"], verbose=False)
+    expected = [ut.solve(time, record, lat=52.0, **opts).A for record in values]
+    batched = harmonic_util.solve_stations(time, values, 52.0, opts)
+    assert np.allclose([solution.A for solution in batched], expected)
+
+    # If the utide internals have changed, each record is solved with utide.solve()
+    def changed(*args, **kwargs):
+        raise TypeError("unexpected keyword argument")
+
+    monkeypatch.setattr(harmonic_util, "_slvinit", changed)
+    fallback = harmonic_util.solve_stations(time, values, 52.0, opts)
+    assert np.allclose([solution.A for solution in fallback], expected)
+    monkeypatch.setattr(harmonic_util, "_batch_available", False)
+    unbatched = harmonic_util.solve_stations(time, values, 52.0, opts)
+    assert np.allclose([solution.A for solution in unbatched], expected)
+
+
+def test_tidegauge_crps_matches_single_stations(model_ssh, gauges):
+    crps = coast.TidegaugeAnalysis.crps(gauges, model_ssh, nh_radius=30, n_workers=2)
+    for ii in range(4):
+        crps_ii, n_model_pts, _ = crps_util.crps_sonf_fixed(
+            model_ssh,
+            gauges.longitude.values[ii],
+            gauges.latitude.values[ii],
+            gauges.values[ii],
+            gauges.time.values,
+            30,
+            "linear",
+        )
+        assert np.allclose(crps.dataset.crps[ii], crps_ii, equal_nan=True)
+        assert np.array_equal(crps.dataset.crps_N[ii], n_model_pts, equal_nan=True)
+    assert np.all(np.isfinite(crps.dataset.crps[:2])) and np.all(np.isnan(crps.dataset.crps[2:]))
@@ -0,0 +1,94 @@
+# Test with PyTest
+
+import io
+
+import coast
+import numpy as np
+import pandas as pd
+from coast._utils import tidegauge_parser
+
+BODC_HEADER = """Port:              P234
+Site:              Liverpool, Gladstone Dock
+Latitude:          53.44969
+Longitude:         -3.01800
+Start Date:        01AUG2020-00.00.00
+End Date:          31AUG2020-23.45.00
+Contributor:       National Oceanography Centre, Liverpool
+Datum information: The data refer to Admiralty Chart Datum (ACD)
+Parameter code:    ASLVBG02 = Surface elevation (unspecified datum)
+  Cycle    Date      Time    ASLVBG02   Residual
+ Number yyyy mm dd hh mi ssf         f          f
+"""
+
+
+def test_read_columns_fixed_width_and_ragged(tmp_path):
+    lines = ["2007/01/10 00:00:00     2.1750     1    1", "2007/01/10 00:15:00   -99.9999     5    1"]
+    fn_fixed = tmp_path / "fixed.txt"
+    fn_fixed.write_text("# header\n" + "\n".join(lines) + "\n")
+    fn_ragged = tmp_path / "ragged.txt"
+    fn_ragged.write_text("# header\n" + "\n".join(line.replace("     ", " ") for line in lines) + "\n\n")
+
+    fixed = tidegauge_parser.read_columns(fn_fixed, skiprows=1)
+    ragged = tidegauge_parser.read_columns(fn_ragged, skiprows=1)
+    assert len(fixed) == len(ragged) == 5
+    assert np.array_equal(fixed[2].astype(float), [2.175, -99.9999])
+    for col_fixed, col_ragged in zip(fixed, ragged):
+        assert np.array_equal(np.char.strip(col_fixed), col_ragged)
+
+
+def test_read_columns_end_key(tmp_path, monkeypatch):
+    times = pd.date_range("2007-01-10", periods=2000, freq="15min")
+    lines = [f"{time:%Y/%m/%d %H:%M:%S}  {i:9.4f}     1    1" for i, time in enumerate(times)]
+    content = ("# header\n" + "\n".join(lines) + "\n").encode()
+    fn = tmp_path / "gesla.txt"
+    fn.write_bytes(content)
+    full = tidegauge_parser.read_columns(fn, skiprows=1)
+
+    for end in ["2007/01/10 00:00:00", "2007/01/10 03:20:00", "2007/01/11 12:07:30", "2007/03/01 00:00:00"]:
+        keep = times <= pd.Timestamp(end)
+        for block_size in [7, 100, 4096, None]:
+            monkeypatch.setattr(tidegauge_parser, "_read_block_size", block_size or 1 << 24)
+            bounded = tidegauge_parser.read_columns(fn, skiprows=1, end_key=end.encode())
+            for col_bounded, col_full in zip(bounded, full):
+                assert np.array_equal(np.char.strip(col_bounded), np.char.strip(col_full[keep]))
+
+    # Reading stops soon after the end key
+    fid = io.BytesIO(content)
+    buffer = tidegauge_parser._read_until(fid, b"2007/01/10 03:20:00", block_size=1000)
+    assert buffer.endswith(lines[13].encode() + b"\n")
+    assert fid.tell() <= len(buffer) + 2000
+
+
+def test_parse_datetimes():
+    times = pd.date_range("1999-12-31 22:00", periods=500, freq="37min")
+    dates = times.strftime("%d/%m/%Y").values.astype(str)
+    clock = times.strftime("%H:%M").values.astype(str)
+    parsed = tidegauge_parser.parse_datetimes(dates, clock, "%d/%m/%Y", "%H:%M")
+    assert np.array_equal(parsed, times.values)
+
+    # Values that are not zero padded are passed to pandas
+    parsed = tidegauge_parser.parse_datetimes(np.array(["2020/2/29"]), np.array(["7:05:00"]))
+    assert parsed[0] == np.datetime64("2020-02-29T07:05:00")
+
+
+def test_split_flags():
+    values, flags = tidegauge_parser.split_flags(np.array([b"  5.354M", b" -4.133 ", b"  0.100N"]))
+    assert np.array_equal(values, [5.354, -4.133, 0.1])
+    assert np.array_equal(flags, ["M", "", "N"])
+
+
+def test_read_bodc_flags(tmp_path):
+    fn_bodc = tmp_path / "bodc.txt"
+    data = [
+        "     1) 2020/08/01 00:00:00      5.354M      0.265M",
+        "     2) 2020/08/01 00:15:00      5.016       0.243M",
+        "     3) 2020/08/01 00:30:00      4.704       0.241 ",
+    ]
+    fn_bodc.write_text(BODC_HEADER + "\n".join(data) + "\n")
+
+    tidegauge = coast.Tidegauge()
+    tidegauge.read_bodc(str(fn_bodc), date_start=np.datetime64("2020-08-01T00:15"))
+    assert np.array_equal(tidegauge.dataset.ssh.values[0], [5.016, 4.704])
+    assert np.array_equal(tidegauge.dataset.qc_flags.values[0], ["M", ""])
+    assert tidegauge.dataset.time.values[0] == np.datetime64("2020-08-01T00:15")
+    assert tidegauge.dataset.latitude.values[0] == 53.44969
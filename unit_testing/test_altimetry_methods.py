@@ -48,6 +48,25 @@ class test_altimetry_methods(unittest.TestCase):
             check1 = False in np.isnan(altimetry_nwes.dataset.interp_ssh)
             self.assertTrue(check1, "check1")
 
+        with self.subTest("Point-wise space and time interpolation"):
+            obs_lon = altimetry_nwes.dataset.longitude.values
+            obs_lat = altimetry_nwes.dataset.latitude.values
+            obs_time = altimetry_nwes.dataset.time.values
+            pointwise = sci.interpolate_in_space_and_time(
+                sci.dataset.ssh, obs_lon, obs_lat, obs_time, time_interp="linear", chunk_size=10
+            )
+
+            # Compare with the diagonal of separate space then time interpolation
+            interpolated = sci.interpolate_in_space(sci.dataset.ssh, obs_lon, obs_lat)
+            interpolated = sci.interpolate_in_time(interpolated, obs_time, interp_method="linear")
+            diag_ind = xr.DataArray(np.arange(0, len(obs_time)))
+            diagonal = interpolated.isel(interp_dim=diag_ind, time=diag_ind)
+
+            check1 = pointwise.sizes["interp_dim"] == len(obs_time)
+            check2 = np.allclose(pointwise.values, diagonal.values, equal_nan=True)
+            self.assertTrue(check1, "check1")
+            self.assertTrue(check2, "check2")
+
         with self.subTest("Calculate CRPS for altimetry"):
             crps = altimetry_nwes.crps(sci, "ssh", "ocean_tide_standard_name")
 
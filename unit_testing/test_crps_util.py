@@ -36,3 +36,31 @@ class test_crps_util(unittest.TestCase):
         check1 = np.isclose(crps, 0.0, rtol=0.0001)
 
         self.assertTrue(check1, "check1")
+
+    def test_crps_empirical_ragged(self):
+        samples = [np.array([3, 4, 5, 5, 6, 7, 8, 2]), np.array([np.nan, 1.5, 0.5]), np.array([np.nan])]
+        obs = np.array([5, 1, 2])
+        offsets = np.concatenate(([0], np.cumsum([len(sample) for sample in samples])))
+
+        crps = cu.crps_empirical_ragged(np.concatenate(samples), offsets, obs)
+
+        # Check CRPS matches the integral over each sample, with NaN for an empty sample
+        check1 = np.allclose(crps[:2], [cu.crps_empirical_loop(samples[ii], obs[ii]) for ii in range(2)])
+        check2 = np.isnan(crps[2])
+
+        self.assertTrue(check1, "check1")
+        self.assertTrue(check2, "check2")
+
+    def test_crps_empirical_batch(self):
+        sample = np.array([[3, 4, 5, 5, 6, 7, 8, 2], [1.5, 0.5, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan]])
+        obs = np.array([5, 1])
+
+        crps = cu.crps_empirical_batch(sample, obs)
+        crps_chunked = cu.crps_empirical_batch(sample, obs, chunk_size=1).compute()
+
+        # Check each row matches the CRPS integral of its sample, with or without dask
+        check1 = np.allclose(crps, [cu.crps_empirical_loop(sample[ii], obs[ii]) for ii in range(2)])
+        check2 = np.allclose(crps_chunked, crps)
+
+        self.assertTrue(check1, "check1")
+        self.assertTrue(check2, "check2")
@@ -59,3 +59,99 @@ class test_general_utils(unittest.TestCase):
 
         self.assertTrue(check1, msg="check1")
         self.assertTrue(check2, msg="check2")
+
+    def test_time_matching_indices(self):
+        mod_time = np.datetime64("2020-01-01") + np.arange(0, 48) * np.timedelta64(1, "h")
+        new_time = np.datetime64("2019-12-31T23") + np.arange(0, 60 * 50, 7) * np.timedelta64(1, "m")
+
+        with self.subTest("Nearest time matches argmin"):
+            ind0, ind1, weight = general_utils.time_matching_indices(mod_time, new_time, method="nearest")
+            ind_brute = [np.argmin(np.abs(mod_time - tt)) for tt in new_time]
+
+            check1 = np.array_equal(ind0, ind_brute)
+            check2 = np.array_equal(ind0, ind1) and np.all(weight == 0)
+            self.assertTrue(check1, msg="check1")
+            self.assertTrue(check2, msg="check2")
+
+        with self.subTest("Previous and next times"):
+            in_range = np.logical_and(new_time >= mod_time[0], new_time <= mod_time[-1])
+            ind_prev, _, _ = general_utils.time_matching_indices(mod_time, new_time, method="previous")
+            ind_next, _, _ = general_utils.time_matching_indices(mod_time, new_time, method="next")
+
+            check1 = np.all(mod_time[ind_prev][in_range] <= new_time[in_range])
+            check2 = np.all(mod_time[ind_next][in_range] >= new_time[in_range])
+            self.assertTrue(check1, msg="check1")
+            self.assertTrue(check2, msg="check2")
+
+        with self.subTest("Linear weights match np.interp"):
+            mod_values = np.sin(np.arange(0, 48) / 5)
+            ind0, ind1, weight = general_utils.time_matching_indices(
+                mod_time, new_time, method="linear", extrapolate=False
+            )
+            interpolated = (1 - weight) * mod_values[ind0] + weight * mod_values[ind1]
+            mod_hours = (mod_time - mod_time[0]) / np.timedelta64(1, "h")
+            new_hours = (new_time - mod_time[0]) / np.timedelta64(1, "h")
+            expected = np.interp(new_hours, mod_hours, mod_values, left=np.nan, right=np.nan)
+
+            check1 = np.allclose(interpolated, expected, equal_nan=True)
+            self.assertTrue(check1, msg="check1")
+
+    def test_spatial_index_cache(self):
+        lon, lat = np.meshgrid(np.linspace(-10, 10, 41), np.linspace(45, 60, 31))
+        mask = lat > 58
+        new_lon = np.array([-9.9, 0.1, 5.3, 9.9])
+        new_lat = np.array([45.2, 50.0, 59.9, 55.5])
+        coast.spatial_index.clear_cache()
+
+        with self.subTest("Cached index matches a fresh BallTree"):
+            ind_x, ind_y = general_utils.nearest_indices_2d(lon, lat, new_lon, new_lat, mask=mask)
+            dist = (lon[~mask][:, None] - new_lon) ** 2 + (lat[~mask][:, None] - new_lat) ** 2
+            nearest = np.argmin(dist, axis=0)
+
+            check1 = np.array_equal(lon[ind_y, ind_x], lon[~mask][nearest])
+            check2 = np.array_equal(lat[ind_y, ind_x], lat[~mask][nearest])
+            check3 = not np.any(mask[ind_y, ind_x])
+            self.assertTrue(check1, msg="check1")
+            self.assertTrue(check2, msg="check2")
+            self.assertTrue(check3, msg="check3")
+
+        with self.subTest("Index is reused for the same grid and mask"):
+            general_utils.nearest_indices_2d(lon, lat, new_lon + 0.1, new_lat, mask=mask)
+            general_utils.nearest_indices_2d(lon, lat, new_lon, new_lat)
+            info = coast.spatial_index.cache_info()
+
+            check1 = info["hits"] == 1 and info["misses"] == 2
+            check2 = info["size"] == 2
+            self.assertTrue(check1, msg="check1")
+            self.assertTrue(check2, msg="check2")
+
+        with self.subTest("Least recently used index is evicted"):
+            coast.spatial_index.set_cache_size(1)
+            check1 = coast.spatial_index.cache_info()["size"] == 1
+            coast.spatial_index.set_cache_size(4)
+            self.assertTrue(check1, msg="check1")
+
+    def test_neighbour_backends(self):
+        rng = np.random.default_rng(0)
+        lon, lat = np.meshgrid(np.linspace(-10, 10, 81), np.linspace(45, 60, 61))
+        lon = lon + rng.normal(0, 0.01, lon.shape)
+        new_lon = rng.uniform(-9, 9, 50)
+        new_lat = rng.uniform(46, 59, 50)
+        kdtree = coast.spatial_index.SpatialIndex(lon, lat, backend="kdtree")
+        balltree = coast.spatial_index.SpatialIndex(lon, lat, backend="balltree")
+
+        with self.subTest("KD-tree and BallTree give the same k nearest neighbours"):
+            dist_kd, ind_kd = kdtree.query(new_lon, new_lat, k=3)
+            dist_bt, ind_bt = balltree.query(new_lon, new_lat, k=3)
+
+            check1 = np.array_equal(ind_kd[0], ind_bt[0]) and np.array_equal(ind_kd[1], ind_bt[1])
+            check2 = np.allclose(dist_kd, dist_bt)
+            self.assertTrue(check1, msg="check1")
+            self.assertTrue(check2, msg="check2")
+
+        with self.subTest("Radius query matches haversine distances"):
+            ind_x, ind_y = general_utils.subset_indices_by_distance_balltree(lon, lat, 0.5, 50.5, 30)
+            dist = general_utils.calculate_haversine_distance(0.5, 50.5, lon, lat)
+
+            check1 = np.array_equal(np.sort(np.ravel_multi_index((ind_x, ind_y), lon.shape)), np.flatnonzero(dist < 30))
+            self.assertTrue(check1, msg="check1")
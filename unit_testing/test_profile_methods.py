@@ -6,6 +6,7 @@
 import coast
 import unittest
 import numpy as np
+import xarray as xr
 import matplotlib.pyplot as plt
 import unit_test_files as files
 import datetime
@@ -61,6 +62,12 @@ class test_profile_methods(unittest.TestCase):
             self.assertTrue(check2, "check2")
             self.assertTrue(check3, "check3")
 
+        with self.subTest("Gridded obs_operator streaming"):
+            nemo_profiles_streamed = processed.obs_operator(nemo_t, streaming=True, scheduler="threads", n_workers=2)
+
+            check1 = nemo_profiles_streamed.dataset.identical(nemo_profiles.dataset)
+            self.assertTrue(check1, "check1")
+
         with self.subTest("Vertical interpolation"):
             pa = coast.ProfileAnalysis()
             reference_depths = np.arange(0, 500, 2)
@@ -148,3 +155,127 @@ class test_profile_methods(unittest.TestCase):
             self.assertTrue(check1, "check1")
             self.assertTrue(check2, "check2")
             self.assertTrue(check3, "check3")
+
+    def test_interpolate_vertical_batched(self):
+        # Synthetic profiles with NaNs, unsorted depths and empty profiles
+        rng = np.random.default_rng(0)
+        n_prof, n_z = 50, 20
+        depth = np.sort(rng.uniform(0, 200, (n_prof, n_z)), axis=1)
+        depth[rng.random((n_prof, n_z)) < 0.1] = np.nan
+        depth[1] = depth[1][::-1]
+        temperature = rng.normal(10, 2, (n_prof, n_z))
+        temperature[rng.random((n_prof, n_z)) < 0.2] = np.nan
+        temperature[2] = np.nan
+        dataset = xr.Dataset(
+            {"temperature": (["id_dim", "z_dim"], temperature)},
+            coords={
+                "depth": (["id_dim", "z_dim"], depth),
+                "longitude": (["id_dim"], rng.random(n_prof)),
+                "latitude": (["id_dim"], rng.random(n_prof)),
+            },
+        )
+        profile = coast.Profile(dataset=dataset)
+        pa = coast.ProfileAnalysis()
+        reference_depths = np.arange(-5, 210, 3.0)
+
+        for method in ["linear", "nearest"]:
+            with self.subTest(f"Batched {method} matches profile loop"):
+                batched = pa.interpolate_vertical(profile, reference_depths, interp_method=method)
+                looped = pa._interpolate_vertical_loop(profile, reference_depths, interp_method=method)
+
+                check1 = np.array_equal(
+                    batched.dataset.temperature.values, looped.dataset.temperature.values, equal_nan=True
+                )
+                check2 = np.array_equal(batched.dataset.depth.values, looped.dataset.depth.values)
+                self.assertTrue(check1, "check1")
+                self.assertTrue(check2, "check2")
+
+        with self.subTest("Batched interpolation with dask"):
+            chunked = coast.Profile(dataset=dataset.chunk({"id_dim": 10}))
+            lazy = pa.interpolate_vertical(chunked, reference_depths)
+            eager = pa.interpolate_vertical(profile, reference_depths)
+
+            check1 = lazy.dataset.temperature.chunks is not None
+            check2 = np.array_equal(lazy.dataset.temperature.values, eager.dataset.temperature.values, equal_nan=True)
+            self.assertTrue(check1, "check1")
+            self.assertTrue(check2, "check2")
+
+    def test_decode_en4_qc_levels(self):
+        profile = coast.Profile(dataset=xr.Dataset(attrs={"history": "EN.4.2.2"}))
+        int_tem, int_sal, int_both = profile.calculate_en4_qc_flags_levels()
+        tem_reasons, sal_reasons = profile._en4_qc_reasons()
+        unflagged = [0, 1, 2, 3, 1 << 8, 1 | (1 << 4), 2 | (1 << 8), 1 | (1 << 8) | (1 << 9)]
+        qc_lev = xr.DataArray(np.array(int_tem + int_sal + int_both + unflagged, dtype=np.int64), dims=["z_dim"])
+        reject_tem, reject_sal = profile._decode_en4_qc_levels(qc_lev, tem_reasons, sal_reasons)
+
+        with self.subTest("Bitwise decoding matches QC integer lists"):
+            expected_tem = np.isin(qc_lev, int_tem + int_both)
+            expected_sal = np.isin(qc_lev, int_sal + int_both)
+
+            check1 = np.array_equal(reject_tem.values, expected_tem)
+            check2 = np.array_equal(reject_sal.values, expected_sal)
+            check3 = not np.any(reject_tem.values[-len(unflagged) :])
+            self.assertTrue(check1, "check1")
+            self.assertTrue(check2, "check2")
+            self.assertTrue(check3, "check3")
+
+        with self.subTest("Lazy decoding with dask"):
+            lazy_tem, _ = profile._decode_en4_qc_levels(qc_lev.chunk({"z_dim": 20}), tem_reasons, sal_reasons)
+
+            check1 = lazy_tem.chunks is not None
+            check2 = np.array_equal(lazy_tem.values, reject_tem.values)
+            self.assertTrue(check1, "check1")
+            self.assertTrue(check2, "check2")
+
+    def test_average_into_grid_boxes(self):
+        rng = np.random.default_rng(0)
+        n_prof = 2000
+        dataset = xr.Dataset(
+            {"temperature": (["id_dim"], rng.normal(10, 2, n_prof))},
+            coords={
+                "longitude": (["id_dim"], rng.uniform(-6, 6, n_prof)),
+                "latitude": (["id_dim"], rng.uniform(48, 56, n_prof)),
+                "time": (
+                    ["id_dim"],
+                    np.datetime64("2010-01-01") + rng.integers(0, 365, n_prof).astype("timedelta64[D]"),
+                ),
+            },
+        )
+        dataset["temperature"][::9] = np.nan
+        profile = coast.Profile(dataset=dataset)
+        pa = coast.ProfileAnalysis()
+        grid_lon = np.arange(-5, 5.1, 2.5)
+        grid_lat = np.arange(49, 55.1, 2)
+        gridded = pa.average_into_grid_boxes(profile, grid_lon, grid_lat).dataset
+
+        with self.subTest("Box statistics match brute force"):
+            mean = np.full((len(grid_lat) - 1, len(grid_lon) - 1), np.nan)
+            std = np.full(mean.shape, np.nan)
+            count = np.zeros(mean.shape)
+            for rr in range(len(grid_lat) - 1):
+                for cc in range(len(grid_lon) - 1):
+                    in_box = (
+                        (dataset.longitude >= grid_lon[cc])
+                        & (dataset.longitude < grid_lon[cc + 1])
+                        & (dataset.latitude >= grid_lat[rr])
+                        & (dataset.latitude < grid_lat[rr + 1])
+                    )
+                    count[rr, cc] = np.sum(in_box)
+                    mean[rr, cc] = dataset.temperature[in_box].mean()
+                    std[rr, cc] = dataset.temperature[in_box].std()
+
+            check1 = np.allclose(gridded.temperature, mean)
+            check2 = np.allclose(gridded.temperature_std, std)
+            check3 = np.array_equal(gridded.grid_N, count)
+            self.assertTrue(check1, "check1")
+            self.assertTrue(check2, "check2")
+            self.assertTrue(check3, "check3")
+
+        with self.subTest("Several seasons and chunks in one pass"):
+            seasonal = pa.average_into_grid_boxes(profile, grid_lon, grid_lat, season=["DJF", "JJA"], chunk_size=300)
+            jja = pa.average_into_grid_boxes(profile, grid_lon, grid_lat, season="JJA")
+
+            check1 = np.allclose(seasonal.dataset.temperature_JJA, jja.dataset.temperature, equal_nan=True)
+            check2 = np.array_equal(seasonal.dataset.grid_N_JJA, jja.dataset.grid_N)
+            self.assertTrue(check1, "check1")
+            self.assertTrue(check2, "check2")
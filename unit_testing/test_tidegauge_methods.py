@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 import unit_test_files as files
 import datetime
 import pandas as pd
+import xarray as xr
 
 
 class test_tidegauge_analysis(unittest.TestCase):
@@ -80,6 +81,18 @@ class test_tidegauge_analysis(unittest.TestCase):
             self.assertTrue("ntr" in ntr.dataset)
             self.assertTrue(np.isclose(ntr.dataset.ntr[0, 0], 0.00129846), "check1")
 
+        with self.subTest("Batched and parallel analysis of several gauges"):
+            ssh = xr.concat([lowestoft.dataset.ssh, lowestoft.dataset.ssh * 2, lowestoft.dataset.ssh], dim="id_dim")
+            ha_batch = tganalysis.harmonic_analysis_utide(ssh, min_datapoints=10)
+            ha_parallel = tganalysis.harmonic_analysis_utide(ssh, min_datapoints=10, n_workers=2, batch=False)
+            amplitudes = [np.isclose(ha_batch[ii].A[0], ha_parallel[ii].A[0]) for ii in range(3)]
+            self.assertTrue(all(amplitudes) and np.isclose(ha_batch[1].A[0], 2 * ha[0].A[0]), "check1")
+            recon_parallel = tganalysis.reconstruct_tide_utide(ssh, ha_batch, n_workers=2)
+            recon_serial = tganalysis.reconstruct_tide_utide(ssh, ha_parallel)
+            self.assertTrue(
+                np.allclose(recon_parallel.dataset.reconstructed, recon_serial.dataset.reconstructed), "check2"
+            )
+
     def test_threshold_statistics(self):
         tganalysis = coast.TidegaugeAnalysis()
         date0 = datetime.datetime(2007, 1, 10)
@@ -97,6 +110,13 @@ class test_tidegauge_analysis(unittest.TestCase):
         self.assertTrue(check2, "check2")
         self.assertTrue(check3, "check3")
 
+        # Daily maxima are grouped by day of month
+        daily_max = lowestoft.dataset.ssh[0].groupby("time.day").max()
+        check4 = np.array_equal(thresh.dailymax_count_ssh[0], [np.sum(daily_max >= tt) for tt in thresh.threshold])
+        thresh_parallel = tganalysis.threshold_statistics(lowestoft.dataset, n_workers=2)
+        self.assertTrue(check4, "check4")
+        self.assertTrue(thresh_parallel.equals(thresh), "check5")
+
     def test_difference(self):
         tganalysis = coast.TidegaugeAnalysis()
         date0 = datetime.datetime(2007, 1, 10)
@@ -248,6 +268,19 @@ class test_tidegauge_methods(unittest.TestCase):
             self.assertTrue(check1, "check1")
             self.assertTrue(check2, "check2")
 
+        with self.subTest("Load multiple gauge in parallel and stack"):
+            stacked = coast.Tidegauge()
+            stacked.read_gesla(files.fn_multiple_tidegauge, date_start=date0, date_end=date1, n_workers=2, stack=True)
+            stacked_ssh = stacked.dataset.ssh.isel(id_dim=1).swap_dims({"t_dim": "time"})
+            stacked_ssh = stacked_ssh.sel(time=lowestoft.dataset.time.values)
+
+            # TEST: Check both gauges are stacked and lowestoft matches
+            check1 = stacked.dataset.dims["id_dim"] == 2
+            check2 = np.array_equal(stacked_ssh.values, lowestoft.dataset.ssh.values[0], equal_nan=True)
+
+            self.assertTrue(check1, "check1")
+            self.assertTrue(check2, "check2")
+
         with self.subTest("Plot multiple gauge"):
             f, a = coast.Tidegauge.plot_on_map_multiple(tg_list)
             f.savefig(files.dn_fig + "tidegauge_multiple_map.png")
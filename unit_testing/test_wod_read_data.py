@@ -36,3 +36,11 @@ class test_wod_read_data(unittest.TestCase):
 
             self.assertTrue(check1, "check1")
             self.assertTrue(check2, "check2")
+
+        with self.subTest("Lazy reshape"):
+            wod_profile_lazy = coast.Profile.reshape_2d(wod_profile_1D, my_list, chunks=10)
+
+            check1 = wod_profile_lazy.dataset.depth.chunks is not None
+            check2 = wod_profile_lazy.dataset.load().identical(wod_profile.dataset)
+            self.assertTrue(check1, "check1")
+            self.assertTrue(check2, "check2")